@@ -69,6 +69,9 @@ def ensure_ai_params_table():
             "win_rate": "REAL DEFAULT 0",
             "profit_rate": "REAL DEFAULT 0",
             "trade_count": "INTEGER DEFAULT 0",
+            "max_drawdown": "REAL DEFAULT 0",
+            "sharpe": "REAL DEFAULT 0",
+            "backtest_at": "TEXT",
         }
         cur.execute("PRAGMA table_info(ai_params)")
         existing = set([x[1] for x in cur.fetchall()])
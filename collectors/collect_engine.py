@@ -0,0 +1,198 @@
+# collectors/collect_engine.py
+"""
+并发采集引擎：每个 OKX 端点一个有界线程池 + 令牌桶限频。
+
+- 端点之间互不抢占线程（慢端点如多空比不会拖住K线）
+- 令牌桶按 OKX 公共接口限频（次/2秒，按 IP）配置，可用环境变量覆盖：
+    COLLECT_RATE_CANDLES=40   COLLECT_CONC_CANDLES=8
+- 网络请求在线程池里并发，结果通过 results() 交回调用方线程统一入库，
+  这样 SQLite 仍然只有一个写入方，不会出现 database is locked
+- 每轮结束 finish_round() 返回吞吐统计
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# 端点 -> (每窗口请求数, 窗口秒数, 并发数)
+OKX_ENDPOINT_LIMITS = {
+    "candles":     (40, 2.0, 8),    # /market/candles
+    "books":       (40, 2.0, 4),    # /market/books
+    "trades":      (100, 2.0, 4),   # /market/trades
+    "funding":     (20, 2.0, 2),    # /public/funding-rate
+    "lsr":         (5, 2.0, 1),     # /rubik/stat/contracts/long-short-account-ratio
+    "liquidation": (40, 2.0, 2),    # /public/liquidation-orders
+    "instruments": (20, 2.0, 1),    # /public/instruments
+}
+DEFAULT_LIMIT = (10, 2.0, 2)
+# 令牌桶容量占窗口配额的比例，留一点余量避免撞上 50011
+SAFETY_RATIO = float(os.environ.get("COLLECT_SAFETY", "0.9"))
+
+
+class TokenBucket:
+    """线程安全令牌桶：rate 个令牌 / per 秒，容量 = rate。"""
+
+    def __init__(self, rate, per=1.0):
+        self.capacity = max(1.0, float(rate))
+        self.fill_rate = self.capacity / float(per)
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, n=1.0):
+        """阻塞直到拿到 n 个令牌，返回等待秒数。"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.fill_rate)
+                self.stamp = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return waited
+                need = (n - self.tokens) / self.fill_rate
+            time.sleep(need)
+            waited += need
+
+
+class EndpointStats:
+    __slots__ = ("calls", "fails", "rows", "latency", "throttle")
+
+    def __init__(self):
+        self.calls = 0
+        self.fails = 0
+        self.rows = 0
+        self.latency = 0.0
+        self.throttle = 0.0
+
+
+class CollectEngine:
+    def __init__(self, limits=None, retries=2):
+        self.limits = dict(OKX_ENDPOINT_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self.retries = retries
+        self.buckets = {}
+        self.pools = {}
+        self.stats = {}
+        self.pending = set()
+        self.stats_lock = threading.Lock()
+        self.round_t0 = time.time()
+
+    # ---------- 端点配置 ----------
+    def _limit(self, endpoint):
+        rate, per, conc = self.limits.get(endpoint, DEFAULT_LIMIT)
+        key = endpoint.upper()
+        rate = float(os.environ.get(f"COLLECT_RATE_{key}", rate))
+        conc = int(os.environ.get(f"COLLECT_CONC_{key}", conc))
+        return rate, per, conc
+
+    def _endpoint(self, endpoint):
+        if endpoint not in self.pools:
+            rate, per, conc = self._limit(endpoint)
+            self.buckets[endpoint] = TokenBucket(max(1.0, rate * SAFETY_RATIO), per)
+            self.pools[endpoint] = ThreadPoolExecutor(max_workers=max(1, conc),
+                                                      thread_name_prefix=f"collect-{endpoint}")
+            self.stats[endpoint] = EndpointStats()
+        return self.pools[endpoint]
+
+    def round_capacity(self, endpoint, seconds):
+        """该端点在 seconds 秒内最多能发多少次请求（用于把低配额端点分摊到多轮）。"""
+        rate, per, _ = self._limit(endpoint)
+        return max(1, int(rate * SAFETY_RATIO / per * seconds))
+
+    # ---------- 执行 ----------
+    def _run(self, endpoint, func, args, kwargs):
+        bucket = self.buckets[endpoint]
+        st = self.stats[endpoint]
+        last_err = None
+        for _ in range(self.retries + 1):
+            waited = bucket.acquire()
+            t0 = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+                with self.stats_lock:
+                    st.calls += 1
+                    st.throttle += waited
+                    st.latency += time.perf_counter() - t0
+                return result
+            except Exception as e:
+                last_err = e
+                with self.stats_lock:
+                    st.calls += 1
+                    st.fails += 1
+                    st.throttle += waited
+                    st.latency += time.perf_counter() - t0
+        raise last_err
+
+    def submit(self, endpoint, func, *args, tag=None, **kwargs):
+        pool = self._endpoint(endpoint)
+        fut = pool.submit(self._run, endpoint, func, args, kwargs)
+        fut.tag = tag
+        fut.endpoint = endpoint
+        self.pending.add(fut)
+        return fut
+
+    def results(self):
+        """
+        按完成顺序产出 (tag, result, error)。
+        迭代过程中可以继续 submit()，新任务会一并被等待。
+        """
+        while self.pending:
+            done, _ = wait(self.pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                self.pending.discard(fut)
+                err = fut.exception()
+                yield fut.tag, (None if err else fut.result()), err
+
+    def add_rows(self, endpoint, n):
+        with self.stats_lock:
+            self._endpoint(endpoint)
+            self.stats[endpoint].rows += int(n or 0)
+
+    # ---------- 统计 ----------
+    def finish_round(self):
+        """返回本轮统计并清零计数。"""
+        elapsed = max(1e-6, time.time() - self.round_t0)
+        with self.stats_lock:
+            per_ep = {}
+            total_calls = total_rows = total_fails = 0
+            for ep, st in self.stats.items():
+                per_ep[ep] = {
+                    "calls": st.calls,
+                    "fails": st.fails,
+                    "rows": st.rows,
+                    "avg_ms": round(st.latency / st.calls * 1000, 1) if st.calls else 0.0,
+                    "throttle_sec": round(st.throttle, 2),
+                }
+                total_calls += st.calls
+                total_rows += st.rows
+                total_fails += st.fails
+                self.stats[ep] = EndpointStats()
+            self.round_t0 = time.time()
+        return {
+            "elapsed": round(elapsed, 2),
+            "calls": total_calls,
+            "rows": total_rows,
+            "fails": total_fails,
+            "req_per_sec": round(total_calls / elapsed, 2),
+            "rows_per_sec": round(total_rows / elapsed, 2),
+            "endpoints": per_ep,
+        }
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def format_round_stats(stats):
+    lines = [
+        f"[吞吐] 耗时:{stats['elapsed']}s 请求:{stats['calls']} ({stats['req_per_sec']}/s) "
+        f"入库行:{stats['rows']} ({stats['rows_per_sec']}/s) 失败:{stats['fails']}"
+    ]
+    for ep, s in sorted(stats["endpoints"].items()):
+        lines.append(
+            f"    {ep:<12} calls={s['calls']:<6} fails={s['fails']:<4} rows={s['rows']:<7} "
+            f"avg={s['avg_ms']}ms throttle={s['throttle_sec']}s"
+        )
+    return "\n".join(lines)
@@ -1,13 +1,36 @@
 # collectors/feature_engine.py
+"""
+K 线指标引擎
+
+- FE_MODE=incr（默认）：每个 (instId, 周期) 保存一份增量指标状态（collectors/indicator_state.py），
+  每轮只读上次之后的新 K 线，逐根 O(1) 更新；状态 checkpoint 到 features.db 的 indicator_state 表
+  最后一根 K 线可能还没收盘，只做预览计算（写特征行但不推进状态），下一轮再正式计入
+- FE_MODE=full：原来的 pandas 全量重算（每个 instId 取最近 FE_ROWS 根，只落最后一行）
+- FE_MODE=validate：同一段 K 线分别用增量 / 全量计算，打印最后一行各指标的最大相对误差
+- FE_MODE=panel：一条 SQL 把整张 K 线表（每个 instId 最近 FE_ROWS 根）读成 instId × 时间 的二维数组，
+  所有指标跨 instId 向量化计算，结果一次 executemany 写入；与 full 模式逐行一致
+  （每个 instId 的序列右对齐、左侧补 NaN，窗口/递推口径与 pandas 相同）
+  对比：python -m tools.bench_features
+- FE_MODE=backfill：每个 instId 从最早一根 K 线开始逐根计入状态，把特征表里还没有的每一根都补上
+  （只写 ts 大于已有最大 ts 的行，可重复执行），结束时写好增量状态，之后切回 incr 接着跑
+
+incr / backfill 模式落库都是批量 upsert（ON CONFLICT DO UPDATE），每根 K 线一行历史；
+每轮结束按周期做保留期清理（FE_RETENTION，单位天，0=永久），例：FE_RETENTION="1m=7,5m=30"
+"""
 import os
+import json
+import time
 import sqlite3
 from pathlib import Path
 from typing import List, Tuple, Optional
 
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 
 from utils.config import DB_DIR, FEATURES_DB
+from collectors.indicator_state import IndicatorState
+from utils.kline_store import get_kline_store
 try:
     from utils.db_upgrade import ensure_table_fields
 except Exception:
@@ -19,6 +42,18 @@ BATCH_SIZE = int(os.environ.get("FE_BATCH", "200"))
 ROW_LIMIT  = int(os.environ.get("FE_ROWS",  "500"))   # 每个 instId 读取 K 线条数
 CYCLE_ONLY = os.environ.get("FE_CYCLE", "").strip()   # 例如 "15m"，空则全部周期
 PER_TABLE_LIMIT = int(os.environ.get("FE_LIMIT", "0"))  # 每张表最多处理多少 instId，0=不限
+FE_MODE = os.environ.get("FE_MODE", "incr").strip().lower()  # incr / full / validate
+CKPT_EVERY = int(os.environ.get("FE_CKPT_EVERY", "200"))  # 每处理多少个 instId checkpoint 一次状态
+WARMUP_MIN = 30                                          # 增量状态至少计入多少根才开始落特征（= 最长窗口）
+STATE_TABLE = "indicator_state"
+PANEL_OUT_ROWS = int(os.environ.get("FE_PANEL_OUT", "1"))  # panel 模式每个 instId 落最近几根的特征
+
+# 特征历史保留天数（按周期），0 = 永久保留；FE_RETENTION 覆盖，如 "1m=7,5m=30"
+RETENTION_DAYS = {"1m": 30, "3m": 60, "5m": 90, "15m": 180, "1H": 365, "4H": 730, "1D": 0}
+for _item in filter(None, os.environ.get("FE_RETENTION", "").split(",")):
+    _bar, _, _days = _item.partition("=")
+    if _days.strip():
+        RETENTION_DAYS[_bar.strip()] = int(_days)
 
 # ===== 指标字段 =====
 FEATURE_FIELDS = {
@@ -71,6 +106,9 @@ def list_all_kline_sources() -> List[Tuple[Path, str]]:
         with sqlite3.connect(p) as conn:
             rows = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'kline_%'").fetchall()
             for (tname,) in rows:
+                # 同库还有 kline_watermark / kline_hwm 等辅助表，只认与文件同名的 K 线表
+                if tname != p.stem:
+                    continue
                 if CYCLE_ONLY and not tname.endswith(CYCLE_ONLY):
                     continue
                 res.append((p, tname))
@@ -91,6 +129,12 @@ def ensure_feature_table(feature_db: Path, feature_table: str, _cache={}):
         return
     conn = _conn_fast(feature_db)
     c = conn.cursor()
+    c.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            ktable TEXT, instId TEXT, ts INTEGER, state TEXT, updated_at INTEGER,
+            PRIMARY KEY (ktable, instId)
+        )
+    """)
     field_sql = ", ".join([f"{k} {v}" for k, v in FEATURE_FIELDS.items()])
     c.execute(f"""
         CREATE TABLE IF NOT EXISTS {feature_table} (
@@ -105,20 +149,23 @@ def ensure_feature_table(feature_db: Path, feature_table: str, _cache={}):
     _cache[key] = True
     conn.close()
 
+def _store(kline_db: Path):
+    return get_kline_store(Path(kline_db).parent)
+
+def _bar(kline_table: str) -> str:
+    return kline_table.split("_", 1)[1]
+
 def fetch_kline_df(kline_db: Path, kline_table: str, instId: str, limit: int = ROW_LIMIT) -> Optional[pd.DataFrame]:
+    """最近 limit 根（升序）；原来 ASC LIMIT 取到的是最老的一段"""
     if not Path(kline_db).exists(): return None
-    conn = sqlite3.connect(kline_db)
-    try:
-        q = f"SELECT ts, open, high, low, close, vol FROM {kline_table} WHERE instId=? ORDER BY ts ASC LIMIT ?"
-        df = pd.read_sql(q, conn, params=(instId, limit))
-    finally:
-        conn.close()
-    if df.empty: return None
-    df['ts'] = df['ts'].astype(int)
-    df.set_index('ts', inplace=True)
-    return df
+    k = _store(kline_db).latest(instId, _bar(kline_table), limit)
+    if not len(k.ts): return None
+    return pd.DataFrame({"open": k.open, "high": k.high, "low": k.low, "close": k.close, "vol": k.vol},
+                        index=pd.Index(k.ts, name="ts"))
 
-def save_feature_row(feature_db: Path, feature_table: str, instId: str, ts: int, features: dict, _cache={}):
+_SAVE_CACHE = {}
+
+def save_feature_row(feature_db: Path, feature_table: str, instId: str, ts: int, features: dict, _cache=_SAVE_CACHE):
     conn = _cache.get(str(feature_db))
     if conn is None:
         conn = _conn_fast(feature_db)
@@ -133,13 +180,307 @@ def save_feature_row(feature_db: Path, feature_table: str, instId: str, ts: int,
     if _cache["cnt"] % BATCH_SIZE == 0:
         conn.commit()
 
-def flush_all(_cache=globals()):
+def flush_all(_cache=_SAVE_CACHE):
     for k, v in list(_cache.items()):
         if isinstance(v, sqlite3.Connection):
             try:
                 v.commit(); v.close()
             except: pass
-    if "cnt" in _cache: _cache.pop("cnt", None)
+    _cache.clear()
+
+FEATURE_NAMES = [k for k in FEATURE_FIELDS if k not in ("instId", "ts")]
+
+def upsert_feature_rows(feature_db: Path, feature_table: str, instId: str, items, _cache=_SAVE_CACHE) -> int:
+    """items: [(ts, 指标 dict)]；一次 executemany，已存在的 (instId, ts) 覆盖指标列"""
+    if not items:
+        return 0
+    conn = _cache.get(str(feature_db))
+    if conn is None:
+        conn = _conn_fast(feature_db)
+        _cache[str(feature_db)] = conn
+        _cache["cnt"] = 0
+    cols = ",".join(FEATURE_NAMES)
+    sets = ",".join(f"{k}=excluded.{k}" for k in FEATURE_NAMES)
+    conn.executemany(
+        f"INSERT INTO {feature_table} (instId,ts,{cols}) VALUES ({','.join(['?'] * (len(FEATURE_NAMES) + 2))}) "
+        f"ON CONFLICT(instId, ts) DO UPDATE SET {sets}",
+        [[instId, int(ts)] + [f.get(k) for k in FEATURE_NAMES] for ts, f in items])
+    before = _cache["cnt"]
+    _cache["cnt"] += len(items)
+    if _cache["cnt"] // BATCH_SIZE != before // BATCH_SIZE:
+        conn.commit()
+    return len(items)
+
+def feature_hwm(feature_db: Path, feature_table: str) -> dict:
+    """instId -> 特征表里已有的最大 ts（走主键索引）"""
+    ensure_feature_table(feature_db, feature_table)
+    conn = _conn_fast(feature_db)
+    try:
+        return dict(conn.execute(f"SELECT instId, MAX(ts) FROM {feature_table} GROUP BY instId").fetchall())
+    finally:
+        conn.close()
+
+def retention_cutoff(kline_table: str, now: Optional[float] = None) -> Optional[int]:
+    days = RETENTION_DAYS.get(kline_table.split("_", 1)[-1], 0)
+    return int((now or time.time()) - days * 86400) if days else None
+
+def apply_retention(feature_db: Path, feature_table: str, kline_table: str) -> int:
+    cutoff = retention_cutoff(kline_table)
+    if cutoff is None:
+        return 0
+    conn = _conn_fast(feature_db)
+    try:
+        n = conn.execute(f"DELETE FROM {feature_table} WHERE ts < ?", (cutoff,)).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    return n
+
+def load_feature_history(instId: str, bar: str, start_ts: int = 0, end_ts: Optional[int] = None,
+                         feature_db: Path = Path(FEATURES_DB)) -> Optional[pd.DataFrame]:
+    """读某个 instId 某周期的特征历史（index=ts），给回测 / AI 层用，不必再自己重算"""
+    conn = sqlite3.connect(feature_db)
+    try:
+        q = f"SELECT * FROM features_{bar} WHERE instId=? AND ts>=? AND ts<=? ORDER BY ts"
+        df = pd.read_sql(q, conn, params=(instId, int(start_ts), int(end_ts or 2 ** 62)))
+    except Exception as e:
+        print(f"[读取特征历史失败] {instId} {bar}: {e}")
+        return None
+    finally:
+        conn.close()
+    return None if df.empty else df.set_index("ts")
+
+# ===== 增量状态 checkpoint =====
+def load_states(feature_db: Path, kline_table: str) -> dict:
+    """instId -> IndicatorState；读不出来的状态丢弃（下一轮从最近 FE_ROWS 根重新预热）"""
+    conn = _conn_fast(feature_db)
+    try:
+        rows = conn.execute(f"SELECT instId, state FROM {STATE_TABLE} WHERE ktable=?", (kline_table,)).fetchall()
+    finally:
+        conn.close()
+    states = {}
+    for inst, raw in rows:
+        try:
+            states[inst] = IndicatorState.from_dict(json.loads(raw))
+        except Exception as e:
+            print(f"[状态损坏] {kline_table} {inst}: {e}，将重新预热")
+    return states
+
+def save_states(feature_db: Path, kline_table: str, states: dict):
+    now = int(time.time())
+    rows = [(kline_table, inst, st.ts, json.dumps(st.to_dict(), separators=(',', ':')), now)
+            for inst, st in states.items() if st.ts is not None]
+    conn = _conn_fast(feature_db)
+    try:
+        conn.executemany(f"INSERT OR REPLACE INTO {STATE_TABLE} (ktable, instId, ts, state, updated_at) "
+                         f"VALUES (?,?,?,?,?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+def fetch_kline_since(kline_db: Path, kline_table: str, instId: str, after_ts: int):
+    k = _store(kline_db).get(instId, _bar(kline_table), start=int(after_ts) + 1)
+    return list(zip(k.ts.tolist(), k.high.tolist(), k.low.tolist(), k.close.tolist()))
+
+def _advance(st: IndicatorState, rows, min_ts=None):
+    """rows 逐根计入 st，返回要落库的 [(ts, 指标)]：跳过预热期和 ts <= min_ts 的；
+    最后一根可能未收盘，只在副本上预览，不推进状态"""
+    out = []
+    for ts, high, low, close in rows[:-1]:
+        f = st.update(ts, high, low, close)
+        if st.count >= WARMUP_MIN and (min_ts is None or ts > min_ts):
+            out.append((ts, f))
+    ts, high, low, close = rows[-1]
+    preview = st.copy()
+    f = preview.update(ts, high, low, close)
+    if preview.count >= WARMUP_MIN and (min_ts is None or ts > min_ts):
+        out.append((ts, f))
+    return out
+
+def update_features_incremental(kline_db: Path, kline_table: str, feature_db: Path, feature_table: str,
+                                instId: str, states: dict) -> int:
+    """把上次状态之后的新 K 线逐根计入，返回写入的特征行数；
+    在副本上推进，落库成功后才替换 states（写库失败下一轮从原状态重算，不会跳过这些 K 线）"""
+    st = states.get(instId)
+    if st is None:
+        df = fetch_kline_df(kline_db, kline_table, instId)
+        if df is None:
+            return 0
+        rows = [(int(ts), r.high, r.low, r.close) for ts, r in df.iterrows()]
+        st = IndicatorState()
+    else:
+        rows = fetch_kline_since(kline_db, kline_table, instId, st.ts)
+        st = st.copy()
+    if not rows:
+        return 0
+    ensure_feature_table(feature_db, feature_table)
+    items = _advance(st, rows)
+    n = upsert_feature_rows(feature_db, feature_table, instId, items)
+    states[instId] = st
+    return n
+
+def backfill_features(kline_db: Path, kline_table: str, feature_db: Path, feature_table: str,
+                      instId: str, states: dict, hwm: dict) -> int:
+    """从最早一根开始重建状态，只补特征表里还没有的（ts > 已有最大 ts，且在保留期内）"""
+    rows = fetch_kline_since(kline_db, kline_table, instId, -1)
+    if not rows:
+        return 0
+    cutoff = retention_cutoff(kline_table)
+    min_ts = max(hwm.get(instId) or -1, (cutoff or 0) - 1)
+    st = IndicatorState()
+    items = _advance(st, rows, min_ts=min_ts)
+    n = upsert_feature_rows(feature_db, feature_table, instId, items)
+    states[instId] = st
+    return n
+
+# ===== 全量计算 =====
+def compute_full_features(df: pd.DataFrame) -> pd.DataFrame:
+    df['ma5']  = MA(df['close'], 5);   df['ma10'] = MA(df['close'], 10)
+    df['ma20'] = MA(df['close'], 20);  df['ma30'] = MA(df['close'], 30)
+    df['ema7'] = EMA(df['close'], 7);  df['ema25'] = EMA(df['close'], 25)
+    boll_ma, boll_up, boll_lo = BOLL(df['close'])
+    df['boll_ma'] = boll_ma; df['boll_upper'] = boll_up; df['boll_lower'] = boll_lo
+    df['rsi6']  = RSI(df['close'], 6); df['rsi14'] = RSI(df['close'], 14)
+    k, d, j = KDJ(df); df['k'] = k; df['d'] = d; df['j'] = j
+    macd, ms, mh = MACD(df['close']); df['macd'] = macd; df['macds'] = ms; df['macdh'] = mh
+    df['atr14'] = ATR(df, 14)
+    return df
+
+def validate_incremental(kline_db: Path, kline_table: str, instId: str, limit: int = ROW_LIMIT) -> Optional[dict]:
+    """同一段 K 线分别增量 / 全量计算，返回最后一行每个指标的相对误差"""
+    df = fetch_kline_df(kline_db, kline_table, instId, limit)
+    if df is None or len(df) < WARMUP_MIN:
+        return None
+    st = IndicatorState()
+    for ts, r in df.iterrows():
+        f = st.update(ts, r.high, r.low, r.close)
+    full = compute_full_features(df.copy()).iloc[-1]
+    err = {}
+    for k, v in f.items():
+        ref = full.get(k)
+        if v is None or ref is None or pd.isna(ref):
+            err[k] = 0.0 if (v is None) == (ref is None or pd.isna(ref)) else float("inf")
+        else:
+            err[k] = abs(v - ref) / max(1e-9, abs(ref))
+    return err
+
+# ===== 面板（instId × 时间）向量化计算 =====
+def load_kline_panel(kline_db: Path, kline_table: str, rows: int = ROW_LIMIT, since_ts: Optional[int] = None):
+    """
+    一次读出每个 instId 最近 rows 根（可选只要 ts >= since_ts），返回
+    (insts, ts[N,T], high[N,T], low[N,T], close[N,T])；序列右对齐，缺的左侧补 NaN / 0
+    """
+    conn = sqlite3.connect(kline_db)
+    try:
+        # 按主键 (instId, ts) 顺序整表扫一遍，不排序；每个 instId 的"最近 rows 根"在 numpy 里截
+        where = "WHERE ts >= ?" if since_ts is not None else ""
+        params = (int(since_ts),) if since_ts is not None else ()
+        data = conn.execute(f"SELECT instId, ts, high, low, close FROM {kline_table} {where} "
+                            f"ORDER BY instId, ts", params).fetchall()
+    finally:
+        conn.close()
+    if not data:
+        return [], None, None, None, None
+    inst_col, ts_col, hi_col, lo_col, cl_col = zip(*data)
+    starts = [0] + [i for i in range(1, len(inst_col)) if inst_col[i] != inst_col[i - 1]]
+    ends = starts[1:] + [len(inst_col)]
+    insts = [inst_col[s] for s in starts]
+    ts_col = np.array(ts_col, dtype=np.int64)
+    hi_col, lo_col, cl_col = (np.array(c, dtype=float) for c in (hi_col, lo_col, cl_col))
+    T = min(int(rows), max(e - s for s, e in zip(starts, ends)))
+    shape = (len(insts), T)
+    ts = np.zeros(shape, dtype=np.int64)
+    high, low, close = np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, np.nan)
+    for i, (s, e) in enumerate(zip(starts, ends)):
+        s = max(s, e - T)
+        ts[i, T - (e - s):], high[i, T - (e - s):] = ts_col[s:e], hi_col[s:e]
+        low[i, T - (e - s):], close[i, T - (e - s):] = lo_col[s:e], cl_col[s:e]
+    return insts, ts, high, low, close
+
+def _roll(x, n, fn):
+    """沿时间轴的 n 窗口统计；窗口内有 NaN（含左侧补齐）即为 NaN，与 rolling(n) 一致"""
+    out = np.full(x.shape, np.nan)
+    if x.shape[1] >= n:
+        out[:, n - 1:] = fn(sliding_window_view(x, n, axis=1), axis=-1)
+    return out
+
+def _ema_panel(x, n=None, alpha=None, adjust=False):
+    """逐列递推、跨 instId 向量化；从每行第一个非 NaN 开始，与 ewm(span/com, adjust) 一致"""
+    a = alpha if alpha is not None else 2.0 / (n + 1)
+    out = np.full(x.shape, np.nan)
+    if adjust:
+        num = np.zeros(x.shape[0]); den = np.zeros(x.shape[0])
+        for t in range(x.shape[1]):
+            v = x[:, t]; ok = ~np.isnan(v)
+            num = np.where(ok, v + (1 - a) * num, num)
+            den = np.where(ok, 1.0 + (1 - a) * den, den)
+            out[:, t] = np.where(den > 0, num / np.where(den > 0, den, 1), np.nan)
+    else:
+        prev = np.full(x.shape[0], np.nan)
+        for t in range(x.shape[1]):
+            v = x[:, t]
+            prev = np.where(np.isnan(prev), v, np.where(np.isnan(v), prev, prev + a * (v - prev)))
+            out[:, t] = prev
+    return out
+
+def compute_panel_features(high, low, close) -> dict:
+    """输入 [N,T] 数组，返回 指标名 -> [N,T]"""
+    f = {}
+    for n in (5, 10, 20, 30):
+        f[f"ma{n}"] = _roll(close, n, np.mean)
+    f["ema7"], f["ema25"] = _ema_panel(close, 7), _ema_panel(close, 25)
+    std20 = _roll(close, 20, lambda w, axis: np.std(w, axis=axis, ddof=1))
+    f["boll_ma"] = f["ma20"]
+    f["boll_upper"], f["boll_lower"] = f["ma20"] + 2 * std20, f["ma20"] - 2 * std20
+
+    prev = np.concatenate([np.full((close.shape[0], 1), np.nan), close[:, :-1]], axis=1)
+    diff = close - prev
+    pad = np.isnan(close)
+    gain = np.where(pad, np.nan, np.where(diff > 0, diff, 0.0))   # 首根 diff 为 NaN → 0，同 pandas where
+    loss = np.where(pad, np.nan, np.where(diff < 0, -diff, 0.0))
+    for n in (6, 14):
+        rs = _roll(gain, n, np.mean) / (_roll(loss, n, np.mean) + 1e-9)
+        f[f"rsi{n}"] = 100 - (100 / (1 + rs))
+
+    lo, hi = _roll(low, 9, np.min), _roll(high, 9, np.max)
+    rsv = (close - lo) / (hi - lo + 1e-9) * 100
+    k = _ema_panel(rsv, alpha=1.0 / 3.0, adjust=True)
+    d = _ema_panel(k, alpha=1.0 / 3.0, adjust=True)
+    f["k"], f["d"], f["j"] = k, d, 3 * k - 2 * d
+
+    ema12, ema26 = _ema_panel(close, 12), _ema_panel(close, 26)
+    macd = ema12 - ema26
+    sig = _ema_panel(macd, 9)
+    f["macd"], f["macds"], f["macdh"] = macd, sig, macd - sig
+
+    tr = np.fmax(np.fmax(high - low, np.abs(high - prev)), np.abs(low - prev))
+    f["atr14"] = _roll(tr, 14, np.mean)
+    return f
+
+def compute_and_save_panel(kline_db: Path, kline_table: str, feature_db: Path, feature_table: str,
+                           rows: int = ROW_LIMIT, out_rows: int = PANEL_OUT_ROWS) -> int:
+    """整表一次计算，每个 instId 落最近 out_rows 根（数据不足 30 根的 instId 跳过），返回写入行数"""
+    insts, ts, high, low, close = load_kline_panel(kline_db, kline_table, rows)
+    if not insts:
+        return 0
+    ensure_feature_table(feature_db, feature_table)
+    f = compute_panel_features(high, low, close)
+    names = [k for k in FEATURE_FIELDS if k not in ("instId", "ts")]
+    enough = (~np.isnan(close)).sum(axis=1) >= 30
+    T = close.shape[1]
+    out = []
+    for t in range(max(0, T - out_rows), T):
+        cols = np.column_stack([f[k][:, t] for k in names])
+        for i in np.nonzero(enough & ~np.isnan(close[:, t]))[0]:
+            out.append([insts[i], int(ts[i, t])] + [None if np.isnan(v) else float(v) for v in cols[i]])
+    conn = _conn_fast(feature_db)
+    try:
+        conn.executemany(f"INSERT OR REPLACE INTO {feature_table} (instId,ts,{','.join(names)}) "
+                         f"VALUES ({','.join(['?'] * (len(names) + 2))})", out)
+        conn.commit()
+    finally:
+        conn.close()
+    return len(out)
 
 # ===== 主逻辑 =====
 def compute_and_save_features_for_one(kline_db: Path, kline_table: str, feature_db: Path, feature_table: str, instId: str):
@@ -150,15 +491,7 @@ def compute_and_save_features_for_one(kline_db: Path, kline_table: str, feature_
     ensure_feature_table(feature_db, feature_table)
 
     try:
-        df['ma5']  = MA(df['close'], 5);   df['ma10'] = MA(df['close'], 10)
-        df['ma20'] = MA(df['close'], 20);  df['ma30'] = MA(df['close'], 30)
-        df['ema7'] = EMA(df['close'], 7);  df['ema25'] = EMA(df['close'], 25)
-        boll_ma, boll_up, boll_lo = BOLL(df['close'])
-        df['boll_ma'] = boll_ma; df['boll_upper'] = boll_up; df['boll_lower'] = boll_lo
-        df['rsi6']  = RSI(df['close'], 6); df['rsi14'] = RSI(df['close'], 14)
-        k, d, j = KDJ(df); df['k'] = k; df['d'] = d; df['j'] = j
-        macd, ms, mh = MACD(df['close']); df['macd'] = macd; df['macds'] = ms; df['macdh'] = mh
-        df['atr14'] = ATR(df, 14)
+        df = compute_full_features(df)
     except Exception as e:
         print(f"[指标计算异常] {instId}: {e}")
         return
@@ -180,6 +513,12 @@ def main():
     feature_db = Path(FEATURES_DB)
     for kdb, ktable in sources:
         ftable = ktable.replace("kline", "features")
+        if FE_MODE == "panel":
+            t0 = time.time()
+            n = compute_and_save_panel(kdb, ktable, feature_db, ftable)
+            print(f"[面板] {ktable} 写入 {n} 行，用时 {time.time() - t0:.2f}s")
+            apply_retention(feature_db, ftable, ktable)
+            continue
         with sqlite3.connect(kdb) as conn:
             rows = conn.execute(f"SELECT DISTINCT instId FROM {ktable}").fetchall()
             insts = [r[0] for r in rows]
@@ -188,13 +527,46 @@ def main():
             print(f"[跳过] {kdb.name}:{ktable} 无 instId")
             continue
 
-        processed = 0
+        if FE_MODE == "validate":
+            worst = {}
+            for inst in insts[:PER_TABLE_LIMIT or None]:
+                for k, e in (validate_incremental(kdb, ktable, inst) or {}).items():
+                    worst[k] = max(worst.get(k, 0.0), e)
+            bad = {k: e for k, e in worst.items() if e > 1e-6}
+            print(f"[校验] {ktable} 增量 vs 全量 最大相对误差: {max(worst.values(), default=0):.2e}"
+                  + (f" 超差字段 {bad}" if bad else ""))
+            continue
+
+        ensure_feature_table(feature_db, ftable)
+        states = load_states(feature_db, ktable) if FE_MODE == "incr" else ({} if FE_MODE == "backfill" else None)
+        hwm = feature_hwm(feature_db, ftable) if FE_MODE == "backfill" else None
+        processed = rows_written = 0
         for inst in insts:
-            compute_and_save_features_for_one(kdb, ktable, feature_db, ftable, inst)
+            if states is None:
+                compute_and_save_features_for_one(kdb, ktable, feature_db, ftable, inst)
+            else:
+                try:
+                    if hwm is not None:
+                        rows_written += backfill_features(kdb, ktable, feature_db, ftable, inst, states, hwm)
+                    else:
+                        rows_written += update_features_incremental(kdb, ktable, feature_db, ftable, inst, states)
+                except Exception as e:
+                    print(f"[{FE_MODE}计算异常] {ktable} {inst}: {e}")
+                if processed % CKPT_EVERY == CKPT_EVERY - 1:
+                    flush_all()
+                    save_states(feature_db, ktable, states)
             processed += 1
             if PER_TABLE_LIMIT and processed >= PER_TABLE_LIMIT:
                 print(f"[限额] {ktable} 达到 FE_LIMIT={PER_TABLE_LIMIT}，跳出该表")
                 break
+        if states is not None:
+            # 特征行先落盘再存状态：崩溃时最多重算一段，不会出现状态超前于特征
+            flush_all()
+            save_states(feature_db, ktable, states)
+            print(f"[{FE_MODE}] {ktable} {processed} 个 instId，写入 {rows_written} 行")
+        removed = apply_retention(feature_db, ftable, ktable)
+        if removed:
+            print(f"[保留期] {ftable} 清理 {removed} 行（>{RETENTION_DAYS.get(ktable.split('_', 1)[-1])} 天）")
 
     # 收尾提交
     flush_all()
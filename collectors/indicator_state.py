@@ -0,0 +1,214 @@
+# collectors/indicator_state.py
+"""
+单个 (instId, 周期) 的增量指标状态：每来一根 K 线 O(1) 更新，结果与 feature_engine 的 pandas 全量计算一致
+
+- MA / BOLL：定长窗口 + 滚动和 / 平方和（每 RESYNC 次从窗口重算一遍，消掉浮点累计误差）
+- EMA / MACD：ewm(adjust=False) 递推
+- RSI：与全量版相同的"窗口均值"口径（不是 Wilder 平滑），涨跌各一个滚动和
+- KDJ：单调队列求窗口最高/最低，K / D 为 ewm(com=2, adjust=True) 的分子/分母递推
+- ATR：真实波幅的滚动和
+- to_dict() / from_dict() 用于落盘 checkpoint，重启后接着上一根继续
+"""
+import math
+from collections import deque
+
+RESYNC = 512
+MA_WINDOWS = (5, 10, 20, 30)
+BOLL_N = 20
+RSI_WINDOWS = (6, 14)
+KDJ_N = 9
+KDJ_ALPHA = 1.0 / 3.0      # ewm(com=2)
+ATR_N = 14
+
+
+class RollingWindow:
+    def __init__(self, n):
+        self.n = n
+        self.buf = deque(maxlen=n)
+        self.s = 0.0
+        self.s2 = 0.0
+        self._k = 0
+
+    def push(self, x):
+        if len(self.buf) == self.n:
+            old = self.buf[0]
+            self.s -= old
+            self.s2 -= old * old
+        self.buf.append(x)
+        self.s += x
+        self.s2 += x * x
+        self._k += 1
+        if self._k % RESYNC == 0:
+            self.s = math.fsum(self.buf)
+            self.s2 = math.fsum(v * v for v in self.buf)
+
+    def ready(self):
+        return len(self.buf) == self.n
+
+    def mean(self):
+        return self.s / self.n if self.ready() else None
+
+    def std(self):
+        """样本标准差（ddof=1），与 pandas rolling().std() 一致"""
+        if not self.ready() or self.n < 2:
+            return None
+        var = (self.s2 - self.s * self.s / self.n) / (self.n - 1)
+        return math.sqrt(var) if var > 0 else 0.0
+
+    def to_dict(self):
+        return {"n": self.n, "buf": list(self.buf)}
+
+    @classmethod
+    def from_dict(cls, d):
+        w = cls(d["n"])
+        for x in d["buf"]:
+            w.push(x)
+        return w
+
+
+class RollingExtreme:
+    """窗口最高 / 最低（单调队列，均摊 O(1)）"""
+
+    def __init__(self, n, mode="max"):
+        self.n = n
+        self.mode = mode
+        self.q = deque()      # (序号, 值)
+        self.i = 0
+
+    def push(self, x):
+        better = (lambda a, b: a >= b) if self.mode == "max" else (lambda a, b: a <= b)
+        while self.q and better(x, self.q[-1][1]):
+            self.q.pop()
+        self.q.append((self.i, x))
+        if self.q[0][0] <= self.i - self.n:
+            self.q.popleft()
+        self.i += 1
+
+    def ready(self):
+        return self.i >= self.n
+
+    def value(self):
+        return self.q[0][1] if self.ready() else None
+
+    def to_dict(self):
+        return {"n": self.n, "mode": self.mode, "q": [list(x) for x in self.q], "i": self.i}
+
+    @classmethod
+    def from_dict(cls, d):
+        e = cls(d["n"], d["mode"])
+        e.q = deque(tuple(x) for x in d["q"])
+        e.i = d["i"]
+        return e
+
+
+def _ema(prev, x, n):
+    """ewm(span=n, adjust=False)"""
+    if prev is None:
+        return x
+    a = 2.0 / (n + 1)
+    return prev + a * (x - prev)
+
+
+def _ewm_adj(state, x, alpha):
+    """ewm(alpha, adjust=True)：state=[分子, 分母]，返回新值"""
+    state[0] = x + (1 - alpha) * state[0]
+    state[1] = 1.0 + (1 - alpha) * state[1]
+    return state[0] / state[1]
+
+
+class IndicatorState:
+    def __init__(self):
+        self.ts = None            # 最后一根已计入状态的 K 线
+        self.count = 0
+        self.prev_close = None
+        self.ma = {n: RollingWindow(n) for n in MA_WINDOWS}
+        self.ema = {7: None, 25: None, 12: None, 26: None}
+        self.macd_sig = None
+        self.gain = {n: RollingWindow(n) for n in RSI_WINDOWS}
+        self.loss = {n: RollingWindow(n) for n in RSI_WINDOWS}
+        self.low = RollingExtreme(KDJ_N, "min")
+        self.high = RollingExtreme(KDJ_N, "max")
+        self.k_acc = [0.0, 0.0]
+        self.d_acc = [0.0, 0.0]
+        self.tr = RollingWindow(ATR_N)
+
+    def update(self, ts, high, low, close):
+        """计入一根 K 线，返回该根的指标 dict（窗口未满的字段为 None）"""
+        high, low, close = float(high), float(low), float(close)
+        f = {}
+        for n, w in self.ma.items():
+            w.push(close)
+            f[f"ma{n}"] = w.mean()
+
+        for n in self.ema:
+            self.ema[n] = _ema(self.ema[n], close, n)
+        f["ema7"], f["ema25"] = self.ema[7], self.ema[25]
+
+        boll = self.ma[BOLL_N]
+        std = boll.std()
+        f["boll_ma"] = boll.mean()
+        f["boll_upper"] = None if std is None else f["boll_ma"] + 2 * std
+        f["boll_lower"] = None if std is None else f["boll_ma"] - 2 * std
+
+        diff = 0.0 if self.prev_close is None else close - self.prev_close
+        for n in RSI_WINDOWS:
+            self.gain[n].push(diff if diff > 0 else 0.0)
+            self.loss[n].push(-diff if diff < 0 else 0.0)
+            g, l = self.gain[n].mean(), self.loss[n].mean()
+            f[f"rsi{n}"] = None if g is None else 100 - 100 / (1 + g / (l + 1e-9))
+
+        self.low.push(low)
+        self.high.push(high)
+        if self.low.ready():
+            lo, hi = self.low.value(), self.high.value()
+            rsv = (close - lo) / (hi - lo + 1e-9) * 100
+            k = _ewm_adj(self.k_acc, rsv, KDJ_ALPHA)
+            d = _ewm_adj(self.d_acc, k, KDJ_ALPHA)
+            f["k"], f["d"], f["j"] = k, d, 3 * k - 2 * d
+        else:
+            f["k"] = f["d"] = f["j"] = None
+
+        macd = self.ema[12] - self.ema[26]
+        self.macd_sig = _ema(self.macd_sig, macd, 9)
+        f["macd"], f["macds"], f["macdh"] = macd, self.macd_sig, macd - self.macd_sig
+
+        tr = high - low
+        if self.prev_close is not None:
+            tr = max(tr, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.tr.push(tr)
+        f["atr14"] = self.tr.mean()
+
+        self.prev_close = close
+        self.ts = int(ts)
+        self.count += 1
+        return f
+
+    # ---------- checkpoint ----------
+    def to_dict(self):
+        return {
+            "ts": self.ts, "count": self.count, "prev_close": self.prev_close,
+            "ma": {str(n): w.to_dict() for n, w in self.ma.items()},
+            "ema": {str(n): v for n, v in self.ema.items()}, "macd_sig": self.macd_sig,
+            "gain": {str(n): w.to_dict() for n, w in self.gain.items()},
+            "loss": {str(n): w.to_dict() for n, w in self.loss.items()},
+            "low": self.low.to_dict(), "high": self.high.to_dict(),
+            "k_acc": self.k_acc, "d_acc": self.d_acc, "tr": self.tr.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        s = cls()
+        s.ts, s.count, s.prev_close = d["ts"], d["count"], d["prev_close"]
+        s.ma = {int(n): RollingWindow.from_dict(w) for n, w in d["ma"].items()}
+        s.ema = {int(n): v for n, v in d["ema"].items()}
+        s.macd_sig = d["macd_sig"]
+        s.gain = {int(n): RollingWindow.from_dict(w) for n, w in d["gain"].items()}
+        s.loss = {int(n): RollingWindow.from_dict(w) for n, w in d["loss"].items()}
+        s.low = RollingExtreme.from_dict(d["low"])
+        s.high = RollingExtreme.from_dict(d["high"])
+        s.k_acc, s.d_acc = list(d["k_acc"]), list(d["d_acc"])
+        s.tr = RollingWindow.from_dict(d["tr"])
+        return s
+
+    def copy(self):
+        return IndicatorState.from_dict(self.to_dict())
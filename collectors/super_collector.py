@@ -1,5 +1,6 @@
 import os
 import time
+import random
 import datetime
 import sqlite3
 import requests
@@ -7,8 +8,11 @@ import traceback
 import json
 
 from core.okx_trader import OKXTrader
+from collectors.collect_engine import CollectEngine, format_round_stats
 from utils.config import DB_DIR
 from utils.db_upgrade import ensure_table_fields
+from utils.db_writer import get_writer, connect_tuned, flush_all
+from utils.kline_store import mirror_klines
 
 FAILED_COLOR = '\033[91m'
 OK_COLOR = '\033[92m'
@@ -48,6 +52,24 @@ def ensure_all_tables():
         ensure_table_fields(full_path, tablename, {
             "instId": "TEXT", "ts": "INTEGER", "open": "REAL", "high": "REAL", "low": "REAL", "close": "REAL", "vol": "REAL"
         })
+        # 缺口校验水位：verified_ts 之前的历史已确认连续，不再重复扫描
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS kline_watermark (
+                instId TEXT PRIMARY KEY, verified_ts INTEGER, gap_ts INTEGER, gap_tries INTEGER DEFAULT 0
+            )
+        ''')
+        ensure_table_fields(full_path, "kline_watermark", {
+            "instId": "TEXT", "verified_ts": "INTEGER", "gap_ts": "INTEGER", "gap_tries": "INTEGER DEFAULT 0"
+        })
+        # 增量采集高水位：每个 instId 已入库的最新一根K线
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS kline_hwm (
+                instId TEXT PRIMARY KEY, last_ts INTEGER, fetched_at INTEGER
+            )
+        ''')
+        ensure_table_fields(full_path, "kline_hwm", {
+            "instId": "TEXT", "last_ts": "INTEGER", "fetched_at": "INTEGER"
+        })
         conn.commit()
         conn.close()
     # 盘口
@@ -124,31 +146,43 @@ def ensure_all_tables():
     conn.close()
 
 # ---------- 数据入库 ----------
-def save_kline_to_db(instId, bar, klines):
+def save_kline_to_db(instId, bar, klines, replace=False):
+    """replace=True 用于增量刷新：覆盖上次采到的未收盘K线"""
     dbfile = f'kline_{bar}.db'
     tablename = f'kline_{bar}'
     full_path = os.path.join(DB_DIR, dbfile)
-    conn = sqlite3.connect(full_path)
-    c = conn.cursor()
+    rows = []
     for item in klines:
         try:
             ts = int(int(item[0]) // 1000)
             o, h, l, c_, v = map(float, item[1:6])
-            c.execute(f'''
-                INSERT OR IGNORE INTO {tablename} (instId, ts, open, high, low, close, vol)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (instId, ts, o, h, l, c_, v))
+            rows.append((instId, ts, o, h, l, c_, v))
         except Exception as e:
             print(f"{FAILED_COLOR}[KLINE][{bar}] 写入异常 {instId}: {e}{RESET_COLOR}")
-    conn.commit()
-    conn.close()
+    verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+    get_writer(full_path).submit(f'''
+        {verb} INTO {tablename} (instId, ts, open, high, low, close, vol)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    mirror_klines(instId, bar, [r[1:] for r in rows], replace=replace)
+    return max((r[1] for r in rows), default=None)
+
+def save_kline_rows(instId, bar, rows):
+    """rows: [(ts秒, open, high, low, close, vol)]，即 get_kline_range 的返回格式"""
+    dbfile = f'kline_{bar}.db'
+    tablename = f'kline_{bar}'
+    full_path = os.path.join(DB_DIR, dbfile)
+    get_writer(full_path).submit(f'''
+        INSERT OR IGNORE INTO {tablename} (instId, ts, open, high, low, close, vol)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(instId, int(r[0]), float(r[1]), float(r[2]), float(r[3]), float(r[4]), float(r[5])) for r in rows])
+    mirror_klines(instId, bar, rows)
 
 def save_orderbook_to_db(instId, ob):
     dbfile = 'orderbook.db'
     tablename = 'orderbook'
     full_path = os.path.join(DB_DIR, dbfile)
-    conn = sqlite3.connect(full_path)
-    c = conn.cursor()
+    rows = []
     for item in ob:
         try:
             ts = int(int(item.get("ts", time.time()*1000)) // 1000)
@@ -156,24 +190,22 @@ def save_orderbook_to_db(instId, ob):
             asks = item.get("asks", [])
             bid1, bid1_qty = (float(bids[0][0]), float(bids[0][1])) if bids else (0, 0)
             ask1, ask1_qty = (float(asks[0][0]), float(asks[0][1])) if asks else (0, 0)
-            c.execute(f'''
-                INSERT OR IGNORE INTO {tablename} (instId, ts, bid1, bid1_qty, ask1, ask1_qty, bids, asks)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
+            rows.append((
                 instId, ts, bid1, bid1_qty, ask1, ask1_qty,
                 json.dumps(bids), json.dumps(asks)
             ))
         except Exception as e:
             print(f"{FAILED_COLOR}[ORDERBOOK][{instId}]写入异常: {e}{RESET_COLOR}")
-    conn.commit()
-    conn.close()
+    get_writer(full_path).submit(f'''
+        INSERT OR IGNORE INTO {tablename} (instId, ts, bid1, bid1_qty, ask1, ask1_qty, bids, asks)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
 
 def save_trades_to_db(instId, trades):
     dbfile = 'trades.db'
     tablename = 'trades'
     full_path = os.path.join(DB_DIR, dbfile)
-    conn = sqlite3.connect(full_path)
-    c = conn.cursor()
+    rows = []
     for t in trades:
         try:
             ts = int(int(t.get("ts", time.time()*1000)) // 1000)
@@ -181,188 +213,365 @@ def save_trades_to_db(instId, trades):
             qty = float(t["sz"])
             side = t["side"]
             trade_id = t.get("tradeId", t.get("id", str(ts)))
-            c.execute(f'''
-                INSERT OR IGNORE INTO {tablename} (instId, ts, px, qty, side, trade_id)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (instId, ts, px, qty, side, trade_id))
+            rows.append((instId, ts, px, qty, side, trade_id))
         except Exception as e:
             print(f"{FAILED_COLOR}[TRADES][{instId}]写入异常: {e}{RESET_COLOR}")
-    conn.commit()
-    conn.close()
+    get_writer(full_path).submit(f'''
+        INSERT OR IGNORE INTO {tablename} (instId, ts, px, qty, side, trade_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
 
 def save_funding_rate(instId, data):
     dbfile = 'funding_rate_8h.db'
     tablename = 'funding_rate_8h'
     full_path = os.path.join(DB_DIR, dbfile)
-    conn = sqlite3.connect(full_path)
-    c = conn.cursor()
     try:
         ts = int(data.get("fundingTime", int(time.time()*1000))) // 1000
         rate = float(data["fundingRate"])
-        c.execute(f'''
-            INSERT OR IGNORE INTO {tablename} (instId, ts, funding_rate)
-            VALUES (?, ?, ?)
-        ''', (instId, ts, rate))
     except Exception as e:
         print(f"{FAILED_COLOR}[FUNDING_RATE]{instId}写入异常: {e}{RESET_COLOR}")
-    conn.commit()
-    conn.close()
+        return
+    get_writer(full_path).submit(f'''
+        INSERT OR IGNORE INTO {tablename} (instId, ts, funding_rate)
+        VALUES (?, ?, ?)
+    ''', [(instId, ts, rate)])
 
 def save_long_short_ratio(instId, data):
     dbfile = 'long_short_ratio.db'
     tablename = 'long_short_ratio'
     full_path = os.path.join(DB_DIR, dbfile)
-    conn = sqlite3.connect(full_path)
-    c = conn.cursor()
     try:
         d = data[0] if data else {}
         ts = int(d.get("ts", int(time.time()*1000))) // 1000
         ratio = float(d.get("longShortRatio", 0))
-        c.execute(f'''
-            INSERT OR IGNORE INTO {tablename} (instId, ts, long_short_ratio)
-            VALUES (?, ?, ?)
-        ''', (instId, ts, ratio))
     except Exception as e:
         print(f"{FAILED_COLOR}[LSRATIO]{instId}写入异常: {e}{RESET_COLOR}")
-    conn.commit()
-    conn.close()
+        return
+    get_writer(full_path).submit(f'''
+        INSERT OR IGNORE INTO {tablename} (instId, ts, long_short_ratio)
+        VALUES (?, ?, ?)
+    ''', [(instId, ts, ratio)])
 
 def save_liquidation_to_db(instId, data):
     dbfile = "liquidation.db"
     tablename = "liquidation"
     full_path = os.path.join(DB_DIR, dbfile)
-    conn = sqlite3.connect(full_path)
-    c = conn.cursor()
+    rows = []
     for d in data:
         try:
-            c.execute(
-                f'INSERT OR IGNORE INTO {tablename} (instId, ts, px, sz, side) VALUES (?, ?, ?, ?, ?)',
-                (d["instId"], int(d["ts"]), float(d["px"]), float(d["sz"]), d["side"])
-            )
+            rows.append((d["instId"], int(d["ts"]), float(d["px"]), float(d["sz"]), d["side"]))
         except Exception as e:
             print(f"{FAILED_COLOR}[写入爆仓榜失败]{e}{RESET_COLOR}")
-    conn.commit()
-    conn.close()
+    get_writer(full_path).submit(
+        f'INSERT OR IGNORE INTO {tablename} (instId, ts, px, sz, side) VALUES (?, ?, ?, ?, ?)',
+        rows
+    )
 
 def safe_request(func, max_retry=5, *args, **kwargs):
+    # 限频/网络抖动的重试已在 OKXTrader._request 内完成，这里只兜底；退避加抖动避免多线程同时重试
     for i in range(max_retry):
         try:
             return func(*args, **kwargs)
         except Exception as e:
             print(f"{FAILED_COLOR}[重试{i+1}/{max_retry}] {func.__name__} 异常: {e}{RESET_COLOR}")
-            time.sleep(2)
+            time.sleep(min(10.0, 0.5 * (2 ** i)) * random.uniform(0.5, 1.5))
     print(f"{FAILED_COLOR}[致命] {func.__name__} 多次重试失败！{RESET_COLOR}")
     return None
 
-def check_and_fill_kline_gap(trader, instId, bar, days=2, max_gap=15):
-    dbfile = f'kline_{bar}.db'
+BAR_SECONDS = {"1m": 60, "3m": 180, "5m": 300, "15m": 900, "1H": 3600, "4H": 14400, "1D": 86400}
+PERIODS = ["1m", "3m", "5m", "15m", "1H", "4H", "1D"]
+ROUND_SEC = int(os.environ.get("COLLECT_ROUND_SEC", "60"))   # 每轮节拍（秒）
+GAP_DAYS = 2
+
+NEW_INST_LIMIT = 100   # 没有高水位的新合约首拉根数
+MAX_INCR_LIMIT = 300   # 单次增量拉取上限（更大的空档交给缺口补采）
+
+def load_kline_hwm(bar):
+    """一次读出该周期所有 instId 的高水位 {instId: last_ts}；表为空时按 K 线表现有数据初始化"""
+    full_path = os.path.join(DB_DIR, f'kline_{bar}.db')
+    conn = connect_tuned(full_path, readonly=True)
+    try:
+        rows = conn.execute("SELECT instId, last_ts FROM kline_hwm").fetchall()
+        if not rows:
+            rows = conn.execute(f"SELECT instId, MAX(ts) FROM kline_{bar} GROUP BY instId").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    conn.close()
+    return {r[0]: r[1] for r in rows if r[1] is not None}
+
+def update_kline_hwm(instId, bar, last_ts):
+    full_path = os.path.join(DB_DIR, f'kline_{bar}.db')
+    get_writer(full_path).submit('''
+        INSERT INTO kline_hwm (instId, last_ts, fetched_at) VALUES (?, ?, ?)
+        ON CONFLICT(instId) DO UPDATE SET
+            last_ts=MAX(excluded.last_ts, IFNULL(kline_hwm.last_ts, 0)),
+            fetched_at=excluded.fetched_at
+    ''', [(instId, int(last_ts), int(time.time()))])
+
+def incremental_kline_limit(bar, last_ts, now=None):
+    """
+    根据高水位决定本轮要拉多少根；返回 0 表示本周期还没有新K线可拉，直接跳过。
+    拉取范围包含 last_ts 那根，用来把上次采到的未收盘K线刷新成收盘值。
+    """
+    if last_ts is None:
+        return NEW_INST_LIMIT
+    bar_sec = BAR_SECONDS.get(bar, 60)
+    now = int(now or time.time())
+    n_new = (now - last_ts) // bar_sec   # last_ts 之后已开盘的K线根数
+    if n_new <= 0:
+        return 0
+    return min(MAX_INCR_LIMIT, n_new + 1)
+
+GAP_MAX_RANGES = 5    # 每个 instId×周期 每轮最多补几段缺口
+GAP_MAX_TRIES = 3     # 同一缺口连续几次拉不到数据，视为交易所侧本就缺失
+
+def load_kline_watermarks(bar):
+    """一次读出该周期所有 instId 的水位: {instId: (verified_ts, gap_ts, gap_tries)}"""
+    full_path = os.path.join(DB_DIR, f'kline_{bar}.db')
+    conn = connect_tuned(full_path, readonly=True)
+    try:
+        rows = conn.execute("SELECT instId, verified_ts, gap_ts, IFNULL(gap_tries,0) FROM kline_watermark").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    conn.close()
+    return {r[0]: (r[1] or 0, r[2], r[3]) for r in rows}
+
+def find_kline_gap_ranges(instId, bar, since_ts, now=None):
+    """
+    一条窗口函数 SQL 找出 since_ts 之后的连续缺失区间。
+    返回 (ranges, last_closed_ts)：ranges=[(首根缺失ts, 末根缺失ts)]，均为已收盘K线
+    """
     tablename = f'kline_{bar}'
-    full_path = os.path.join(DB_DIR, dbfile)
-    now = int(time.time())
+    full_path = os.path.join(DB_DIR, f'kline_{bar}.db')
+    bar_sec = BAR_SECONDS.get(bar, 60)
+    now = int(now or time.time())
+    conn = connect_tuned(full_path, readonly=True)
+    try:
+        holes = conn.execute(f"""
+            SELECT prev_ts, ts FROM (
+                SELECT ts, LAG(ts) OVER (ORDER BY ts) AS prev_ts
+                  FROM {tablename} WHERE instId=? AND ts>=?
+            ) WHERE prev_ts IS NULL OR ts - prev_ts > ?
+        """, (instId, since_ts, bar_sec)).fetchall()
+        last_ts = conn.execute(f"SELECT MAX(ts) FROM {tablename} WHERE instId=?", (instId,)).fetchone()[0]
+    finally:
+        conn.close()
+    if last_ts is None:
+        return [], None
+
+    # 当前未收盘那根的开盘时间（1D 等周期的相位以库内时间戳为准）
+    cur_open = last_ts + (now - last_ts) // bar_sec * bar_sec
+    last_closed = cur_open - bar_sec
+    ranges = []
+    for prev_ts, ts in holes:
+        if prev_ts is None:
+            # 窗口内第一根之前：since 对齐到同相位后仍有空档才算缺口
+            first_need = ts - (ts - since_ts) // bar_sec * bar_sec
+            if first_need < ts:
+                ranges.append((first_need, ts - bar_sec))
+        else:
+            ranges.append((prev_ts + bar_sec, ts - bar_sec))
+    if last_closed > last_ts:
+        ranges.append((max(last_ts + bar_sec, since_ts), last_closed))
+    return ranges, min(last_ts, last_closed)
+
+def plan_gap_fills(instId, bar, watermark, days=2, now=None):
+    """根据水位决定扫描起点，返回 (ranges, last_closed_ts)"""
+    now = int(now or time.time())
     begin_ts = now - days * 86400
-    conn = sqlite3.connect(full_path)
-    c = conn.cursor()
-    c.execute(f"SELECT ts FROM {tablename} WHERE instId=? AND ts>=? ORDER BY ts", (instId, begin_ts))
-    rows = c.fetchall()
-    conn.close()
-    ts_set = set([r[0] for r in rows])
-    bar_sec = {"1m": 60, "3m":180, "5m":300, "15m":900, "1H":3600, "4H":14400, "1D":86400}.get(bar, 60)
-    miss_ts = []
-    for t in range(begin_ts, now, bar_sec):
-        if t not in ts_set:
-            miss_ts.append(t)
-    if miss_ts:
-        print(f"{FAILED_COLOR}[闭环][{instId}][{bar}] 检测到{len(miss_ts)}个缺口，自动补齐...{RESET_COLOR}")
-        for t in miss_ts[:max_gap]:
-            try:
-                klines = safe_request(trader.get_kline, 5, instId, bar=bar, limit=1, after=t*1000)
-                if klines:
-                    save_kline_to_db(instId, bar, klines)
-            except Exception as e:
-                print(f"{FAILED_COLOR}[闭环补采][{instId}][{bar}][{t}]异常: {e}{RESET_COLOR}")
-        print(f"{OK_COLOR}[闭环][{instId}][{bar}] 缺口已尝试补齐{RESET_COLOR}")
-    else:
+    verified_ts = (watermark or (0, None, 0))[0]
+    return find_kline_gap_ranges(instId, bar, max(begin_ts, verified_ts), now=now)
+
+def settle_watermark(instId, bar, watermark, ranges, results, last_closed):
+    """
+    按补采结果推进水位：
+      - 整段补齐 / 同一缺口多次正常应答但为空（交易所本就缺失）→ 视为已校验
+      - 只补到一部分（翻页到上限等）→ 水位停在该缺口之前，下轮对剩下的缺口重新检测
+      - 拉空次数未到上限 / 请求失败 / 超出本轮配额未提交 → 水位停在该缺口之前，下轮重试
+    results: {range_start: 补到的根数}，只记 strict 拉取正常返回的区间；失败的区间不在里面
+    """
+    bar_sec = BAR_SECONDS.get(bar, 60)
+    _, gap_ts, gap_tries = watermark or (0, None, 0)
+    verified = last_closed
+    new_gap_ts, new_tries = None, 0
+    for a, b in ranges:
+        if a not in results:
+            verified = a - bar_sec
+            break
+        if results[a] >= (b - a) // bar_sec + 1:
+            continue
+        if results[a] > 0:
+            verified = a - bar_sec
+            break
+        tries = (gap_tries + 1) if gap_ts == a else 1
+        if tries >= GAP_MAX_TRIES:
+            continue
+        verified, new_gap_ts, new_tries = a - bar_sec, a, tries
+        break
+    full_path = os.path.join(DB_DIR, f'kline_{bar}.db')
+    get_writer(full_path).submit('''
+        INSERT OR REPLACE INTO kline_watermark (instId, verified_ts, gap_ts, gap_tries)
+        VALUES (?, ?, ?, ?)
+    ''', [(instId, verified, new_gap_ts, new_tries)])
+    return verified
+
+def check_and_fill_kline_gap(trader, instId, bar, days=2, max_gap=GAP_MAX_RANGES):
+    """同步版闭环补采（单 instId×周期），主循环里走引擎并发版本"""
+    wm = load_kline_watermarks(bar).get(instId)
+    ranges, last_closed = plan_gap_fills(instId, bar, wm, days=days)
+    if last_closed is None:
+        return
+    if not ranges:
+        settle_watermark(instId, bar, wm, [], {}, last_closed)
         print(f"{OK_COLOR}[闭环][{instId}][{bar}]无缺口，健康{RESET_COLOR}")
+        return
+    print(f"{FAILED_COLOR}[闭环][{instId}][{bar}] 检测到{len(ranges)}段缺口，自动补齐...{RESET_COLOR}")
+    results = {}
+    for a, b in ranges[:max_gap]:
+        try:
+            rows = trader.get_kline_range(instId, bar=bar, start_ts=a, end_ts=b, limit_per_page=300, strict=True)
+            save_kline_rows(instId, bar, rows)
+            results[a] = len(rows)
+        except Exception as e:
+            print(f"{FAILED_COLOR}[闭环补采][{instId}][{bar}][{a}-{b}]异常: {e}{RESET_COLOR}")
+    settle_watermark(instId, bar, wm, ranges, results, last_closed)
+    print(f"{OK_COLOR}[闭环][{instId}][{bar}] 缺口已尝试补齐{RESET_COLOR}")
+
+def _rotate(items, cursor, n):
+    """从 cursor 开始取 n 个（环形），返回 (切片, 新游标)；用于低配额端点分摊到多轮"""
+    if not items:
+        return [], 0
+    n = min(n, len(items))
+    cursor %= len(items)
+    out = (items[cursor:] + items[:cursor])[:n]
+    return out, (cursor + n) % len(items)
+
+def submit_round(engine, trader, all_inst_ids, cursors, hwms):
+    """把一轮所有采集任务投进引擎；K线按高水位增量拉取，低配额端点按本轮可用配额轮转覆盖"""
+    now = int(time.time())
+    skipped = 0
+    for instId in all_inst_ids:
+        for bar in PERIODS:
+            limit = incremental_kline_limit(bar, hwms[bar].get(instId), now=now)
+            if limit <= 0:
+                skipped += 1
+                continue
+            engine.submit("candles", trader.get_kline, instId, bar=bar, limit=limit, tag=("kline", instId, bar))
+        engine.submit("books", trader.get_orderbook, instId, tag=("ob", instId))
+        engine.submit("trades", trader.get_trades, instId, limit=50, tag=("trades", instId))
+    budget_sec = ROUND_SEC * 0.8
+    for ep, kind, func, kwargs in [
+        ("funding", "fund", trader.get_funding_rate, {}),
+        ("lsr", "lsr", trader.get_long_short_ratio, {}),
+        ("liquidation", "liq", trader.get_liquidation, {"limit": 20}),
+    ]:
+        part, cursors[ep] = _rotate(all_inst_ids, cursors.get(ep, 0), engine.round_capacity(ep, budget_sec))
+        for instId in part:
+            engine.submit(ep, func, instId, tag=(kind, instId), **kwargs)
+    return skipped
 
 def main():
     print("===== 超级多源行情采集器启动（K线/盘口/资金/爆仓/多空/费率 全闭环） =====")
     ensure_dir(DB_DIR)
     ensure_all_tables()
     trader = OKXTrader()
-    periods = ["1m", "3m", "5m", "15m", "1H", "4H", "1D"]
+    engine = CollectEngine(retries=0)  # 重试交给 trader 的统一退避策略，避免两层叠加
+    cursors = {}
     round_count = 0
 
     while True:
         round_count += 1
-        insts = trader.get_all_instruments("SWAP")
-        all_inst_ids = [x['instId'] for x in insts]  # <== 恢复全币种
+        all_inst_ids = trader.instruments.inst_ids()  # <== 恢复全币种（注册表按 TTL 刷新，不再每轮全量下载）
         print(f"\n采集轮次: {round_count}，合约品种: 共{len(all_inst_ids)}个")
 
-        n_kline, n_ob, n_trades, n_fund, n_lsr, n_liq, n_fail = 0,0,0,0,0,0,0
+        n = {"kline": 0, "ob": 0, "trades": 0, "fund": 0, "lsr": 0, "liq": 0, "fail": 0}
+        gap_checks = []
+        gap_plans = {}
         t0 = time.time()
+        hwms = {bar: load_kline_hwm(bar) for bar in PERIODS}
+        n["skip"] = submit_round(engine, trader, all_inst_ids, cursors, hwms)
 
-        for instId in all_inst_ids:
-            # K线
-            for bar in periods:
+        # 网络请求在引擎线程池里并发；入库交给各库的批量写线程
+        def drain():
+            for tag, data, err in engine.results():
+                kind, instId = tag[0], tag[1]
+                if err is not None:
+                    print(f"{FAILED_COLOR}[{kind.upper()}]{instId} 采集异常: {err}{RESET_COLOR}")
+                    n["fail"] += 1
+                    continue
                 try:
-                    klines = safe_request(trader.get_kline, 5, instId, bar=bar, limit=100)
-                    if klines:
-                        save_kline_to_db(instId, bar, klines)
-                        n_kline += len(klines)
-                    check_and_fill_kline_gap(trader, instId, bar, days=2, max_gap=15)
+                    if kind == "kline":
+                        bar = tag[2]
+                        if data:
+                            last_ts = save_kline_to_db(instId, bar, data, replace=True)
+                            if last_ts is not None:
+                                update_kline_hwm(instId, bar, last_ts)
+                            n["kline"] += len(data)
+                            engine.add_rows("candles", len(data))
+                        gap_checks.append((instId, bar))
+                    elif kind == "gap":
+                        bar, a = tag[2], tag[3]
+                        save_kline_rows(instId, bar, data or [])
+                        n["kline"] += len(data or [])
+                        engine.add_rows("candles", len(data or []))
+                        gap_plans[(instId, bar)][3][a] = len(data or [])
+                    elif kind == "ob":
+                        if data:
+                            save_orderbook_to_db(instId, data)
+                            n["ob"] += 1
+                            engine.add_rows("books", 1)
+                    elif kind == "trades":
+                        if data:
+                            save_trades_to_db(instId, data)
+                            n["trades"] += len(data)
+                            engine.add_rows("trades", len(data))
+                    elif kind == "fund":
+                        if data and isinstance(data, dict) and data.get("fundingRate") is not None:
+                            save_funding_rate(instId, data)
+                            n["fund"] += 1
+                            engine.add_rows("funding", 1)
+                    elif kind == "lsr":
+                        if data and isinstance(data, list) and len(data) > 0:
+                            save_long_short_ratio(instId, data)
+                            n["lsr"] += 1
+                            engine.add_rows("lsr", 1)
+                    elif kind == "liq":
+                        if data:
+                            save_liquidation_to_db(instId, data)
+                            n["liq"] += len(data)
+                            engine.add_rows("liquidation", len(data))
                 except Exception as e:
-                    print(f"{FAILED_COLOR}[KLINE][{bar}] {instId} 采集异常: {e}{RESET_COLOR}")
-                    n_fail += 1
-                time.sleep(0.07)
-            # 盘口
-            try:
-                ob = safe_request(trader.get_orderbook, 3, instId)
-                if ob:
-                    save_orderbook_to_db(instId, ob)
-                    n_ob += 1
-            except Exception as e:
-                print(f"{FAILED_COLOR}[ORDERBOOK]{instId}采集异常:{e}{RESET_COLOR}")
-                n_fail += 1
-            # 逐笔成交
-            try:
-                trades = safe_request(trader.get_trades, 3, instId, limit=50)
-                if trades:
-                    save_trades_to_db(instId, trades)
-                    n_trades += len(trades)
-            except Exception as e:
-                print(f"{FAILED_COLOR}[TRADES]{instId}采集异常:{e}{RESET_COLOR}")
-                n_fail += 1
-            # 资金费率
-            try:
-                fund = trader.get_funding_rate(instId)
-                if fund and fund.get("fundingRate") is not None:
-                    save_funding_rate(instId, fund)
-                    n_fund += 1
-            except Exception as e:
-                print(f"{FAILED_COLOR}[FUND]{instId}采集异常:{e}{RESET_COLOR}")
-                n_fail += 1
-            # 多空比
-            try:
-                lsr = trader.get_long_short_ratio(instId)
-                if lsr and isinstance(lsr, list) and len(lsr) > 0:
-                    save_long_short_ratio(instId, lsr)
-                    n_lsr += 1
-            except Exception as e:
-                print(f"{FAILED_COLOR}[LSR]{instId}采集异常:{e}{RESET_COLOR}")
-                n_fail += 1
-            # 爆仓榜
-            try:
-                liq = trader.get_liquidation(instId, limit=20)
-                if liq:
-                    save_liquidation_to_db(instId, liq)
-                    n_liq += len(liq)
-            except Exception as e:
-                print(f"{FAILED_COLOR}[LIQ]{instId}采集异常:{e}{RESET_COLOR}")
-                n_fail += 1
-
-        print(f"\n本轮采集完成，K线:{n_kline}，盘口:{n_ob}，成交:{n_trades}，资金费率:{n_fund}，多空比:{n_lsr}，爆仓:{n_liq}，异常:{n_fail}，耗时:{int(time.time()-t0)}秒")
-        print("休息60秒 ...")
-        time.sleep(60)
+                    print(f"{FAILED_COLOR}[{kind.upper()}]{instId} 入库异常: {e}{RESET_COLOR}")
+                    n["fail"] += 1
+
+        drain()
+        # 缺口检测要读到本轮刚写的K线，先把写队列刷盘
+        flush_all()
+        watermarks = {bar: load_kline_watermarks(bar) for bar in PERIODS}
+        for instId, bar in gap_checks:
+            wm = watermarks[bar].get(instId)
+            ranges, last_closed = plan_gap_fills(instId, bar, wm, days=GAP_DAYS)
+            if last_closed is None:
+                continue
+            gap_plans[(instId, bar)] = (wm, ranges, last_closed, {})
+            if ranges:
+                n_miss = sum((b - a) // BAR_SECONDS.get(bar, 60) + 1 for a, b in ranges)
+                print(f"{FAILED_COLOR}[闭环][{instId}][{bar}] 检测到{len(ranges)}段缺口/{n_miss}根，分页补齐...{RESET_COLOR}")
+            for a, b in ranges[:GAP_MAX_RANGES]:
+                engine.submit("candles", trader.get_kline_range, instId, bar=bar, start_ts=a, end_ts=b,
+                              limit_per_page=300, strict=True, tag=("gap", instId, bar, a))
+        drain()
+        for (instId, bar), (wm, ranges, last_closed, results) in gap_plans.items():
+            settle_watermark(instId, bar, wm, ranges, results, last_closed)
+        flush_all()
+
+        cost = time.time() - t0
+        print(f"\n本轮采集完成，K线:{n['kline']}（未到新K线跳过:{n['skip']}），盘口:{n['ob']}，成交:{n['trades']}，资金费率:{n['fund']}，多空比:{n['lsr']}，爆仓:{n['liq']}，异常:{n['fail']}，耗时:{int(cost)}秒")
+        print(format_round_stats(engine.finish_round()))
+        print(trader.format_http_stats(reset=True))
+        rest = max(0.0, ROUND_SEC - cost)
+        print(f"休息{int(rest)}秒 ...")
+        time.sleep(rest)
 
 if __name__ == "__main__":
     main()
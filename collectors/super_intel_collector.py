@@ -139,8 +139,7 @@ def main():
     ensure_tables()
     trader = OKXTrader()
 
-    insts = trader.get_all_instruments("SWAP")
-    inst_ids = [x['instId'] for x in insts]  # <=== 全币种，不再用focus_symbols
+    inst_ids = trader.instruments.inst_ids()  # <=== 全币种，不再用focus_symbols
 
     while True:
         fetch_and_save_leaderboard(trader)
@@ -0,0 +1,281 @@
+# collectors/ws_collector.py
+"""
+WebSocket 流式行情采集（替代 REST 轮询的 K线/盘口/成交/资金费率/爆仓）
+
+- 业务通道订阅 candle{bar}；公共通道订阅 books5 / trades / funding-rate / liquidation-orders
+- 入库复用 super_collector 的 save_*（批量写线程），K线同步推进高水位 kline_hwm
+- 缺口检测：
+    K线   新一根 ts 跳过了若干根 → REST get_kline_range 补齐
+    成交  tradeId 不连续（按 count 聚合推进）→ REST get_trades 补一页
+    盘口  prevSeqId 对不上 → REST get_orderbook 取快照
+  断线重连后第一条推送同样走上述检测，断线期间的数据会被补回
+- --record 把收到的原始推送录成 JSONL，交给 tools/ws_replay_server.py 回放
+- 盘口每帧 / 成交 / 爆仓 / 资金费率同时喂给 strategy/micro_signals（盘口失衡、大单、爆仓、资金费率信号），
+  MICRO_SIGNALS=0 关闭
+
+用法：
+  python -m collectors.ws_collector                 # 全部 SWAP
+  python -m collectors.ws_collector --focus         # 只跑 focus_symbols.json
+  python -m collectors.ws_collector --record data/ws_frames.jsonl
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core.okx_trader import OKXTrader
+from core.okx_ws import OkxWsClient, OKX_WS_PUBLIC, OKX_WS_BUSINESS
+from collectors.collect_engine import TokenBucket
+from collectors.super_collector import (
+    BAR_SECONDS, PERIODS, FAILED_COLOR, OK_COLOR, RESET_COLOR,
+    ensure_dir, ensure_all_tables, load_focus_symbols,
+    save_kline_to_db, save_kline_rows, update_kline_hwm, load_kline_hwm,
+    save_orderbook_to_db, save_trades_to_db, save_funding_rate, save_liquidation_to_db,
+)
+from utils.config import DB_DIR
+from utils.db_writer import flush_all
+from strategy.micro_signals import MicroDetector, MICRO_ENABLED
+
+STATS_SEC = int(os.environ.get("WS_STATS_SEC", "60"))
+BACKFILL_WORKERS = int(os.environ.get("WS_BACKFILL_WORKERS", "4"))
+BACKFILL_RATE = float(os.environ.get("WS_BACKFILL_RATE", "10"))  # 补采 REST 次/秒
+
+
+class WsCollector:
+    def __init__(self, trader, inst_ids, bars=PERIODS, public_url=OKX_WS_PUBLIC,
+                 business_url=OKX_WS_BUSINESS, record=None):
+        self.trader = trader
+        self.inst_ids = list(inst_ids)
+        self.bars = list(bars)
+        self.public = OkxWsClient(public_url, self._on_public, on_open=self._on_open, name="public")
+        self.business = OkxWsClient(business_url, self._on_business, on_open=self._on_open, name="business")
+        self.last_candle = {}    # (instId, bar) -> ts 秒
+        self.last_trade = {}     # instId -> 下一条期望 tradeId
+        self.last_seq = {}       # instId -> seqId
+        self.last_book_sec = {}  # instId -> 最近一次落库的秒级 ts（盘口按秒降采样）
+        self.state_lock = threading.Lock()
+        self.backfill_pool = ThreadPoolExecutor(max_workers=BACKFILL_WORKERS, thread_name_prefix="ws-backfill")
+        self.backfill_bucket = TokenBucket(BACKFILL_RATE, 1.0)
+        self.stats = {"candle": 0, "books": 0, "trades": 0, "funding": 0, "liq": 0,
+                      "gap_candle": 0, "gap_trades": 0, "gap_books": 0, "backfill_rows": 0}
+        self.stats_lock = threading.Lock()
+        self._record_lock = threading.Lock()
+        self._record = open(record, "a", encoding="utf-8") if record else None
+        self._t0 = time.time()
+        self.micro = MicroDetector(ct_val=lambda i: trader.instruments.meta(i)["ctVal"]) if MICRO_ENABLED else None
+
+    # ---------- 订阅 ----------
+    def start(self):
+        # 以库内高水位作为 K 线连续性的起点，断档重启后首条推送即可触发补采
+        for bar in self.bars:
+            for instId, ts in load_kline_hwm(bar).items():
+                self.last_candle[(instId, bar)] = ts
+        self.business.subscribe([{"channel": f"candle{bar}", "instId": i} for i in self.inst_ids for bar in self.bars])
+        pub = []
+        for i in self.inst_ids:
+            pub += [{"channel": "books5", "instId": i},
+                    {"channel": "trades", "instId": i},
+                    {"channel": "funding-rate", "instId": i}]
+        pub.append({"channel": "liquidation-orders", "instType": "SWAP"})
+        pub.append({"channel": "instruments", "instType": "SWAP"})  # 上新/下线/规格变更推送
+        self.public.subscribe(pub)
+        self.business.start()
+        self.public.start()
+        return self
+
+    def stop(self):
+        self.public.stop()
+        self.business.stop()
+        self.backfill_pool.shutdown(wait=True)
+        flush_all()
+        if self._record:
+            self._record.close()
+
+    def _on_open(self, reconnected):
+        if reconnected:
+            # 盘口是快照，重连后重新对齐序号即可；K线/成交在首条推送时按连续性补采
+            with self.state_lock:
+                self.last_seq.clear()
+
+    def _bump(self, key, n=1):
+        with self.stats_lock:
+            self.stats[key] += n
+
+    def _rec(self, kind, msg):
+        if self._record:
+            line = json.dumps({"t": round(time.time() - self._t0, 3), "kind": kind, "msg": msg},
+                              ensure_ascii=False, separators=(',', ':'))
+            with self._record_lock:
+                self._record.write(line + "\n")
+
+    # ---------- 补采 ----------
+    def _backfill(self, fn, *args):
+        def run():
+            self.backfill_bucket.acquire()
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"{FAILED_COLOR}[WS补采] {fn.__name__}{args} 异常: {e}{RESET_COLOR}")
+        self.backfill_pool.submit(run)
+
+    def _fill_candles(self, instId, bar, start_ts, end_ts):
+        rows = self.trader.get_kline_range(instId, bar=bar, start_ts=start_ts, end_ts=end_ts, limit_per_page=300)
+        if rows:
+            save_kline_rows(instId, bar, rows)
+            update_kline_hwm(instId, bar, rows[-1][0])
+            self._bump("backfill_rows", len(rows))
+
+    def _fill_trades(self, instId):
+        rows = self.trader.get_trades(instId, limit=500)
+        if rows:
+            save_trades_to_db(instId, rows)
+            self._bump("backfill_rows", len(rows))
+
+    def _fill_book(self, instId):
+        ob = self.trader.get_orderbook(instId)
+        if ob:
+            save_orderbook_to_db(instId, ob)
+            self._bump("backfill_rows", 1)
+
+    # ---------- 推送处理 ----------
+    def _on_business(self, arg, data, msg):
+        self._rec("business", msg)
+        ch = arg.get("channel", "")
+        if not ch.startswith("candle"):
+            return
+        bar, instId = ch[len("candle"):], arg.get("instId")
+        bar_sec = BAR_SECONDS.get(bar, 60)
+        for item in data:
+            try:
+                ts = int(item[0]) // 1000
+            except Exception:
+                continue
+            with self.state_lock:
+                prev = self.last_candle.get((instId, bar))
+                if prev is None or ts > prev:
+                    self.last_candle[(instId, bar)] = ts
+            if prev is not None and ts - prev > bar_sec:
+                self._bump("gap_candle")
+                self._backfill(self._fill_candles, instId, bar, prev + bar_sec, ts - bar_sec)
+            save_kline_to_db(instId, bar, [item], replace=True)
+            update_kline_hwm(instId, bar, ts)
+            self._bump("candle")
+
+    def _on_public(self, arg, data, msg):
+        self._rec("public", msg)
+        ch = arg.get("channel")
+        if ch == "books5":
+            self._on_books(arg.get("instId"), data)
+        elif ch == "trades":
+            self._on_trades(arg.get("instId"), data)
+        elif ch == "funding-rate":
+            for d in data:
+                save_funding_rate(d.get("instId") or arg.get("instId"), d)
+                self._bump("funding")
+                if self.micro:
+                    self.micro.on_funding(d.get("instId") or arg.get("instId"), d)
+        elif ch == "instruments":
+            self.trader.instruments.apply(data)
+        elif ch == "liquidation-orders":
+            rows = []
+            for d in data:
+                for x in d.get("details") or []:
+                    rows.append({"instId": d.get("instId"), "ts": x.get("ts"),
+                                 "px": x.get("bkPx"), "sz": x.get("sz"), "side": x.get("side")})
+            if rows:
+                save_liquidation_to_db(None, rows)
+                self._bump("liq", len(rows))
+                if self.micro:
+                    self.micro.on_liquidation(rows)
+
+    def _on_books(self, instId, data):
+        if self.micro:
+            self.micro.on_books(instId, data)   # 信号用每一帧，落库仍按秒降采样
+        for d in data:
+            seq, prev_seq = d.get("seqId"), d.get("prevSeqId")
+            with self.state_lock:
+                last = self.last_seq.get(instId)
+                if seq is not None:
+                    self.last_seq[instId] = seq
+            if last is not None and prev_seq is not None and int(prev_seq) != -1 and int(prev_seq) != int(last):
+                self._bump("gap_books")
+                self._backfill(self._fill_book, instId)
+            sec = int(d.get("ts", 0)) // 1000
+            if self.last_book_sec.get(instId) == sec:
+                continue  # 表主键是 (instId, 秒)，同一秒只落第一帧
+            self.last_book_sec[instId] = sec
+            save_orderbook_to_db(instId, [d])
+            self._bump("books")
+
+    def _on_trades(self, instId, data):
+        gap = False
+        for t in data:
+            try:
+                tid = int(t.get("tradeId"))
+                cnt = int(t.get("count") or 1)
+            except Exception:
+                continue
+            with self.state_lock:
+                expect = self.last_trade.get(instId)
+                if expect is None or tid + cnt > expect:
+                    self.last_trade[instId] = tid + cnt
+            if expect is not None and tid > expect:
+                gap = True
+        if gap:
+            self._bump("gap_trades")
+            self._backfill(self._fill_trades, instId)
+        save_trades_to_db(instId, data)
+        self._bump("trades", len(data))
+        if self.micro:
+            self.micro.on_trades(instId, data)
+
+    # ---------- 统计 ----------
+    def report(self):
+        with self.stats_lock:
+            st = dict(self.stats)
+            for k in self.stats:
+                self.stats[k] = 0
+        print(f"{OK_COLOR}[WS采集] K线:{st['candle']} 盘口:{st['books']} 成交:{st['trades']} "
+              f"资金费率:{st['funding']} 爆仓:{st['liq']} | 缺口 K线:{st['gap_candle']} "
+              f"成交:{st['gap_trades']} 盘口:{st['gap_books']} 补采行:{st['backfill_rows']} | "
+              f"重连 pub:{self.public.stats['connects']} biz:{self.business.stats['connects']}{RESET_COLOR}")
+        if self.micro:
+            self.micro.report()
+        return st
+
+
+def main():
+    ap = argparse.ArgumentParser(description="OKX WebSocket 流式行情采集")
+    ap.add_argument("--focus", action="store_true", help="只订阅 focus_symbols.json 里的合约")
+    ap.add_argument("--bars", default=",".join(PERIODS), help="K线周期，逗号分隔")
+    ap.add_argument("--record", default=None, help="把原始推送录成 JSONL")
+    ap.add_argument("--duration", type=float, default=0, help="运行秒数，0=一直运行")
+    args = ap.parse_args()
+
+    print("===== WebSocket 流式行情采集器启动 =====")
+    ensure_dir(DB_DIR)
+    ensure_all_tables()
+    trader = OKXTrader()
+    if args.focus:
+        inst_ids = load_focus_symbols()
+    else:
+        inst_ids = trader.instruments.inst_ids()
+    bars = [b for b in args.bars.split(",") if b]
+    print(f"订阅合约 {len(inst_ids)} 个，周期 {bars}")
+
+    wc = WsCollector(trader, inst_ids, bars=bars, record=args.record).start()
+    t_end = time.time() + args.duration if args.duration else None
+    try:
+        while t_end is None or time.time() < t_end:
+            time.sleep(STATS_SEC if t_end is None else min(STATS_SEC, max(0.1, t_end - time.time())))
+            wc.report()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        wc.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# core/dispatcher.py
+"""
+信号并发分发：同一 instId 严格 FIFO，不同 instId 并行
+
+- 每个 instId 一条队列（lane），同一时刻最多一个 worker 处理某个 lane，
+  前一个信号处理完（下单已回报）才取下一个，保证同币种先来先下
+- 固定数量 worker 线程，一个慢币种只占住一个 worker，不会拖住其它币种
+- BudgetLedger：并发下单共享同一个预算池，预留制，不会超过 total_pool
+- stats() 给出排队深度、在途数、处理耗时与信号→回报延迟的 p50 / p99
+"""
+import time
+import queue
+import threading
+from collections import deque
+
+LATENCY_WINDOW = 1000
+
+
+def _pct(vals, q):
+    if not vals:
+        return None
+    vals = sorted(vals)
+    return round(vals[min(len(vals) - 1, int(len(vals) * q))], 1)
+
+
+class BudgetLedger:
+    """
+    预算账本：refresh(total) 以最新余额重置上限；reserve() 预留，失败时 release() 归还，
+    下单被交易所受理后 commit()。已受理的预留保持到下一次 refresh —— 届时余额里已扣掉这部分保证金；
+    只清掉 as_of（本次查余额的开始时间）之前已受理的预留，还没发出去的单仍然占额度。
+    """
+
+    def __init__(self, total=0.0):
+        self.total = float(total)
+        self.reservations = {}   # token -> [金额, 受理时间 或 None]
+        self._seq = 0
+        self.lock = threading.Lock()
+
+    def refresh(self, total, as_of=None):
+        as_of = time.time() if as_of is None else as_of
+        with self.lock:
+            self.total = float(total)
+            self.reservations = {k: v for k, v in self.reservations.items() if v[1] is None or v[1] >= as_of}
+
+    def available(self):
+        with self.lock:
+            return max(0.0, self.total - sum(a for a, _ in self.reservations.values()))
+
+    def reserve(self, want, minimum=0.0):
+        """预留 min(want, 剩余)；不足 minimum 返回 (None, 0)，否则返回 (token, 实际金额)"""
+        with self.lock:
+            left = self.total - sum(a for a, _ in self.reservations.values())
+            amount = min(float(want), left)
+            if amount <= 0 or amount < minimum:
+                return None, 0.0
+            self._seq += 1
+            self.reservations[self._seq] = [amount, None]
+            return self._seq, amount
+
+    def commit(self, token):
+        with self.lock:
+            r = self.reservations.get(token)
+            if r is not None:
+                r[1] = time.time()
+
+    def release(self, token):
+        with self.lock:
+            self.reservations.pop(token, None)
+
+
+class SignalDispatcher:
+    def __init__(self, handler, workers=4, key=lambda s: s["instId"], name="dispatch"):
+        """
+        handler(item) 处理单个信号，返回即视为已回报（可返回 dict，被忽略）
+        item 需带 "id"；可带 "t_pick"（取出时间），用于统计信号→回报延迟
+        """
+        self.handler = handler
+        self.key = key
+        self.lanes = {}            # instId -> deque[item]
+        self.active = set()        # 正在被 worker 处理的 instId
+        self.known = set()         # 已入队 / 在途的信号 id，防止轮询重复入队
+        self.ready = queue.Queue()
+        self.lock = threading.Lock()
+        self.latency = deque(maxlen=LATENCY_WINDOW)   # 信号取出 → 回报
+        self.service = deque(maxlen=LATENCY_WINDOW)   # handler 耗时
+        self.counts = {"submitted": 0, "done": 0, "failed": 0, "dup": 0}
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True)
+                         for i in range(max(1, int(workers)))]
+        for th in self._threads:
+            th.start()
+
+    # ---------- 生产者 ----------
+    def submit(self, item):
+        """入队；同一信号 id 在处理完之前重复提交会被忽略，返回是否入队"""
+        k = self.key(item)
+        item.setdefault("t_pick", time.time())
+        with self.lock:
+            if item["id"] in self.known:
+                self.counts["dup"] += 1
+                return False
+            self.known.add(item["id"])
+            self.counts["submitted"] += 1
+            self.lanes.setdefault(k, deque()).append(item)
+            if k not in self.active:
+                self.active.add(k)
+                self.ready.put(k)
+        return True
+
+    def depth(self):
+        with self.lock:
+            return sum(len(q) for q in self.lanes.values())
+
+    def pending_ids(self):
+        """排队中 + 处理中的信号 id（续租用）"""
+        with self.lock:
+            return list(self.known)
+
+    # ---------- worker ----------
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                k = self.ready.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with self.lock:
+                lane = self.lanes.get(k)
+                item = lane.popleft() if lane else None
+            if item is not None:
+                t0 = time.time()
+                try:
+                    self.handler(item)
+                    ok = True
+                except Exception as e:
+                    ok = False
+                    print(f"[dispatch] {k} 信号 {item.get('id')} 处理异常: {e}")
+                t1 = time.time()
+                with self.lock:
+                    self.counts["done" if ok else "failed"] += 1
+                    self.service.append((t1 - t0) * 1000)
+                    self.latency.append((t1 - item["t_pick"]) * 1000)
+                    self.known.discard(item["id"])
+            with self.lock:
+                # lane 还有就重新排队（排到其它 instId 后面，避免一个币种霸占 worker）
+                if self.lanes.get(k):
+                    self.ready.put(k)
+                else:
+                    self.lanes.pop(k, None)
+                    self.active.discard(k)
+
+    def stop(self, wait=True):
+        self._stop.set()
+        if wait:
+            for th in self._threads:
+                th.join(timeout=5)
+
+    # ---------- 统计 ----------
+    def stats(self):
+        with self.lock:
+            lat, svc = list(self.latency), list(self.service)
+            return {
+                "depth": sum(len(q) for q in self.lanes.values()),
+                "lanes": len(self.active),
+                **self.counts,
+                "ack_p50_ms": _pct(lat, 0.5), "ack_p99_ms": _pct(lat, 0.99),
+                "svc_p50_ms": _pct(svc, 0.5), "svc_p99_ms": _pct(svc, 0.99),
+            }
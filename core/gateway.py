@@ -25,6 +25,10 @@ class OkxGateway:
     def cancel_all(self, instId: str, tdMode: str = "cross") -> List[Dict[str, Any]]:
         return self.t.cancel_all_orders(instId, tdMode=tdMode)
 
+    def cancel_batch(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """items: [{"instId", "ordId" 或 "clOrdId"}]，可跨合约；返回逐笔结果（sCode=="0" 成功）"""
+        return self.t.cancel_orders_batch(items)
+
     # —— 下单封装（支持 USDT 预算）—— #
     def _budget_to_size(self, instId: str, usdt: float, lev: int = 10) -> str:
         """
@@ -94,6 +98,41 @@ class OkxGateway:
             clOrdId=clOrdId
         )
 
+    def open_market_batch(self, orders: List[Dict[str, Any]], t_signal: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        批量市价单：orders 每项与 open_market 参数一致
+        {"instId", "side", "sz" 或 "usdt", "lev", "tdMode", "posSide", "tp", "sl", "reduceOnly", "clOrdId"}
+        每 20 笔一个请求；返回与 orders 一一对应的 {"instId", "clOrdId", "ordId", "sCode", "sMsg"}
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(orders)
+        batch, index = [], []
+        for i, o in enumerate(orders):
+            lev = int(o.get("lev", 10))
+            sz = o.get("sz")
+            try:
+                if (not sz) and (o.get("usdt") is not None):
+                    sz = self._budget_to_size(o["instId"], o["usdt"], lev=lev)
+            except Exception as e:
+                sz, err = None, str(e)
+            else:
+                err = f"计算得到的下单张数无效（instId={o['instId']}, sz={sz})"
+            if not sz or float(sz) <= 0:
+                results[i] = {"instId": o["instId"], "clOrdId": o.get("clOrdId") or "", "ordId": "",
+                              "sCode": "SIZE_ZERO", "sMsg": err}
+                continue
+            order = {
+                "instId": o["instId"], "side": o["side"], "sz": sz, "lever": lev,
+                "tdMode": o.get("tdMode", "cross"), "posSide": o.get("posSide"), "ordType": "market",
+                "tp": o.get("tp"), "sl": o.get("sl"), "reduceOnly": bool(o.get("reduceOnly")),
+            }
+            if o.get("clOrdId"):
+                order["clOrdId"] = o["clOrdId"]
+            batch.append(order)
+            index.append(i)
+        for i, r in zip(index, self.t.open_orders_batch(batch, t_signal=t_signal)):
+            results[i] = r
+        return results
+
     def set_tp_sl(
         self,
         instId: str,
@@ -0,0 +1,176 @@
+# core/instrument_registry.py
+"""
+合约元数据注册表（进程内共享，按 instType 一份）
+
+- 一次 /public/instruments 拉全量，按 instId 建字典，查询 O(1)
+- 落盘快照 data/shared/jsons/instruments_<instType>.json，重启即热，不必先打一次接口
+- 过期（INST_REGISTRY_TTL 秒）后下一次查询时刷新；查不到的 instId 视为可能新上线，
+  触发一次刷新（两次之间至少间隔 INST_REGISTRY_MISS_SEC 秒，避免被错误代码打爆）
+- apply(items) 接收 WS instruments 频道的增量推送，上下线即时生效
+- 刷新失败保留旧数据，不会因为一次网络抖动把全部合约清空
+
+用法：
+  reg = get_registry(trader.get_all_instruments, "SWAP")
+  reg.meta("BTC-USDT-SWAP")   # {"ctVal","lotSz","minSz","tickSz"} -> Decimal
+  reg.inst_ids()              # 全部 instId（保持交易所返回顺序）
+"""
+import os
+import json
+import time
+import threading
+from decimal import Decimal
+
+from utils.config import SHARED_JSON_DIR
+
+INST_TTL_SEC = float(os.environ.get("INST_REGISTRY_TTL", "3600"))
+INST_MISS_SEC = float(os.environ.get("INST_REGISTRY_MISS_SEC", "60"))
+
+META_DEFAULTS = {"ctVal": "1", "lotSz": "1", "minSz": "1", "tickSz": "0.01"}
+
+
+def _dec(x, default):
+    try:
+        return Decimal(str(x)) if x not in (None, "") else Decimal(default)
+    except Exception:
+        return Decimal(default)
+
+
+class InstrumentRegistry:
+    def __init__(self, fetch, instType="SWAP", ttl=INST_TTL_SEC, snapshot_path=None):
+        """fetch: 无参或接收 instType 的函数，返回交易所 instruments 列表"""
+        self.fetch = fetch
+        self.instType = instType
+        self.ttl = float(ttl)
+        self.snapshot_path = snapshot_path or (SHARED_JSON_DIR / f"instruments_{instType}.json")
+        self._items = {}
+        self._meta = {}
+        self.loaded_at = 0.0
+        self._last_miss_refresh = 0.0
+        self.lock = threading.RLock()
+        self.stats = {"refresh": 0, "refresh_fail": 0, "added": 0, "removed": 0}
+        self._load_snapshot()
+
+    # ---------- 快照 ----------
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+            items = snap.get("items") or []
+            with self.lock:
+                self._items = {x["instId"]: x for x in items if x.get("instId")}
+                self._meta = {}
+                self.loaded_at = float(snap.get("ts") or 0)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[WARN] 合约快照读取失败 {self.snapshot_path}: {e}")
+
+    def _save_snapshot(self):
+        try:
+            os.makedirs(os.path.dirname(str(self.snapshot_path)), exist_ok=True)
+            tmp = f"{self.snapshot_path}.tmp"
+            with self.lock:
+                snap = {"ts": self.loaded_at, "instType": self.instType, "items": list(self._items.values())}
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(snap, f, ensure_ascii=False)
+            os.replace(tmp, self.snapshot_path)
+        except Exception as e:
+            print(f"[WARN] 合约快照写入失败 {self.snapshot_path}: {e}")
+
+    # ---------- 刷新 ----------
+    def refresh(self):
+        """全量刷新，返回 (新增 instId 列表, 下线 instId 列表)；失败返回 None"""
+        try:
+            items = self.fetch(self.instType)
+        except Exception as e:
+            items = None
+            print(f"[WARN] 合约列表刷新失败: {e}")
+        if not items:
+            with self.lock:
+                self.stats["refresh_fail"] += 1
+            return None
+        new = {x["instId"]: x for x in items if x.get("instId")}
+        with self.lock:
+            added = [k for k in new if k not in self._items]
+            removed = [k for k in self._items if k not in new]
+            self._items = new
+            self._meta = {}
+            self.loaded_at = time.time()
+            self.stats["refresh"] += 1
+            self.stats["added"] += len(added)
+            self.stats["removed"] += len(removed)
+        self._save_snapshot()
+        if self.stats["refresh"] > 1 and (added or removed):
+            print(f"[合约] 上新 {len(added)} 个 {added[:5]}，下线 {len(removed)} 个 {removed[:5]}")
+        return added, removed
+
+    def apply(self, items):
+        """合并增量推送（WS instruments 频道）；state=expired 视为下线"""
+        changed = False
+        with self.lock:
+            for x in items or []:
+                instId = x.get("instId")
+                if not instId:
+                    continue
+                if x.get("state") == "expired":
+                    changed |= self._items.pop(instId, None) is not None
+                else:
+                    changed |= self._items.get(instId) != x
+                    self._items[instId] = x
+                self._meta.pop(instId, None)
+        if changed:
+            self._save_snapshot()
+        return changed
+
+    def _ensure(self):
+        if not self._items or time.time() - self.loaded_at > self.ttl:
+            self.refresh()
+
+    # ---------- 查询 ----------
+    def get(self, instId):
+        self._ensure()
+        item = self._items.get(instId)
+        if item is None and time.time() - self._last_miss_refresh > INST_MISS_SEC:
+            self._last_miss_refresh = time.time()
+            self.refresh()
+            item = self._items.get(instId)
+        return item
+
+    def meta(self, instId):
+        """返回 dict(ctVal, lotSz, minSz, tickSz) 都是 Decimal；查不到时给默认值"""
+        m = self._meta.get(instId)
+        if m is not None:
+            return m
+        item = self.get(instId) or {}
+        m = {k: _dec(item.get(k), d) for k, d in META_DEFAULTS.items()}
+        if item:
+            with self.lock:
+                self._meta[instId] = m
+        return m
+
+    def inst_ids(self, states=None):
+        """states: 只要某些状态（如 {"live"}），默认全部"""
+        self._ensure()
+        with self.lock:
+            return [k for k, x in self._items.items() if not states or x.get("state") in states]
+
+    def all(self):
+        self._ensure()
+        with self.lock:
+            return list(self._items.values())
+
+    def __len__(self):
+        return len(self._items)
+
+
+_REGISTRIES = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def get_registry(fetch, instType="SWAP"):
+    """进程内每个 instType 共享一个注册表；fetch 只在首次创建时生效"""
+    with _REGISTRIES_LOCK:
+        reg = _REGISTRIES.get(instType)
+        if reg is None:
+            reg = _REGISTRIES[instType] = InstrumentRegistry(fetch, instType)
+        return reg
@@ -7,6 +7,11 @@ import json
 import datetime
 import traceback
 import time
+import os
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP, ROUND_UP, getcontext
 getcontext().prec = 28
 from urllib.parse import urlencode
@@ -17,24 +22,261 @@ except Exception:
     import os, sys
     sys.path.append(os.path.dirname(os.path.dirname(__file__)))
     from utils.config import OKX_API_KEY, OKX_SECRET_KEY, OKX_PASSPHRASE
+from core.instrument_registry import get_registry
+
+# ================= HTTP 连接池 / 重试参数（环境变量可覆盖） =================
+HTTP_POOL_SIZE = int(os.environ.get("OKX_HTTP_POOL", "32"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("OKX_HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.environ.get("OKX_HTTP_READ_TIMEOUT", "10"))
+HTTP_MAX_RETRY = int(os.environ.get("OKX_HTTP_RETRY", "3"))
+HTTP_BACKOFF_BASE = float(os.environ.get("OKX_HTTP_BACKOFF", "0.3"))
+HTTP_BACKOFF_MAX = float(os.environ.get("OKX_HTTP_BACKOFF_MAX", "5"))
+CLOCK_SYNC_SEC = float(os.environ.get("OKX_CLOCK_SYNC_SEC", "60"))  # 服务器时钟后台校准间隔
+RATE_LIMIT_CODES = {"50011", "50061"}             # 请求过于频繁
+BUSY_CODES = {"50001", "50004", "50013", "50026"}  # 服务暂不可用 / 超时 / 系统繁忙
+TIMESTAMP_EXPIRED_CODES = {"50102"}                # 签名时间戳过期 → 立即重新校准时钟
+
+# ================= 下单快速路径 =================
+ACCOUNT_STATE_TTL = float(os.environ.get("OKX_ACCOUNT_STATE_TTL", "600"))     # 持仓模式 / 杠杆缓存秒数
+OPEN_ORDER_VIEW_TTL = float(os.environ.get("OKX_OPEN_ORDER_VIEW_TTL", "30"))  # 本地挂单视图可信秒数
+BATCH_ORDER_MAX = 20                                   # OKX 批量下单/撤单单次上限
+CANCEL_GONE_CODES = {"0", "51400", "51401", "51402"}   # 已撤 / 已成交 / 不存在 → 都不再挂着
+ORDER_LATENCY_WINDOW = 500
+
+
+class KlineFetchError(RuntimeError):
+    """get_kline_range(strict=True) 分页中途失败（非 0 code / 网络异常），已拿到的部分不可当作完整结果"""
+
+
+class ServerClock:
+    """
+    OKX 服务器时钟估计（进程内共享，见 get_server_clock）
+    - 每次校准连打 probes 次 /public/time，取 RTT 最小的一次，以请求中点估计偏移
+    - 最近若干次校准的偏移对本地时间做最小二乘，得到漂移（毫秒/秒），两次校准之间按漂移外推
+    - 后台线程每 sync_sec 秒校准一次；从未校准成功时退化为本地时钟（与原来的兜底一致）
+    签名只需要 now_iso()，不再占用下单路径上的网络往返。
+    """
+
+    def __init__(self, base_url="https://www.okx.com", sync_sec=CLOCK_SYNC_SEC, probes=3):
+        self.base_url = base_url
+        self.sync_sec = float(sync_sec)
+        self.probes = int(probes)
+        self.session = requests.Session()
+        self.offset_ms = 0.0       # 服务器时间 - 本地时间
+        self.drift = 0.0           # 偏移的变化率（毫秒/秒）
+        self.rtt_ms = None
+        self.synced_at = None      # 最近一次校准成功的本地时间（秒）
+        self.samples = deque(maxlen=16)
+        self.lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _probe(self):
+        t0 = time.time()
+        r = self.session.get(self.base_url + "/api/v5/public/time", timeout=3)
+        t1 = time.time()
+        server_ms = int(r.json()["data"][0]["ts"])
+        return server_ms - (t0 + t1) * 500.0, (t1 - t0) * 1000.0, (t0 + t1) / 2
+
+    def sync(self):
+        """立即校准一次，成功返回 True"""
+        best = None
+        for _ in range(self.probes):
+            try:
+                sample = self._probe()
+            except Exception:
+                continue
+            if best is None or sample[1] < best[1]:
+                best = sample
+        if best is None:
+            return False
+        offset, rtt, at = best
+        with self.lock:
+            self.samples.append((at, offset))
+            self.offset_ms, self.rtt_ms, self.synced_at = offset, rtt, at
+            if len(self.samples) >= 3:
+                n = len(self.samples)
+                mx = sum(a for a, _ in self.samples) / n
+                my = sum(o for _, o in self.samples) / n
+                var = sum((a - mx) ** 2 for a, _ in self.samples)
+                self.drift = sum((a - mx) * (o - my) for a, o in self.samples) / var if var > 0 else 0.0
+        return True
+
+    def _loop(self):
+        while not self._stop.wait(self.sync_sec):
+            self.sync()
+
+    def start(self):
+        """首次使用时同步校准一次，之后交给后台线程"""
+        with self.lock:
+            if self._thread is not None:
+                return self
+            self._thread = threading.Thread(target=self._loop, name="okx-clock", daemon=True)
+        self.sync()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def now_ms(self):
+        now = time.time()
+        with self.lock:
+            offset = self.offset_ms
+            if self.synced_at is not None:
+                offset += self.drift * (now - self.synced_at)
+        return now * 1000.0 + offset
+
+    def now_iso(self):
+        """OKX 签名要求的 ISO8601 毫秒时间戳"""
+        dt = datetime.datetime.fromtimestamp(self.now_ms() / 1000.0, datetime.timezone.utc)
+        return dt.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+    def status(self):
+        with self.lock:
+            return {"offset_ms": round(self.offset_ms, 1), "drift_ms_per_sec": round(self.drift, 4),
+                    "rtt_ms": None if self.rtt_ms is None else round(self.rtt_ms, 1),
+                    "synced_at": self.synced_at, "samples": len(self.samples)}
+
+
+_CLOCKS = {}
+_CLOCKS_LOCK = threading.Lock()
+
+
+def get_server_clock(base_url="https://www.okx.com"):
+    with _CLOCKS_LOCK:
+        clock = _CLOCKS.get(base_url)
+        if clock is None:
+            clock = _CLOCKS[base_url] = ServerClock(base_url)
+    return clock.start()
+
 
 class OKXTrader:
-    def __init__(self):
+    def __init__(self, pool_size=None, timeout=None, max_retry=None):
         self.base_url = "https://www.okx.com"
         self.api_key = OKX_API_KEY
         self.api_secret = OKX_SECRET_KEY
         self.passphrase = OKX_PASSPHRASE
+        self.timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        self.max_retry = HTTP_MAX_RETRY if max_retry is None else int(max_retry)
+        # 长连接池：同一 trader 的所有请求复用 TCP+TLS，线程安全
+        pool_size = pool_size or HTTP_POOL_SIZE
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        self._http_stats = {}
+        self._http_lock = threading.Lock()
+        self._clock = None
+        # 下单前置状态缓存：避免每笔单都查账户配置 / 设杠杆 / 查挂单
+        self._pos_mode = None          # (posMode, 取值时间)
+        self._lever_state = {}         # (instId, mgnMode, posSide) -> (lever, 设置时间)
+        self._open_order_view = {}     # instId -> (挂单 ordId 集合, 同步时间)
+        self._state_lock = threading.Lock()
+        self._pre_pool = None
+        self._order_latency = deque(maxlen=ORDER_LATENCY_WINDOW)
+        self.order_tracker = None
+        self._poll_pool = None
+
+    # ================= 统一请求 / 重试 / 统计 =================
+    def _request(self, method, path, params=None, body=None, signed=False, max_retry=None):
+        """
+        所有 REST 调用的唯一出口，返回解析后的 JSON（dict）。
+        - 429 / 50011 限频、5xx、系统繁忙类错误码按指数退避 + 抖动重试，优先用 Retry-After
+        - 签名请求每次重试都重新取时间戳签名，避免 50102 过期
+        - POST 只在限频或连接未建立时重试，读超时不重试，防止重复下单
+        - 最终仍失败：网络异常向上抛，业务错误原样返回 OKX 的 JSON
+        """
+        method = method.upper()
+        max_retry = self.max_retry if max_retry is None else max_retry
+        url = self.base_url + path
+        body_text = json.dumps(body, separators=(',', ':')) if body is not None else None
+        attempt = 0
+        while True:
+            headers = self._headers(method, path, body_text or "", params=params) if signed else None
+            t0 = time.perf_counter()
+            retry_after = None
+            try:
+                r = self.session.request(method, url, params=params, data=body_text,
+                                         headers=headers, timeout=self.timeout)
+                try:
+                    data = r.json()
+                except ValueError:
+                    data = {"code": str(r.status_code), "msg": r.text[:200], "data": []}
+                code = str(data.get("code", "0")) if isinstance(data, dict) else "0"
+                limited = r.status_code == 429 or code in RATE_LIMIT_CODES
+                transient = limited or r.status_code >= 500 or code in BUSY_CODES
+                retryable = transient and (method == "GET" or limited)
+                if limited:
+                    try:
+                        retry_after = float(r.headers.get("Retry-After") or 0) or None
+                    except ValueError:
+                        retry_after = None
+                err = None
+            except requests.exceptions.RequestException as e:
+                data, code, limited, transient = None, "net", False, True
+                # POST 读超时可能已被撮合受理，不能盲目重发
+                retryable = method == "GET" or isinstance(e, requests.exceptions.ConnectTimeout)
+                err = e
+            ms = (time.perf_counter() - t0) * 1000
+            if signed and code in TIMESTAMP_EXPIRED_CODES and attempt == 0:
+                # 本地时钟跳变（NTP 校时/休眠唤醒）导致签名过期：重新校准后重签一次
+                self.clock.sync()
+                retryable = True
+            will_retry = retryable and attempt < max_retry
+            self._record_http(path, ms, code != "0", will_retry, limited)
+            if not will_retry:
+                if err is not None:
+                    raise err
+                return data
+            delay = min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt) * (2 if limited else 1))
+            delay = retry_after or delay * random.uniform(0.5, 1.5)
+            time.sleep(delay)
+            attempt += 1
+
+    def _record_http(self, path, ms, failed, retried, limited):
+        with self._http_lock:
+            st = self._http_stats.get(path)
+            if st is None:
+                st = self._http_stats[path] = {"calls": 0, "errors": 0, "retries": 0,
+                                               "rate_limited": 0, "total_ms": 0.0, "max_ms": 0.0}
+            st["calls"] += 1
+            st["errors"] += int(bool(failed))
+            st["retries"] += int(bool(retried))
+            st["rate_limited"] += int(bool(limited))
+            st["total_ms"] += ms
+            st["max_ms"] = max(st["max_ms"], ms)
+
+    def http_stats(self, reset=False):
+        """按接口路径返回 {calls, errors, retries, rate_limited, avg_ms, max_ms}"""
+        with self._http_lock:
+            out = {}
+            for path, st in self._http_stats.items():
+                out[path] = {k: st[k] for k in ("calls", "errors", "retries", "rate_limited")}
+                out[path]["avg_ms"] = round(st["total_ms"] / st["calls"], 1) if st["calls"] else 0.0
+                out[path]["max_ms"] = round(st["max_ms"], 1)
+            if reset:
+                self._http_stats = {}
+        return out
+
+    def format_http_stats(self, reset=False):
+        lines = []
+        for path, s in sorted(self.http_stats(reset).items(), key=lambda x: -x[1]["calls"]):
+            lines.append(f"    {path:<48} calls={s['calls']:<6} err={s['errors']:<4} retry={s['retries']:<4} "
+                         f"429={s['rate_limited']:<4} avg={s['avg_ms']}ms max={s['max_ms']}ms")
+        return "\n".join(lines)
 
     # ================= 通用签名/时间 =================
+    @property
+    def clock(self):
+        if self._clock is None:
+            self._clock = get_server_clock(self.base_url)
+        return self._clock
+
     def _get_timestamp(self):
-        try:
-            r = requests.get(self.base_url + "/api/v5/public/time", timeout=3)
-            iso = r.json()["data"][0].get("iso")
-            if iso:
-                return iso
-        except Exception:
-            pass
-        return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+        # 本地时钟 + 后台校准的服务器偏移，不再每次签名都请求 /public/time
+        return self.clock.now_iso()
 
     def _sign(self, timestamp, method, path, body=""):
         if body and not isinstance(body, str):
@@ -72,11 +314,9 @@ class OKXTrader:
         返回: dict 或 None
         """
         path = "/api/v5/public/funding-rate"
-        url = self.base_url + path
         params = {"instId": instId}
         try:
-            r = requests.get(url, params=params, timeout=10)
-            data = r.json()
+            data = self._request("GET", path, params=params)
             if str(data.get("code")) == "0":
                 arr = data.get("data") or []
                 return arr[0] if arr else None
@@ -92,11 +332,9 @@ class OKXTrader:
         返回: list
         """
         path = "/api/v5/public/long-short-account-ratio"
-        url = self.base_url + path
         params = {"instId": instId, "period": period, "limit": str(limit)}
         try:
-            r = requests.get(url, params=params, timeout=10)
-            data = r.json()
+            data = self._request("GET", path, params=params)
             if str(data.get("code")) == "0":
                 return data.get("data") or []
         except Exception as e:
@@ -110,13 +348,11 @@ class OKXTrader:
         返回: list
         """
         path = "/api/v5/public/liquidation-orders"
-        url = self.base_url + path
         params = {"instType": instType, "limit": str(limit)}
         if instId:
             params["instId"] = instId
         try:
-            r = requests.get(url, params=params, timeout=10)
-            data = r.json()
+            data = self._request("GET", path, params=params)
             if str(data.get("code")) == "0":
                 rows = data.get("data") or []
                 if instId:
@@ -129,63 +365,61 @@ class OKXTrader:
     # ================= 行情 =================
     def get_orderbook(self, instId, sz=5):
         path = "/api/v5/market/books"
-        url = self.base_url + path
         params = {"instId": instId, "sz": sz}
         try:
-            r = requests.get(url, params=params, timeout=10)
-            data = r.json()
+            data = self._request("GET", path, params=params)
             return data["data"] if data.get("code") == "0" else []
         except Exception as e:
             print(f"[ERROR] get_orderbook: {e}"); traceback.print_exc(); return []
 
     def get_trades(self, instId, limit=20):
         path = "/api/v5/market/trades"
-        url = self.base_url + path
         params = {"instId": instId, "limit": limit}
         try:
-            r = requests.get(url, params=params, timeout=10)
-            data = r.json()
+            data = self._request("GET", path, params=params)
             return data["data"] if data.get("code") == "0" else []
         except Exception as e:
             print(f"[ERROR] get_trades: {e}"); traceback.print_exc(); return []
 
     def get_ticker(self, instId):
         path = "/api/v5/market/ticker"
-        url = self.base_url + path
         params = {"instId": instId}
         try:
-            r = requests.get(url, params=params, timeout=10)
-            data = r.json()
+            data = self._request("GET", path, params=params)
             return data["data"][0] if data.get("code") == "0" and data.get("data") else None
         except Exception as e:
             print(f"[ERROR] get_ticker: {e}"); traceback.print_exc(); return None
 
     def get_kline(self, instId, bar="1m", limit=200, after=None):
         path = "/api/v5/market/candles"
-        url = self.base_url + path
         params = {"instId": instId, "bar": bar, "limit": limit}
         if after: params["after"] = str(after)
         try:
-            r = requests.get(url, params=params, timeout=10)
-            data = r.json()
+            data = self._request("GET", path, params=params)
             return data["data"] if data.get("code") == "0" and data.get("data") else []
         except Exception as e:
             print("[ERROR] get_kline:", e); traceback.print_exc(); return []
 
-    def get_kline_range(self, instId, bar="1m", start_ts=None, end_ts=None, limit_per_page=300, max_pages=120):
+    def get_kline_range(self, instId, bar="1m", start_ts=None, end_ts=None, limit_per_page=300, max_pages=120, strict=False):
         """
-        稳定版分页：
-          1) 首次请求不带 before，拿“最新一页”
+        稳定版分页（OKX: after=返回早于该毫秒时间戳的数据）：
+          1) 首页用 after=end_ts+1 秒，直接从区间右端开始，不必先拿最新一页
           2) 记录该页最旧一根的毫秒时间 earliest_ms
-          3) 用 before=earliest_ms 持续往回翻，直到覆盖 start_ts 或翻页到头
+          3) 用 after=earliest_ms 持续往回翻，直到覆盖 start_ts 或翻页到头
+          4) 区间超出 /market/candles 的最近 1440 根时改走 /market/history-candles
         返回升序列表: [(ts, open, high, low, close, vol)], ts 为秒（UTC）
+        strict=True 时任一页失败抛 KlineFetchError（缺口补采据此区分"交易所确实没有"和"这次没拉到"）
         """
-        import requests, time
         if end_ts is None:
             end_ts = int(time.time())
         if start_ts is None:
             start_ts = end_ts - 3600
 
+        bar_sec = {"1m": 60, "3m": 180, "5m": 300, "15m": 900, "1H": 3600, "4H": 14400, "1D": 86400}.get(bar, 60)
+        path = "/api/v5/market/candles"
+        if start_ts < int(time.time()) - 1440 * bar_sec:
+            path = "/api/v5/market/history-candles"
+
         def parse(arr):
             out = []
             for it in arr or []:
@@ -201,17 +435,16 @@ class OKXTrader:
 
         all_rows = []
         pages = 0
-        before = None  # 首页不带游标
+        after = (int(end_ts) + 1) * 1000  # 首页从区间右端开始
 
         while pages < max_pages:
             try:
-                params = {"instId": instId, "bar": bar, "limit": str(limit_per_page)}
-                if before is not None:
-                    params["before"] = str(before)
-                r = requests.get(self.base_url + "/api/v5/market/candles", params=params, timeout=10)
-                data = r.json()
+                params = {"instId": instId, "bar": bar, "limit": str(limit_per_page), "after": str(after)}
+                data = self._request("GET", path, params=params)
                 if str(data.get("code")) != "0":
                     print("[WARN] candles code=", data.get("code"), "msg=", data.get("msg"))
+                    if strict:
+                        raise KlineFetchError(f"{instId} {bar} candles code={data.get('code')} msg={data.get('msg')}")
                     break
                 arr = data.get("data") or []
                 if not arr:
@@ -229,32 +462,33 @@ class OKXTrader:
                     break
 
                 # 如果最旧一根已经覆盖到 start_ts 之前，就可以停了
-                if (earliest_ms // 1000) <= start_ts:
+                if (earliest_ms // 1000) <= start_ts or earliest_ms >= after:
                     break
 
-                # 下一页：用“本页最旧一根的 ts”作为 before
-                before = earliest_ms
+                # 下一页：用“本页最旧一根的 ts”作为 after
+                after = earliest_ms
                 pages += 1
 
+            except KlineFetchError:
+                raise
             except Exception as e:
                 print("[WARN] candles exception:", e)
+                if strict:
+                    raise KlineFetchError(f"{instId} {bar} candles exception: {e}") from e
                 break
 
-        # 过滤目标时间窗，并升序
-        out = [r for r in all_rows if start_ts <= r[0] <= end_ts]
-        out.sort(key=lambda x: x[0])
-        return out
+        # 过滤目标时间窗，去重并升序
+        out = {r[0]: r for r in all_rows if start_ts <= r[0] <= end_ts}
+        return [out[k] for k in sorted(out)]
 
 
     def get_all_instruments(self, instType="SWAP", uly=None, instFamily=None):
         path = "/api/v5/public/instruments"
-        url = self.base_url + path
         params = {"instType": instType}
         if uly: params["uly"] = uly
         if instFamily: params["instFamily"] = instFamily
         try:
-            r = requests.get(url, params=params, timeout=10)
-            data = r.json()
+            data = self._request("GET", path, params=params)
             return data["data"] if data.get("code") == "0" and data.get("data") else []
         except Exception as e:
             print(f"[ERROR] get_all_instruments: {e}"); traceback.print_exc(); return []
@@ -367,12 +601,9 @@ class OKXTrader:
 
     def get_balance(self, ccy=None):
         path = "/api/v5/account/balance"
-        url = self.base_url + path
         params = {"ccy": ccy} if ccy else None
-        headers = self._headers("GET", path, params=params)
         try:
-            r = requests.get(url, headers=headers, params=params, timeout=10)
-            data = r.json()
+            data = self._request("GET", path, params=params, signed=True)
             return data["data"] if data.get("code") == "0" else None
         except Exception as e:
             print(f"[ERROR] get_balance: {e}"); traceback.print_exc(); return None
@@ -391,53 +622,38 @@ class OKXTrader:
 
     def get_open_orders(self, instId=None, instType=None):
         path = "/api/v5/trade/orders-pending"
-        url = self.base_url + path
         params = {}
         if instId: params["instId"] = instId
         if instType: params["instType"] = instType
-        headers = self._headers("GET", path, params=params)
         try:
-            r = requests.get(url, headers=headers, params=params, timeout=10)
-            data = r.json()
-            return data["data"] if data.get("code") == "0" else []
+            data = self._request("GET", path, params=params, signed=True)
+            if data.get("code") != "0":
+                return []
+            self._sync_open_order_view(data["data"], instId)
+            return data["data"]
         except Exception as e:
             print(f"[ERROR] get_open_orders: {e}"); traceback.print_exc(); return []
 
     def get_max_avail_size(self, instId, tdMode="cross"):
         path = "/api/v5/account/max-size"
-        url = self.base_url + path
         params = {"instId": instId, "tdMode": tdMode}
-        headers = self._headers("GET", path, params=params)
         try:
-            r = requests.get(url, headers=headers, params=params, timeout=10)
-            data = r.json()
+            data = self._request("GET", path, params=params, signed=True)
             return data["data"] if data.get("code") == "0" else []
         except Exception as e:
             print(f"[ERROR] get_max_avail_size: {e}"); traceback.print_exc(); return []
 
     # ================= 合约元数据 / 单位换算 =================
+    @property
+    def instruments(self):
+        """进程内共享的 SWAP 合约注册表（一次全量加载 + 磁盘快照 + TTL 刷新）"""
+        return get_registry(self.get_all_instruments, "SWAP")
+
     def _get_inst_meta(self, instId):
         """
         返回: dict(ctVal, lotSz, minSz, tickSz) 都是 Decimal
         """
-        if not hasattr(self, "_inst_meta_cache"):
-            self._inst_meta_cache = {}
-        if instId in self._inst_meta_cache:
-            return self._inst_meta_cache[instId]
-
-        ins_list = self.get_all_instruments(instType="SWAP") or []
-        item = next((x for x in ins_list if x.get("instId") == instId), None)
-        def D(x, default="0"):
-            try: return Decimal(str(x))
-            except Exception: return Decimal(default)
-        meta = {
-            "ctVal": D(item.get("ctVal"), "1") if item else Decimal("1"),
-            "lotSz": D(item.get("lotSz"), "1") if item else Decimal("1"),
-            "minSz": D(item.get("minSz"), "1") if item else Decimal("1"),
-            "tickSz": D(item.get("tickSz"), "0.01") if item else Decimal("0.01"),
-        }
-        self._inst_meta_cache[instId] = meta
-        return meta
+        return self.instruments.meta(instId)
 
     def _round_step(self, value: Decimal, step: Decimal, mode="down") -> Decimal:
         if step <= 0: return value
@@ -501,43 +717,43 @@ class OKXTrader:
     # ================= 其它账户接口 =================
     def get_liq_px(self, instId, tdMode="cross", posSide=None):
         path = "/api/v5/account/risk-state"
-        url = self.base_url + path
         params = {"instId": instId, "tdMode": tdMode}
         if posSide: params["posSide"] = posSide
-        headers = self._headers("GET", path, params=params)
         try:
-            r = requests.get(url, headers=headers, params=params, timeout=10)
-            data = r.json()
+            data = self._request("GET", path, params=params, signed=True)
             return data["data"] if data.get("code") == "0" else []
         except Exception as e:
             print(f"[ERROR] get_liq_px: {e}"); traceback.print_exc(); return []
 
     def get_account_config(self):
         path = "/api/v5/account/config"
-        url = self.base_url + path
-        headers = self._headers("GET", path)
-        r = requests.get(url, headers=headers, timeout=10)
-        return r.json()
+        return self._request("GET", path, signed=True)
 
-    def is_long_short_mode(self):
+    def is_long_short_mode(self, refresh=False):
+        # 持仓模式几乎不会变，缓存 ACCOUNT_STATE_TTL 秒；51000 类参数错误时调用方可 refresh=True
+        cached = self._pos_mode
+        if cached and not refresh and time.time() - cached[1] < ACCOUNT_STATE_TTL:
+            return cached[0] == "long_short_mode"
         try:
             cfg = self.get_account_config()
             mode = cfg.get("data", [{}])[0].get("posMode")
+            if mode:
+                self._pos_mode = (mode, time.time())
             return mode == "long_short_mode"
         except Exception:
             return False
 
     def set_leverage(self, instId, lever, mgnMode="cross", posSide=None):
         path = "/api/v5/account/set-leverage"
-        url = self.base_url + path
         body = {"instId": instId, "lever": str(lever), "mgnMode": mgnMode}
         if posSide:
             body["posSide"] = posSide
-        headers = self._headers("POST", path, body)
         try:
-            r = requests.post(url, data=json.dumps(body, separators=(',', ':')), headers=headers, timeout=10)
-            resp = r.json()
+            resp = self._request("POST", path, body=body, signed=True)
             code = str(resp.get("code"))
+            if code in ("0", "59669"):
+                with self._state_lock:
+                    self._lever_state[(instId, mgnMode, posSide)] = (str(lever), time.time())
             if code == "0":
                 return resp
             if code in ("59669",):
@@ -548,6 +764,72 @@ class OKXTrader:
             print("[WARN] set_leverage exception:", e)
             return {"code": "0", "data": [], "warn": "exception"}
 
+    def _leverage_is_set(self, instId, lever, mgnMode="cross", posSide=None):
+        with self._state_lock:
+            st = self._lever_state.get((instId, mgnMode, posSide))
+        return bool(st) and st[0] == str(lever) and time.time() - st[1] < ACCOUNT_STATE_TTL
+
+    def ensure_leverage(self, instId, lever, mgnMode="cross", posSide=None):
+        """杠杆与上次设置一致且未过期时不再请求，返回 None；否则调用 set_leverage"""
+        if self._leverage_is_set(instId, lever, mgnMode, posSide):
+            return None
+        return self.set_leverage(instId, lever, mgnMode, posSide)
+
+    # ================= 本地挂单视图 =================
+    def _sync_open_order_view(self, orders, instId=None):
+        now = time.time()
+        grouped = {}
+        for o in orders or []:
+            if o.get("instId") and o.get("ordId"):
+                grouped.setdefault(o["instId"], set()).add(o["ordId"])
+        with self._state_lock:
+            if instId:
+                self._open_order_view[instId] = (grouped.get(instId, set()), now)
+            else:
+                for k in set(self._open_order_view) | set(grouped):
+                    self._open_order_view[k] = (grouped.get(k, set()), now)
+
+    def _track_open_order(self, instId, ordId):
+        with self._state_lock:
+            view = self._open_order_view.get(instId)
+            if view is not None:
+                view[0].add(ordId)
+
+    def _forget_open_orders(self, instId, ordIds):
+        with self._state_lock:
+            view = self._open_order_view.get(instId)
+            if view is not None:
+                view[0].difference_update(ordIds)
+
+    def known_open_orders(self, instId):
+        """本地视图里的挂单 ordId 列表；视图过期或从未同步返回 None（需要查接口）"""
+        with self._state_lock:
+            view = self._open_order_view.get(instId)
+            if view is None or time.time() - view[1] > OPEN_ORDER_VIEW_TTL:
+                return None
+            return list(view[0])
+
+    # ================= 下单延迟统计 =================
+    def _record_order_latency(self, **ms):
+        self._order_latency.append(ms)
+
+    def order_latency_stats(self):
+        """最近 ORDER_LATENCY_WINDOW 笔下单各阶段耗时（毫秒）的 p50 / p99 / max"""
+        rows = list(self._order_latency)
+        out = {"count": len(rows)}
+        for key in ("pre_ms", "send_ms", "total_ms", "signal_ms"):
+            vals = sorted(r[key] for r in rows if r.get(key) is not None)
+            if vals:
+                out[key] = {"p50": round(vals[len(vals) // 2], 1),
+                            "p99": round(vals[min(len(vals) - 1, int(len(vals) * 0.99))], 1),
+                            "max": round(vals[-1], 1)}
+        return out
+
+    def _prepool(self):
+        if self._pre_pool is None:
+            self._pre_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="okx-pre")
+        return self._pre_pool
+
     # ================= 下单 / 平仓 =================
     def open_order(
         self,
@@ -569,6 +851,13 @@ class OKXTrader:
         qty_round="down",
         **kwargs
     ):
+        """
+        快速路径：持仓模式 / 杠杆走缓存，本地挂单视图为空时不撤单，
+        设杠杆、撤单、查持仓、查价这些互不依赖的前置请求并发执行。
+        可选 t_signal=信号产生时间（time.time()），用于统计信号到下单回报的延迟。
+        """
+        t0 = time.perf_counter()
+        t_signal = kwargs.pop("t_signal", None)
         if not kwargs.get("clOrdId"):
             kwargs["clOrdId"] = self._make_clordid()
 
@@ -577,31 +866,57 @@ class OKXTrader:
         if ls_mode and not _posSide:
             _posSide = "long" if side == "buy" else "short"
 
-        try:
-            setlev = self.set_leverage(instId, lever, tdMode, _posSide if ls_mode else None)
-            if setlev.get("code") != "0":
-                print("[WARN] set_leverage non-zero:", setlev)
-        except Exception as e:
-            print("[WARN] set_leverage:", e)
+        m = self._get_inst_meta(instId)
+        if sz is None and coin is None and usdt is None:
+            return {"code": "PARAM", "msg": "必须传 sz/coin/usdt 其一"}
 
-        try:
-            self.cancel_all_orders(instId, tdMode=tdMode)
-        except Exception as e:
-            print("[WARN] cancel_all_orders:", e)
+        pool = self._prepool()
+        futs = {}
+        if not self._leverage_is_set(instId, lever, tdMode, _posSide if ls_mode else None):
+            futs["lever"] = pool.submit(self.set_leverage, instId, lever, tdMode, _posSide if ls_mode else None)
+        if self.known_open_orders(instId) != []:
+            futs["cancel"] = pool.submit(self.cancel_all_orders, instId, tdMode)
+        if reduceOnly:
+            futs["pos"] = pool.submit(self.get_positions)
+        if sz is None and coin is None and px is None:
+            futs["ticker"] = pool.submit(self.get_ticker, instId)
+        # 可开上限受杠杆和挂单冻结影响：两者都不用动时才与其它前置并发
+        if not reduceOnly and "lever" not in futs and "cancel" not in futs:
+            futs["maxsz"] = pool.submit(self.get_max_avail_size, instId, tdMode)
+
+        def result(key):
+            try:
+                return futs[key].result()
+            except Exception as e:
+                print(f"[WARN] {key}:", e)
+                return None
+
+        if "lever" in futs:
+            setlev = result("lever")
+            if setlev is not None and setlev.get("code") != "0":
+                print("[WARN] set_leverage non-zero:", setlev)
+        if "cancel" in futs:
+            result("cancel")
 
-        m = self._get_inst_meta(instId)
         if sz is not None:
             cont = Decimal(str(sz))
         elif coin is not None:
             cont = self.contracts_from_coin(instId, coin, mode=qty_round)
-        elif usdt is not None:
-            cont = self.contracts_from_usdt(instId, usdt, price=px, mode=qty_round)
         else:
-            return {"code": "PARAM", "msg": "必须传 sz/coin/usdt 其一"}
+            price = px
+            if price is None:
+                tk = result("ticker")
+                if not tk:
+                    # 并发查价失败时同步再查一次
+                    tk = self.get_ticker(instId)
+                price = tk and (tk.get("last") or tk.get("askPx") or tk.get("bidPx"))
+            if not price:
+                return {"code": "PRICE", "msg": "取不到最新价，无法按 USDT 换算张数, 不下单。"}
+            cont = self.contracts_from_usdt(instId, usdt, price=price, mode=qty_round)
 
         if not reduceOnly:
             try:
-                ms = self.get_max_avail_size(instId, tdMode)
+                ms = futs["maxsz"].result() if "maxsz" in futs else self.get_max_avail_size(instId, tdMode)
                 if ms:
                     row = ms[0]
                     limit = row.get("maxBuy") if side == "buy" else row.get("maxSell")
@@ -617,7 +932,7 @@ class OKXTrader:
         if reduceOnly:
             try:
                 avail = Decimal("0")
-                for p in self.get_positions():
+                for p in futs["pos"].result() or []:
                     if p.get("instId") != instId: continue
                     if ls_mode and _posSide and p.get("posSide") != _posSide: continue
                     avail = Decimal(str(p.get("availPos") or p.get("pos") or "0"))
@@ -632,7 +947,26 @@ class OKXTrader:
         sz_str = self.stringify_sz(cont)
 
         path = "/api/v5/trade/order"
-        url = self.base_url + path
+        data = self._order_payload(instId, side, sz_str, tdMode, ordType, px, tp, sl, reduceOnly,
+                                   _posSide if ls_mode else None, kwargs)
+
+        t_pre = time.perf_counter()
+        try:
+            resp = self._request("POST", path, body=data, signed=True)
+        except Exception as e:
+            print("[下单异常]", e); traceback.print_exc(); return {"code": "ERROR", "msg": str(e)}
+        t_done = time.perf_counter()
+        self._record_order_latency(
+            pre_ms=(t_pre - t0) * 1000, send_ms=(t_done - t_pre) * 1000, total_ms=(t_done - t0) * 1000,
+            signal_ms=(time.time() - t_signal) * 1000 if t_signal else None)
+        if str(resp.get("code")) == "0" and ordType not in ("market", "ioc", "fok", "optimal_limit_ioc"):
+            for d in resp.get("data") or []:
+                if d.get("ordId"):
+                    self._track_open_order(instId, d["ordId"])
+        return resp
+
+    @staticmethod
+    def _order_payload(instId, side, sz_str, tdMode, ordType, px, tp, sl, reduceOnly, posSide, extra):
         data = {
             "instId": instId,
             "tdMode": tdMode,
@@ -640,19 +974,129 @@ class OKXTrader:
             "ordType": ordType,
             "sz": sz_str
         }
-        if ls_mode and _posSide: data["posSide"] = _posSide
+        if posSide: data["posSide"] = posSide
         if ordType == "limit" and px is not None: data["px"] = str(px)
         if tp is not None: data["tpTriggerPx"] = str(tp); data["tpOrdPx"] = "-1"
         if sl is not None: data["slTriggerPx"] = str(sl); data["slOrdPx"] = "-1"
         if reduceOnly: data["reduceOnly"] = True
-        data.update(kwargs)
+        data.update(extra)
+        return data
 
-        try:
-            headers = self._headers("POST", path, data)
-            r = requests.post(url, data=json.dumps(data, separators=(',', ':')), headers=headers, timeout=10)
-            return r.json()
-        except Exception as e:
-            print("[下单异常]", e); traceback.print_exc(); return {"code": "ERROR", "msg": str(e)}
+    def open_orders_batch(self, orders, t_signal=None):
+        """
+        批量下单（/trade/batch-orders，每批最多 20 笔）
+        orders: [{"instId", "side", "sz", 可选 "lever", "tdMode", "posSide", "ordType", "px",
+                  "tp", "sl", "reduceOnly", "clOrdId", ...}, ...]，sz 为张数
+        前置与 open_order 相同（杠杆缓存 / 挂单视图 / 可开上限），但按合约去重后并发执行一次。
+        返回与 orders 一一对应的结果：{"instId", "clOrdId", "ordId", "sCode", "sMsg"}，sCode=="0" 为成功
+        """
+        t0 = time.perf_counter()
+        if not orders:
+            return []
+        ls_mode = self.is_long_short_mode()
+        prepared = []
+        for o in orders:
+            o = dict(o)
+            o.setdefault("tdMode", "cross")
+            o.setdefault("ordType", "market")
+            o.setdefault("lever", 10)
+            if not o.get("clOrdId"):
+                o["clOrdId"] = self._make_clordid()
+            if ls_mode and not o.get("posSide"):
+                o["posSide"] = "long" if o["side"] == "buy" else "short"
+            elif not ls_mode:
+                o["posSide"] = None
+            prepared.append(o)
+
+        pool = self._prepool()
+        lever_jobs, cancel_jobs, maxsz_jobs = {}, {}, {}
+        for o in prepared:
+            key = (o["instId"], o["tdMode"], o["posSide"])
+            if key not in lever_jobs and not o.get("reduceOnly") and not self._leverage_is_set(o["instId"], o["lever"], *key[1:]):
+                lever_jobs[key] = pool.submit(self.set_leverage, o["instId"], o["lever"], o["tdMode"], o["posSide"])
+            if o["instId"] not in cancel_jobs and self.known_open_orders(o["instId"]) != []:
+                cancel_jobs[o["instId"]] = pool.submit(self.cancel_all_orders, o["instId"], o["tdMode"])
+        for fut in list(lever_jobs.values()) + list(cancel_jobs.values()):
+            try:
+                fut.result()
+            except Exception as e:
+                print("[WARN] batch pre-check:", e)
+        positions = pool.submit(self.get_positions) if any(o.get("reduceOnly") for o in prepared) else None
+        for o in prepared:
+            if not o.get("reduceOnly") and (o["instId"], o["tdMode"]) not in maxsz_jobs:
+                maxsz_jobs[(o["instId"], o["tdMode"])] = pool.submit(self.get_max_avail_size, o["instId"], o["tdMode"])
+
+        results = [None] * len(prepared)
+        payloads = []
+        used = {}
+        for i, o in enumerate(prepared):
+            instId, side = o["instId"], o["side"]
+            m = self._get_inst_meta(instId)
+            cont = Decimal(str(o.get("sz") or "0"))
+            try:
+                if o.get("reduceOnly"):
+                    avail = Decimal("0")
+                    for p in positions.result() or []:
+                        if p.get("instId") != instId: continue
+                        if o["posSide"] and p.get("posSide") != o["posSide"]: continue
+                        avail = Decimal(str(p.get("availPos") or p.get("pos") or "0"))
+                        break
+                    limit = avail
+                else:
+                    ms = maxsz_jobs[(instId, o["tdMode"])].result()
+                    row = ms[0] if ms else {}
+                    limit = row.get("maxBuy") if side == "buy" else row.get("maxSell")
+                    if limit is None:
+                        limit = row.get("availBuy") if side == "buy" else row.get("availSell")
+                    limit = Decimal(str(limit)) if limit is not None else None
+                if limit is not None:
+                    # 同一合约同方向的多笔单共享一个上限
+                    k = (instId, side, o["posSide"], bool(o.get("reduceOnly")))
+                    left = limit - used.get(k, Decimal("0"))
+                    if cont > left:
+                        print(f"[WARN] {instId} 目标张数 {cont} 超过剩余可开 {left}，自动降到 {left}")
+                        cont = max(Decimal("0"), left)
+            except Exception as e:
+                print("[WARN] batch size check:", e)
+            cont = self._round_step(cont, m["lotSz"], mode=o.get("qty_round", "down"))
+            if cont < m["minSz"]:
+                results[i] = {"instId": instId, "clOrdId": o["clOrdId"], "ordId": "", "sCode": "LIMIT",
+                              "sMsg": f"小于最小下单张数 {m['minSz']}, 不下单。"}
+                continue
+            k = (instId, side, o["posSide"], bool(o.get("reduceOnly")))
+            used[k] = used.get(k, Decimal("0")) + cont
+            extra = {k2: v for k2, v in o.items() if k2 not in (
+                "instId", "side", "sz", "lever", "tdMode", "posSide", "ordType", "px", "tp", "sl",
+                "reduceOnly", "qty_round")}
+            payloads.append((i, self._order_payload(instId, side, self.stringify_sz(cont), o["tdMode"], o["ordType"],
+                                                    o.get("px"), o.get("tp"), o.get("sl"), o.get("reduceOnly"),
+                                                    o["posSide"], extra)))
+
+        t_pre = time.perf_counter()
+        path = "/api/v5/trade/batch-orders"
+        for c in range(0, len(payloads), BATCH_ORDER_MAX):
+            chunk = payloads[c:c + BATCH_ORDER_MAX]
+            try:
+                resp = self._request("POST", path, body=[d for _, d in chunk], signed=True)
+                rows = {d.get("clOrdId"): d for d in resp.get("data") or []}
+                for i, d in chunk:
+                    r = rows.get(d["clOrdId"]) or {"sCode": str(resp.get("code")), "sMsg": resp.get("msg", "")}
+                    results[i] = {"instId": d["instId"], "clOrdId": d["clOrdId"], "ordId": r.get("ordId", ""),
+                                  "sCode": str(r.get("sCode")), "sMsg": r.get("sMsg", "")}
+                    if results[i]["sCode"] == "0" and results[i]["ordId"] and d["ordType"] not in (
+                            "market", "ioc", "fok", "optimal_limit_ioc"):
+                        self._track_open_order(d["instId"], results[i]["ordId"])
+            except Exception as e:
+                print("[批量下单异常]", e); traceback.print_exc()
+                for i, d in chunk:
+                    results[i] = {"instId": d["instId"], "clOrdId": d["clOrdId"], "ordId": "",
+                                  "sCode": "ERROR", "sMsg": str(e)}
+        t_done = time.perf_counter()
+        if payloads:
+            self._record_order_latency(
+                pre_ms=(t_pre - t0) * 1000, send_ms=(t_done - t_pre) * 1000, total_ms=(t_done - t0) * 1000,
+                signal_ms=(time.time() - t_signal) * 1000 if t_signal else None)
+        return results
 
     def set_tp_sl(self, instId, sz=None, tp=None, sl=None, trailing_ratio=None, tdMode="cross", posSide=None, trigger_px_type="last"):
         # 保持你原有实现...
@@ -661,7 +1105,6 @@ class OKXTrader:
 
     def close_all_positions(self, instId, tdMode="cross", posSide=None, **kwargs):
         path = "/api/v5/trade/close-position"
-        url = self.base_url + path
         if self.is_long_short_mode() and not posSide:
             try:
                 poss = [p for p in self.get_positions()
@@ -677,56 +1120,94 @@ class OKXTrader:
         if posSide: data["posSide"] = posSide
 
         try:
-            headers = self._headers("POST", path, data)
-            r = requests.post(url, data=json.dumps(data, separators=(',', ':')), headers=headers, timeout=10)
-            return r.json()
+            return self._request("POST", path, body=data, signed=True)
         except Exception as e:
             print("[一键平仓异常]", e); traceback.print_exc()
             return {"code": "ERROR", "msg": str(e)}
 
-    def cancel_orders(self, orderIds, instId, tdMode="cross"):
-        path = "/api/v5/trade/cancel-order"
-        url = self.base_url + path
+    def cancel_orders_batch(self, items):
+        """
+        批量撤单（/trade/cancel-batch-orders，每批最多 20 笔，可跨合约）
+        items: [{"instId", "ordId" 或 "clOrdId"}, ...]
+        返回与 items 一一对应的 {"instId", "ordId", "clOrdId", "sCode", "sMsg"}
+        """
+        path = "/api/v5/trade/cancel-batch-orders"
+        items = [{k: v for k, v in it.items() if k in ("instId", "ordId", "clOrdId") and v} for it in items]
         results = []
-        for oid in orderIds:
-            data = {"instId": instId, "ordId": oid, "tdMode": tdMode}
+        for c in range(0, len(items), BATCH_ORDER_MAX):
+            chunk = items[c:c + BATCH_ORDER_MAX]
             try:
-                headers = self._headers("POST", path, data)
-                r = requests.post(url, data=json.dumps(data, separators=(',', ':')), headers=headers, timeout=10)
-                results.append(r.json())
+                resp = self._request("POST", path, body=chunk, signed=True)
+                rows = resp.get("data") or []
+                for j, it in enumerate(chunk):
+                    r = next((d for d in rows if (it.get("ordId") and d.get("ordId") == it["ordId"])
+                              or (it.get("clOrdId") and d.get("clOrdId") == it["clOrdId"])),
+                             rows[j] if j < len(rows) else {"sCode": str(resp.get("code")), "sMsg": resp.get("msg", "")})
+                    res = {"instId": it["instId"], "ordId": r.get("ordId") or it.get("ordId", ""),
+                           "clOrdId": r.get("clOrdId") or it.get("clOrdId", ""),
+                           "sCode": str(r.get("sCode")), "sMsg": r.get("sMsg", "")}
+                    if res["sCode"] in CANCEL_GONE_CODES and res["ordId"]:
+                        self._forget_open_orders(res["instId"], [res["ordId"]])
+                    results.append(res)
             except Exception as e:
-                print(f"[ERROR] cancel_order: {e}"); traceback.print_exc()
-                results.append({"code": "ERROR", "msg": str(e)})
+                print(f"[ERROR] cancel_orders_batch: {e}"); traceback.print_exc()
+                results += [{"instId": it["instId"], "ordId": it.get("ordId", ""), "clOrdId": it.get("clOrdId", ""),
+                             "sCode": "ERROR", "sMsg": str(e)} for it in chunk]
         return results
 
-    def cancel_all_orders(self, instId, tdMode="cross"):
-        orders = self.get_open_orders(instId)
-        orderIds = [o["ordId"] for o in orders if "ordId" in o]
+    def cancel_orders(self, orderIds, instId, tdMode="cross"):
+        """撤掉同一合约的多笔挂单（走批量接口），返回逐笔结果"""
+        return self.cancel_orders_batch([{"instId": instId, "ordId": oid} for oid in orderIds])
+
+    def cancel_all_orders(self, instId, tdMode="cross", use_view=True):
+        orderIds = self.known_open_orders(instId) if use_view else None
+        if orderIds is None:
+            orders = self.get_open_orders(instId)
+            orderIds = [o["ordId"] for o in orders if "ordId" in o]
         if orderIds:
             return self.cancel_orders(orderIds, instId, tdMode)
         print("[INFO] 当前无挂单"); return []
 
     def get_order(self, instId, ordId=None, clOrdId=None):
         path = "/api/v5/trade/order"
-        url = self.base_url + path
         params = {"instId": instId}
         if ordId: params["ordId"] = ordId
         if clOrdId: params["clOrdId"] = clOrdId
-        headers = self._headers("GET", path, params=params)
-        r = requests.get(url, headers=headers, params=params, timeout=10)
-        return r.json()
+        return self._request("GET", path, params=params, signed=True)
 
     def get_fills(self, instType="SWAP", instId=None, ordId=None, limit=100):
         path = "/api/v5/trade/fills-history"
-        url = self.base_url + path
         params = {"instType": instType, "limit": str(limit)}
         if instId: params["instId"] = instId
         if ordId: params["ordId"] = ordId
-        headers = self._headers("GET", path, params=params)
-        r = requests.get(url, headers=headers, params=params, timeout=10)
-        return r.json()
+        return self._request("GET", path, params=params, signed=True)
+
+    # ================= 订单终态跟踪 =================
+    def start_order_tracker(self, url=None):
+        """启动私有 WS 订单跟踪；之后 wait_order_filled(_async) 由推送驱动，不再轮询"""
+        if self.order_tracker is None:
+            from core.order_tracker import OrderTracker
+            self.order_tracker = OrderTracker(self, url=url) if url else OrderTracker(self)
+            self.order_tracker.start()
+        return self.order_tracker
+
+    def wait_order_filled_async(self, instId, ordId=None, clOrdId=None, timeout=20):
+        """
+        返回 concurrent.futures.Future，结果同 wait_order_filled：{"state", "order", "fills"}
+        未启动订单跟踪时退化为后台线程轮询
+        """
+        if self.order_tracker is not None:
+            return self.order_tracker.watch(instId, ordId=ordId, clOrdId=clOrdId, timeout=timeout)
+        if self._poll_pool is None:
+            self._poll_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="okx-poll")
+        return self._poll_pool.submit(self._poll_order_filled, instId, ordId, clOrdId, timeout)
 
     def wait_order_filled(self, instId, ordId=None, clOrdId=None, timeout=20, poll_interval=0.5):
+        if self.order_tracker is not None:
+            return self.order_tracker.watch(instId, ordId=ordId, clOrdId=clOrdId, timeout=timeout).result()
+        return self._poll_order_filled(instId, ordId, clOrdId, timeout, poll_interval)
+
+    def _poll_order_filled(self, instId, ordId=None, clOrdId=None, timeout=20, poll_interval=0.5):
         start = time.time()
         last_order = None
         while time.time() - start < timeout:
@@ -745,8 +1226,12 @@ class OKXTrader:
 
     # ================= 自检/工具 =================
     def _make_clordid(self, prefix="ft"):
-        ts = int(datetime.datetime.utcnow().timestamp() * 1000)
-        raw = f"{prefix}{ts}"
+        # 毫秒时间戳 + 进程内序号：同一毫秒批量下单也不会撞 clOrdId
+        ts = int(time.time() * 1000)
+        with self._state_lock:
+            self._clordid_seq = (getattr(self, "_clordid_seq", 0) + 1) % 1000
+            seq = self._clordid_seq
+        raw = f"{prefix}{ts}{seq:03d}"
         clean = ''.join(ch for ch in raw if ch.isalnum())
         return clean[:32]
 
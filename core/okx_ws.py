@@ -0,0 +1,181 @@
+# core/okx_ws.py
+"""
+OKX WebSocket 客户端（公共 / 业务 / 私有频道通用）
+
+- 断线自动重连（指数退避 + 抖动），重连后自动重新登录、重新订阅
+- ping_sec 秒内没收到任何消息就发 "ping"（OKX 30 秒无数据会主动断开）
+- 推送消息回调 on_message(arg, data, msg)；连上/重连后回调 on_open(reconnected)
+- 地址可用环境变量覆盖，方便指向本地回放服务（tools/ws_replay_server.py）
+
+依赖 websocket-client（pip install websocket-client），未安装时 start() 直接报错。
+"""
+import os
+import json
+import time
+import random
+import threading
+
+try:
+    import websocket  # websocket-client
+except Exception:
+    websocket = None
+
+OKX_WS_PUBLIC = os.environ.get("OKX_WS_PUBLIC", "wss://ws.okx.com:8443/ws/v5/public")
+OKX_WS_BUSINESS = os.environ.get("OKX_WS_BUSINESS", "wss://ws.okx.com:8443/ws/v5/business")
+OKX_WS_PRIVATE = os.environ.get("OKX_WS_PRIVATE", "wss://ws.okx.com:8443/ws/v5/private")
+
+SUB_CHUNK = 100          # 单条 subscribe 消息最多带多少个 arg（OKX 单消息 64KB 上限）
+MAX_BACKOFF = 30.0
+
+
+class OkxWsClient:
+    def __init__(self, url, on_message, on_open=None, login=None, name="ws", ping_sec=25):
+        """
+        login: 可选，无参函数，返回 OKX login 的 args 列表（私有频道用）
+        """
+        self.url = url
+        self.on_message = on_message
+        self.on_open = on_open
+        self.login = login
+        self.name = name
+        self.ping_sec = ping_sec
+        self.subs = []
+        self._sub_keys = set()
+        self._ws = None
+        self._send_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.connected = threading.Event()
+        self.stats = {"connects": 0, "msgs": 0, "errors": 0, "last_msg_ts": 0.0}
+
+    # ---------- 对外 ----------
+    def subscribe(self, args):
+        """args: [{"channel": ..., "instId": ...}, ...]；重复订阅自动去重"""
+        new = []
+        for a in args:
+            key = json.dumps(a, sort_keys=True)
+            if key not in self._sub_keys:
+                self._sub_keys.add(key)
+                self.subs.append(a)
+                new.append(a)
+        if new and self.connected.is_set():
+            self._send_subs(new)
+
+    def send(self, payload):
+        text = payload if isinstance(payload, str) else json.dumps(payload, separators=(',', ':'))
+        with self._send_lock:
+            if self._ws is None:
+                raise ConnectionError(f"[{self.name}] 未连接")
+            self._ws.send(text)
+
+    def start(self):
+        if websocket is None:
+            raise RuntimeError("缺少依赖 websocket-client，请先 pip install websocket-client")
+        self._thread = threading.Thread(target=self._run, name=f"okx-ws-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        try:
+            if self._ws is not None:
+                self._ws.close()
+        except Exception:
+            pass
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    # ---------- 内部 ----------
+    def _send_subs(self, args):
+        for i in range(0, len(args), SUB_CHUNK):
+            self.send({"op": "subscribe", "args": args[i:i + SUB_CHUNK]})
+
+    def _do_login(self, ws):
+        ws.send(json.dumps({"op": "login", "args": self.login()}, separators=(',', ':')))
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            raw = ws.recv()
+            if not raw or raw == "pong":
+                continue
+            msg = json.loads(raw)
+            if msg.get("event") == "login":
+                if str(msg.get("code")) != "0":
+                    raise ConnectionError(f"login 失败: {msg}")
+                return
+            if msg.get("event") == "error":
+                raise ConnectionError(f"login 失败: {msg}")
+        raise ConnectionError("login 超时")
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            ws = None
+            try:
+                ws = websocket.create_connection(self.url, timeout=10, enable_multithread=True)
+                if self.login:
+                    self._do_login(ws)
+                ws.settimeout(self.ping_sec)
+                with self._send_lock:
+                    self._ws = ws
+                self.stats["connects"] += 1
+                reconnected = self.stats["connects"] > 1
+                if self.subs:
+                    self._send_subs(list(self.subs))
+                self.connected.set()
+                backoff = 1.0
+                print(f"[WS][{self.name}] 已连接 {self.url}（订阅 {len(self.subs)} 个）")
+                if self.on_open:
+                    try:
+                        self.on_open(reconnected)
+                    except Exception as e:
+                        print(f"[WS][{self.name}] on_open 异常: {e}")
+                self._recv_loop(ws)
+            except Exception as e:
+                self.stats["errors"] += 1
+                if not self._stop.is_set():
+                    print(f"[WS][{self.name}] 连接异常: {e}")
+            finally:
+                self.connected.clear()
+                with self._send_lock:
+                    self._ws = None
+                try:
+                    if ws is not None:
+                        ws.close()
+                except Exception:
+                    pass
+            if self._stop.is_set():
+                break
+            sleep = min(MAX_BACKOFF, backoff) * (0.5 + random.random())
+            print(f"[WS][{self.name}] {sleep:.1f}s 后重连 ...")
+            self._stop.wait(sleep)
+            backoff = min(MAX_BACKOFF, backoff * 2)
+
+    def _recv_loop(self, ws):
+        while not self._stop.is_set():
+            try:
+                raw = ws.recv()
+            except websocket.WebSocketTimeoutException:
+                with self._send_lock:
+                    ws.send("ping")
+                continue
+            if raw is None or raw == "":
+                raise ConnectionError("连接被关闭")
+            if raw == "pong":
+                continue
+            self.stats["msgs"] += 1
+            self.stats["last_msg_ts"] = time.time()
+            try:
+                msg = json.loads(raw)
+            except Exception:
+                continue
+            ev = msg.get("event")
+            if ev:
+                if ev == "error":
+                    print(f"[WS][{self.name}] 服务端错误: {msg}")
+                continue
+            if "data" in msg:
+                try:
+                    self.on_message(msg.get("arg") or {}, msg.get("data") or [], msg)
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    print(f"[WS][{self.name}] 消息处理异常: {e}")
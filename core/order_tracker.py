@@ -0,0 +1,229 @@
+# core/order_tracker.py
+"""
+私有 WebSocket 订单/成交跟踪（替代 wait_order_filled 轮询）
+
+- 登录私有频道，订阅 orders（+ fills，非 VIP 账户会被拒，不影响 orders）
+- 内存里维护 ordId -> 最新订单状态、逐笔成交；clOrdId -> ordId 映射
+- watch() 返回 concurrent.futures.Future，订单进入终态（filled / canceled）时完成，
+  结果与原 wait_order_filled 相同：{"state", "order", "fills"}
+- 兜底：超时或 WS 断开时对未完成的 watch 走一次 REST get_order；重连后对所有未完成的 watch 对账，
+  断线期间漏掉的推送不会让调用方永远等下去
+- 推送同步维护 OKXTrader 的本地挂单视图（挂单 / 撤单 / 成交）
+
+联调：tools/ws_replay_server.py 的 /ws/v5/private 路径会应答 login 并回放 kind=private 的录制帧，
+  OKX_WS_PRIVATE=ws://127.0.0.1:8765/ws/v5/private 即可指向本地。
+"""
+import os
+import hmac
+import time
+import base64
+import hashlib
+import threading
+from concurrent.futures import Future, InvalidStateError
+
+from core.okx_ws import OkxWsClient, OKX_WS_PRIVATE
+
+TERMINAL_STATES = {"filled", "canceled", "mmp_canceled"}
+WATCH_TIMEOUT = float(os.environ.get("ORDER_WATCH_TIMEOUT", "20"))
+SWEEP_SEC = 1.0
+RECONCILE_BACKOFF_MAX = float(os.environ.get("ORDER_RECONCILE_BACKOFF_MAX", "30"))   # WS 断开时全量对账的最大间隔
+MAX_DONE = 5000          # 终态订单在内存里最多保留多少笔
+
+
+class OrderTracker:
+    def __init__(self, trader, url=OKX_WS_PRIVATE, instType="SWAP"):
+        self.trader = trader
+        self.instType = instType
+        self.orders = {}         # ordId -> 最新订单推送
+        self.fills = {}          # ordId -> [成交明细]
+        self.cl2ord = {}         # clOrdId -> ordId
+        self.watchers = {}       # key(ordId 或 "cl:"+clOrdId) -> [(Future, instId, 截止时间)]
+        self._done_order = []
+        self.lock = threading.Lock()
+        self.stats = {"order_push": 0, "fill_push": 0, "resolved_ws": 0, "resolved_rest": 0}
+        self.ws = OkxWsClient(url, self._on_message, on_open=self._on_open, login=self._login_args, name="private")
+        self.ws.subscribe([{"channel": "orders", "instType": instType},
+                           {"channel": "fills"}])
+        self._stop = threading.Event()
+        self._sweeper = None
+
+    # ---------- 生命周期 ----------
+    def start(self):
+        self.ws.start()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="order-tracker-sweep", daemon=True)
+        self._sweeper.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.ws.stop()
+
+    def _login_args(self):
+        t = self.trader
+        ts = str(int(t.clock.now_ms() / 1000))
+        sign = base64.b64encode(hmac.new(t.api_secret.encode("utf-8"),
+                                         f"{ts}GET/users/self/verify".encode(), hashlib.sha256).digest()).decode()
+        return [{"apiKey": t.api_key, "passphrase": t.passphrase, "timestamp": ts, "sign": sign}]
+
+    # ---------- 对外 ----------
+    def watch(self, instId, ordId=None, clOrdId=None, timeout=WATCH_TIMEOUT):
+        """返回 Future，终态或超时后完成；已是终态的订单立即完成"""
+        fut = Future()
+        with self.lock:
+            ordId = ordId or self.cl2ord.get(clOrdId)
+            order = self.orders.get(ordId) if ordId else None
+            if order is None or order.get("state") not in TERMINAL_STATES:
+                key = ordId or f"cl:{clOrdId}"
+                self.watchers.setdefault(key, []).append((fut, instId, time.time() + timeout))
+                return fut
+            result = self._result(ordId)
+        fut.set_result(result)
+        return fut
+
+    def get(self, ordId=None, clOrdId=None):
+        with self.lock:
+            ordId = ordId or self.cl2ord.get(clOrdId)
+            return dict(self.orders[ordId]) if ordId in self.orders else None
+
+    def pending(self):
+        with self.lock:
+            return sum(len(v) for v in self.watchers.values())
+
+    # ---------- 推送 ----------
+    def _on_open(self, reconnected):
+        if reconnected:
+            # 断线期间的推送拿不回来，对未完成的 watch 立刻走一次 REST 对账
+            threading.Thread(target=self._reconcile, kwargs={"only_expired": False}, daemon=True).start()
+
+    def _on_message(self, arg, data, msg):
+        ch = arg.get("channel")
+        if ch == "orders":
+            for o in data:
+                self._on_order(o)
+        elif ch == "fills":
+            for f in data:
+                self._on_fill(f)
+
+    def _on_order(self, o, source="ws"):
+        ordId, clOrdId, state = o.get("ordId"), o.get("clOrdId"), o.get("state")
+        if not ordId:
+            return
+        with self.lock:
+            self.stats["order_push"] += 1
+            self.orders[ordId] = o
+            if clOrdId:
+                self.cl2ord[clOrdId] = ordId
+            if o.get("tradeId") and o.get("fillSz") not in (None, "", "0"):
+                self._add_fill(ordId, {"instId": o.get("instId"), "ordId": ordId, "clOrdId": clOrdId,
+                                       "tradeId": o.get("tradeId"), "fillPx": o.get("fillPx"),
+                                       "fillSz": o.get("fillSz"), "fee": o.get("fillFee"),
+                                       "side": o.get("side"), "posSide": o.get("posSide"),
+                                       "ts": o.get("fillTime") or o.get("uTime")})
+            waiters = []
+            if state in TERMINAL_STATES:
+                waiters = self.watchers.pop(ordId, []) + self.watchers.pop(f"cl:{clOrdId}", [])
+                self._done_order.append(ordId)
+                self._trim()
+                result = self._result(ordId)
+            elif clOrdId and f"cl:{clOrdId}" in self.watchers:
+                # 先按 clOrdId 挂的 watch，拿到 ordId 后改挂到 ordId 上
+                self.watchers.setdefault(ordId, []).extend(self.watchers.pop(f"cl:{clOrdId}"))
+        instId = o.get("instId")
+        if state == "live":
+            self.trader._track_open_order(instId, ordId)
+        elif state in TERMINAL_STATES:
+            self.trader._forget_open_orders(instId, [ordId])
+        for fut, _, _ in waiters:
+            self._complete(fut, result, source)
+
+    def _complete(self, fut, result, source):
+        """完成 watch 的 Future；WS 线程和对账线程可能同时完成同一个，已完成的直接忽略"""
+        if fut.done():
+            return False
+        try:
+            fut.set_result(result)
+        except InvalidStateError:
+            return False
+        with self.lock:
+            self.stats[f"resolved_{source}"] += 1
+        return True
+
+    def _on_fill(self, f):
+        ordId = f.get("ordId")
+        if not ordId:
+            return
+        with self.lock:
+            self.stats["fill_push"] += 1
+            self._add_fill(ordId, f)
+
+    def _add_fill(self, ordId, f):
+        lst = self.fills.setdefault(ordId, [])
+        if not any(x.get("tradeId") == f.get("tradeId") for x in lst):
+            lst.append(f)
+
+    def _result(self, ordId):
+        order = self.orders.get(ordId)
+        return {"state": (order or {}).get("state", "unknown"), "order": dict(order) if order else None,
+                "fills": {"code": "0", "data": list(self.fills.get(ordId, []))}}
+
+    def _trim(self):
+        while len(self._done_order) > MAX_DONE:
+            old = self._done_order.pop(0)
+            o = self.orders.pop(old, None)
+            self.fills.pop(old, None)
+            if o and o.get("clOrdId"):
+                self.cl2ord.pop(o["clOrdId"], None)
+
+    # ---------- 兜底 ----------
+    def _sweep_loop(self):
+        backoff, next_full = SWEEP_SEC, 0.0
+        while not self._stop.wait(SWEEP_SEC):
+            try:
+                full = False
+                if self.ws.connected.is_set():
+                    backoff, next_full = SWEEP_SEC, 0.0
+                elif time.time() >= next_full:
+                    # WS 不在线时不等超时，直接 REST 对账；断线期间按指数退避，不每秒把所有 watch 打一遍 REST
+                    full = True
+                    next_full = time.time() + backoff
+                    backoff = min(backoff * 2, RECONCILE_BACKOFF_MAX)
+                self._reconcile(only_expired=not full)
+            except Exception as e:
+                print(f"[订单跟踪] 对账异常: {e}")
+
+    def _reconcile(self, only_expired=True):
+        now = time.time()
+        with self.lock:
+            todo = [(k, w) for k, ws in self.watchers.items() for w in ws
+                    if not only_expired or w[2] <= now]
+        for key, (fut, instId, deadline) in todo:
+            if fut.done():
+                continue
+            ordId = None if key.startswith("cl:") else key
+            clOrdId = key[3:] if key.startswith("cl:") else None
+            try:
+                info = self.trader.get_order(instId, ordId=ordId, clOrdId=clOrdId)
+                order = (info.get("data") or [None])[0] if info.get("code") == "0" else None
+            except Exception:
+                order = None
+            if order and order.get("state") in TERMINAL_STATES:
+                self._on_order(order, source="rest")   # 走同一条路径完成 watch
+                if not fut.done():
+                    with self.lock:
+                        result = self._result(order["ordId"])
+                    self._complete(fut, result, "rest")
+                continue
+            if deadline <= now:
+                # 超时：返回当前已知状态（与原 wait_order_filled 超时行为一致）
+                fills = None
+                if order and order.get("ordId"):
+                    try:
+                        fills = self.trader.get_fills(instType=self.instType, instId=instId, ordId=order["ordId"])
+                    except Exception:
+                        fills = None
+                with self.lock:
+                    lst = self.watchers.get(key) or []
+                    self.watchers[key] = [w for w in lst if w[0] is not fut]
+                    if not self.watchers[key]:
+                        self.watchers.pop(key, None)
+                self._complete(fut, {"state": (order or {}).get("state", "unknown"), "order": order, "fills": fills}, "rest")
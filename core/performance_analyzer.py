@@ -13,7 +13,8 @@ def load_all_trades(simulation=False):
         return pd.DataFrame()
     try:
         conn = sqlite3.connect(dbfile)
-        table_name = "simulation_results" if simulation else "trades"
+        # 模拟盘 = 回测逐笔成交（strategy/backtest.py 写入 backtest_trades）
+        table_name = "backtest_trades" if simulation else "trades"
 
         # 检查表是否存在
         c = conn.cursor()
@@ -23,7 +24,15 @@ def load_all_trades(simulation=False):
             conn.close()
             return pd.DataFrame()
 
-        df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
+        if simulation:
+            # 每个参数组只取最近一次回测，避免多次回测的成交重复计入
+            df = pd.read_sql_query(
+                "SELECT * FROM backtest_trades WHERE run_id IN "
+                "(SELECT MAX(id) FROM backtest_runs GROUP BY param_group_id)", conn)
+            df["ts"] = df["exit_ts"]
+            df["status"] = "CLOSED"
+        else:
+            df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
         conn.close()
         print(f"[加载] 成功加载 {'模拟盘' if simulation else '实盘'}交易数据，条数：{len(df)}")
     except Exception as e:
@@ -25,6 +25,13 @@ def _atr_pct_from_klines(kls, period=14):
     base = kls[-1][4]
     return (atr / base) if base else 0.01
 
+def atr_pct_latest(instId, bar="1m", period=14):
+    """从本地 K 线库取最近 period+1 根算 ATR%（走 KlineStore 缓存）；没有数据时给 0.01"""
+    from utils.kline_store import get_kline_store
+    k = get_kline_store().latest(instId, bar, period + 1)
+    return _atr_pct_from_klines(list(zip(k.ts.tolist(), k.open.tolist(), k.high.tolist(),
+                                         k.low.tolist(), k.close.tolist(), k.vol.tolist())), period)
+
 def leverage_from_vol(atr_pct, min_lev=MIN_LEV, max_lev=MAX_LEV, target_move=TARGET_MOVE):
     """
     简单自适应：杠杆 ≈ 目标承受波动 / 当前ATR%
@@ -19,6 +19,8 @@ from utils.config import (
     SIGNAL_POOL_DB,
     SIMU_TRADES_DB,
 )
+from utils.signal_queue import ensure_queue_schema, peek, ack_many, flush_acks
+from utils.signal_notify import subscribe
 
 # ✅ 你的 AI 决策/演化接口
 from ailearning.ai_engine import ai_risk_decision, ai_evolution, load_ai_pool
@@ -28,6 +30,7 @@ OK_COLOR = '\033[92m'
 RESET_COLOR = '\033[0m'
 ORDER_LOCK = threading.Lock()
 HEARTBEAT_INTERVAL = 60
+FETCH_LIMIT = int(os.environ.get("TRADE_ENGINE_FETCH", "500"))  # 每轮最多读取的 WAIT_SIMU 信号
 
 # 明确只做模拟盘：网关取 PaperGateway（若 MODE == "live" 可切 OkxGateway）
 def make_gateway():
@@ -112,6 +115,7 @@ def ensure_tables():
     ''')
     conn.commit()
     conn.close()
+    ensure_queue_schema(SIGNAL_POOL_DB)
 
 def save_trade(trade, is_open=True, side='long'):
     with ORDER_LOCK:
@@ -164,52 +168,16 @@ def save_signal(signal, status="FILLED"):
 
 def fetch_waiting_signals():
     try:
-        now_ts = int(time.time())
-        conn = sqlite3.connect(SIGNAL_POOL_DB)
-        rows = conn.execute('''
-            SELECT id, instId, interval, ts, close, vol, signal_type, meta,
-                   IFNULL(priority, 3), IFNULL(promotion_level, 0), IFNULL(expire_ts, 0)
-            FROM signals
-            WHERE status='WAIT_SIMU'
-              AND (expire_ts IS NULL OR expire_ts=0 OR expire_ts > ?)
-            ORDER BY priority ASC, promotion_level DESC, ts ASC
-        ''', (now_ts,)).fetchall()
-        conn.close()
-        signals = []
-        for r in rows:
-            sid, inst, interval, ts, close, vol, sigtype, meta, priority, promotion_level, expire_ts = r
-            try:
-                m = json.loads(meta) if meta else {}
-            except Exception:
-                m = {}
-            signals.append({
-                'id': sid,
-                'instId': inst,
-                'interval': interval,
-                'ts': ts,
-                'close': close,
-                'vol': vol,
-                'signal_type': sigtype,
-                'meta': m,
-                'priority': priority,
-                'promotion_level': promotion_level,
-                'expire_ts': expire_ts
-            })
-        return signals
+        # WAIT_SIMU 还要给 distribute_live_signals 分流，这里只读不认领；走 (status, priority, ...) 索引
+        return peek("WAIT_SIMU", limit=FETCH_LIMIT, db_path=SIGNAL_POOL_DB)
     except Exception as e:
         print(f"{FAILED_COLOR}[读取信号失败] {e}{RESET_COLOR}")
         write_health_status("ERROR", f"fetch_waiting_signals: {e}")
         return []
 
-def mark_signal_done(sid, status="DONE"):
+def mark_signal_done(sid, status="DONE", wait=False):
     try:
-        conn = sqlite3.connect(SIGNAL_POOL_DB)
-        conn.execute(
-            "UPDATE signals SET status=?, detected_at=? WHERE id=?",
-            (status, datetime.datetime.utcnow().isoformat(), sid)
-        )
-        conn.commit()
-        conn.close()
+        ack_many([(sid, status)], db_path=SIGNAL_POOL_DB, wait=wait)
     except Exception as e:
         print(f"{FAILED_COLOR}[更新信号状态失败] {e}{RESET_COLOR}")
         write_health_status("ERROR", f"mark_signal_done: {e}")
@@ -231,12 +199,13 @@ def main():
     gateway = make_gateway()  # ✅ 网关在这里实例化
     counter = 0
     reject_reason_stat = {}
+    sub = subscribe(SIGNAL_POOL_DB)  # 有新信号写入立即唤醒，5 秒兜底
 
     while True:
         write_health_status('OK')
         signals = fetch_waiting_signals()
         if not signals:
-            time.sleep(5)
+            sub.wait(5)
             continue
 
         ai_param_groups = load_ai_pool(min_win_rate=0, min_score=0, top_k=10)
@@ -271,6 +240,8 @@ def main():
                     reject_reason_stat[reason] = reject_reason_stat.get(reason, 0) + 1
 
             mark_signal_done(sig['id'], 'DONE')
+        # 本轮确认批量落盘后再取下一轮，避免同一信号被读到两次
+        flush_acks(SIGNAL_POOL_DB)
 
         counter += 1
         if counter % 5 == 0:
@@ -1,10 +1,14 @@
 # core/zero_engine.py
-import os, json, time, math, sqlite3, threading, datetime, traceback
+import os, time, math, sqlite3, threading, datetime, traceback
 from decimal import Decimal
 
 from core.okx_trader import OKXTrader
+from core.dispatcher import SignalDispatcher, BudgetLedger
 from utils.config import SIGNAL_POOL_DB, TRADES_DB, ZERO_LOG, HEALTH_LOG, STRATEGY_POOL_DB
 from utils.allowlist import is_gid_allowed
+from utils.signal_queue import (ensure_queue_schema, claim, ack_many, reclaim_expired, extend_lease, signal_lag_ms,
+                                LEASE_SEC)
+from utils.signal_notify import subscribe, LagStats
 
 FAIL = '\033[91m'; OK = '\033[92m'; END = '\033[0m'
 HEARTBEAT_INTERVAL = 60
@@ -14,6 +18,13 @@ RISK_FRACTION = 0.05   # 总余额的 5% 用于本轮下单预算池
 MIN_BUDGET    = 10.0   # 单信号最小预算
 MAX_BUDGET    = 200.0  # 单信号最大预算
 ALLOWLIST_REFRESH_SEC = 60  # 白名单&权重刷新周期
+CLAIM_BATCH = int(os.environ.get("ZERO_CLAIM_BATCH", "50"))  # 每次认领的信号条数
+MAX_QUEUED = int(os.environ.get("ZERO_MAX_QUEUED", str(2 * CLAIM_BATCH)))  # 分发队列积压超过这个数就暂停认领
+LEASE_RENEW_SEC = max(1.0, LEASE_SEC / 3)  # 排队 / 在途信号的续租间隔
+OWNER = f"zero-{os.getpid()}"
+_RENEWED = {}   # 信号 id -> 最近一次续租后的租约到期时间（keep_leases 整体替换）
+WORKERS = int(os.environ.get("ZERO_WORKERS", "4"))  # 并发下单 worker 数（同一 instId 仍串行）
+IDLE_WAIT_SEC = float(os.environ.get("ZERO_IDLE_WAIT", "2"))  # 无信号时等待写入通知的兜底超时
 MODE = os.getenv("FT_MODE", "paper").strip().lower()
 
 def _assert_gid_not_null(gid):
@@ -57,6 +68,7 @@ def ensure_tables():
         expire_ts INTEGER DEFAULT 0
     )""")
     conn.commit(); conn.close()
+    ensure_queue_schema(SIGNAL_POOL_DB)
 
     conn2 = sqlite3.connect(TRADES_DB)
     conn2.execute("""
@@ -72,39 +84,28 @@ def ensure_tables():
     )""")
     conn2.commit(); conn2.close()
 
-def mark_signal_done(sid, status="DONE"):
-    conn = sqlite3.connect(SIGNAL_POOL_DB)
-    conn.execute("UPDATE signals SET status=?, detected_at=? WHERE id=?",
-                 (status, datetime.datetime.utcnow().isoformat(), sid))
-    conn.commit(); conn.close()
+def mark_signal_done(sid, status="DONE", wait=False, owner=None):
+    # 批量写线程合并提交；认领后的信号处于租约中，不会被重复取到；wait=True 时阻塞到落盘
+    ack_many([(sid, status)], db_path=SIGNAL_POOL_DB, wait=wait, owner=owner)
 
-def fetch_wait_live():
-    now_ts = int(time.time())
-    sql = """
-    SELECT id, instId, COALESCE(period, interval), ts, close, vol, signal_type, meta,
-           IFNULL(priority,3), IFNULL(promotion_level,0), IFNULL(expire_ts,0)
-    FROM signals
-    WHERE status='WAIT_LIVE'
-      AND (expire_ts IS NULL OR expire_ts=0 OR expire_ts > ?)
-    ORDER BY priority ASC, promotion_level DESC, ts ASC
-    """
-    conn = sqlite3.connect(SIGNAL_POOL_DB)
-    rows = conn.execute(sql, (now_ts,)).fetchall()
-    conn.close()
-    out = []
-    for r in rows:
-        sid, inst, period, ts, close, vol, sigtype, meta, pri, promo, exp = r
+def fetch_wait_live(n=CLAIM_BATCH):
+    """原子认领 WAIT_LIVE 信号（带租约），崩溃后租约到期自动放回"""
+    reclaim_expired("WAIT_LIVE", db_path=SIGNAL_POOL_DB)
+    return claim("WAIT_LIVE", n=n, owner=OWNER, db_path=SIGNAL_POOL_DB)
+
+def keep_leases(dispatcher):
+    """排队中 / 在途的信号定期续租：在 lane 里等得比租约久也不会被 reclaim_expired 放回、再认领一次重复下单"""
+    global _RENEWED
+    while True:
+        time.sleep(LEASE_RENEW_SEC)
         try:
-            m = json.loads(meta) if meta else {}
-        except:
-            m = {}
-        out.append({
-            "id": sid, "instId": inst, "period": period or "",
-            "ts": int(ts or 0), "price": float(close or 0), "vol": float(vol or 0),
-            "signal_type": sigtype or "", "meta": m,
-            "priority": pri, "promotion_level": promo, "expire_ts": exp
-        })
-    return out
+            ids = dispatcher.pending_ids()
+            until = int(time.time()) + LEASE_SEC
+            if ids:
+                extend_lease(ids, owner=OWNER, db_path=SIGNAL_POOL_DB, wait=True)
+            _RENEWED = {i: until for i in ids}
+        except Exception as e:
+            log(f"{FAIL}[续租异常] {e}{END}")
 
 def record_trade(instId, action, price, vol, status, comment):
     conn = sqlite3.connect(TRADES_DB)
@@ -173,6 +174,20 @@ def load_allow_weights():
     s = sum(wmap.values()) if wmap else 0.0
     return wmap, s, datetime.datetime.utcnow().isoformat()
 
+def on_order_done(pl, ord_id, fut):
+    """订单终态回调（WS 推送线程或轮询线程里执行）"""
+    sig, gid = pl["sig"], pl["gid"]
+    try:
+        done = fut.result()
+        state = (done or {}).get("state")
+        log(f"[AI组 {gid}] 下单完成 state={state} ordId={ord_id} budget={pl['budget']:.2f} ({pl['reason']})")
+        record_trade(sig["instId"], pl["side"], sig["price"], float(pl["sz"]),
+                     "OPEN", f"gid={gid}|budget={pl['budget']:.2f}|lev={pl['lev']}|w={pl['w']:.4f}")
+        mark_signal_done(sig["id"], "DONE")
+    except Exception as e:
+        log(f"{FAIL}[成交回报异常] gid={gid} {sig['instId']} ordId={ord_id} err={e}{END}")
+        mark_signal_done(sig["id"], "ERROR")
+
 def heartbeat():
     while True:
         try:
@@ -186,30 +201,160 @@ def main():
     threading.Thread(target=heartbeat, daemon=True).start()
     log(f"Zero Engine 启动（MODE={MODE}，实盘仅放行白名单分组，按 allowlist.weight 分配预算）")
     t = OKXTrader()
+    try:
+        t.start_order_tracker()   # 私有 WS 推送成交，主循环不再阻塞等单
+        log("订单跟踪：私有 WebSocket 已启动")
+    except Exception as e:
+        log(f"{FAIL}[订单跟踪] 私有 WebSocket 不可用，退化为后台轮询: {e}{END}")
 
-    # 权重缓存
+    # 权重缓存 / 失败退避，worker 线程共享
     weights_map, weights_sum, weights_updated = load_allow_weights()
+    ctx = {"weights_map": weights_map, "weights_sum": weights_sum, "total_pool": 0.0,
+           "consecutive_fail": 0, "cooldown_until": 0.0}
+    ctx_lock = threading.Lock()
     last_refresh = time.time()
+    ledger = BudgetLedger()
+    lag = LagStats()                    # K线收盘 / 入库 → 取出 / 下单回报
+    sub = subscribe(SIGNAL_POOL_DB)     # 有新信号写入立即唤醒，不再固定 sleep 轮询
+
+    def on_fail(sig, gid, err):
+        with ctx_lock:
+            ctx["consecutive_fail"] += 1
+            backoff = min(60, 2 ** min(6, ctx["consecutive_fail"]))
+            ctx["cooldown_until"] = time.time() + backoff
+        log(f"{FAIL}[下单异常] gid={gid} {sig['instId']} err={err}，{backoff}s 后重试{END}")
+        mark_signal_done(sig["id"], "ERROR")
+
+    def handle(sig):
+        """单个信号：时效 → 白名单 → 预算（账本预留）→ 张数 → 下单；成交回报异步落库"""
+        # 在 lane 里排队可能远超 SIGNAL_EXPIRE_SEC：过期的 / 租约已失效（可能已被别人重新认领）的不再下单
+        now = time.time()
+        if sig.get("expire_ts") and sig["expire_ts"] <= now:
+            log(f"[过期] {sig['instId']} {sig['signal_type']} 信号已过期 {now - sig['expire_ts']:.1f}s，不下单")
+            mark_signal_done(sig["id"], "EXPIRED", owner=OWNER)
+            return
+        if max(sig.get("lease_until") or 0, _RENEWED.get(sig["id"], 0)) <= now:
+            log(f"{FAIL}[租约失效] {sig['instId']} {sig['signal_type']} 租约已过期，不下单{END}")
+            mark_signal_done(sig["id"], "EXPIRED", owner=OWNER)
+            return
+
+        gid = (
+            sig["meta"].get("param_group_id")
+            or sig["meta"].get("gid")
+            or sig["meta"].get("group_id")
+            or sig["meta"].get("group")
+        )
+        if not gid:
+            log(f"{FAIL}[SKIP] 信号缺少分组ID: {sig}{END}")
+            mark_signal_done(sig["id"], "SKIP_NO_GID")
+            return
+        gid = int(gid)
+
+        if not is_gid_allowed(gid):
+            log(f"[白名单拒绝] gid={gid} 非今日白名单，跳过 {sig['instId']}")
+            mark_signal_done(sig["id"], "SKIP_NOT_ALLOWED")
+            return
+
+        # 按权重分配单信号预算
+        with ctx_lock:
+            wmap, wsum, total_pool = ctx["weights_map"], ctx["weights_sum"], ctx["total_pool"]
+        w = float(wmap.get(gid, 0.0))
+        if wsum <= 0 or w <= 0:
+            # 权重不可用：均分退化
+            usdt_budget = min(MAX_BUDGET, max(MIN_BUDGET, total_pool))
+            reason = "fallback_equal"
+        else:
+            frac = w / wsum
+            usdt_budget = total_pool * frac
+            usdt_budget = min(MAX_BUDGET, max(MIN_BUDGET, usdt_budget))
+            reason = f"weight={w:.4f}/{wsum:.4f} -> frac={frac:.4%}"
+
+        # 并发下单共享预算池：预留不到最小预算就跳过
+        token, usdt_budget = ledger.reserve(usdt_budget, MIN_BUDGET)
+        if token is None:
+            log(f"{FAIL}[预算用尽] gid={gid} 本轮预算池剩余 {ledger.available():.2f}，跳过 {sig['instId']}{END}")
+            mark_signal_done(sig["id"], "SKIP_BUDGET")
+            return
+
+        side = sig["meta"].get("side")
+        if not side:
+            side = "buy" if str(sig["signal_type"]).upper().endswith("UP") else "sell"
+
+        lev = int(sig["meta"].get("lev") or 10)
+        sz = size_from_budget(t, sig["instId"], usdt_budget, lev)
+        if not sz or float(sz) <= 0:
+            ledger.release(token)
+            log(f"{FAIL}[SIZE_ZERO] gid={gid} 预算={usdt_budget:.2f} 无法覆盖合约最小门槛：{sig['instId']}{END}")
+            mark_signal_done(sig["id"], "SKIP_SIZE_ZERO")
+            return
+
+        raw_tp = sig["meta"].get("tp")
+        raw_sl = sig["meta"].get("sl")
+        tp, sl = tp_sl_sanity(side, sig["price"], raw_tp, raw_sl)
+        if raw_tp and not tp: log(f"[TP过滤] {raw_tp} 不合法，已忽略")
+        if raw_sl and not sl: log(f"[SL过滤] {raw_sl} 不合法，已忽略")
+
+        pl = {"sig": sig, "gid": gid, "side": side, "sz": sz, "lev": lev, "w": w,
+              "budget": usdt_budget, "reason": reason}
+        try:
+            _assert_gid_not_null(gid)
+            resp = t.open_order(
+                instId=sig["instId"], side=side, sz=sz, lever=lev,
+                tdMode="cross", ordType="market",
+                tp=tp, sl=sl, reduceOnly=False, clOrdId=None, t_signal=sig["t_pick"]
+            )
+            if str(resp.get("code")) != "0":
+                raise RuntimeError(resp)
+
+            ord_id = (resp.get("data") or [{}])[0].get("ordId")
+            # 先标记已发送并等落盘，再让分发器忘掉这个 id（之后不再续租）；成交回报到达后在回调里落库
+            mark_signal_done(sig["id"], "SENT", wait=True)
+            ledger.commit(token)
+            for stage, ms in signal_lag_ms(sig).items():
+                lag.add(f"{stage}→order", ms)
+            t.wait_order_filled_async(sig["instId"], ordId=ord_id).add_done_callback(
+                lambda fut: on_order_done(pl, ord_id, fut))
+            with ctx_lock:
+                ctx["consecutive_fail"] = 0
+        except Exception as e:
+            ledger.release(token)
+            on_fail(sig, gid, e)
 
-    consecutive_fail = 0
-    cooldown_until = 0
+    dispatcher = SignalDispatcher(handle, workers=WORKERS, name="zero")
+    threading.Thread(target=keep_leases, args=(dispatcher,), daemon=True).start()
 
     while True:
         try:
             # 定期刷新白名单权重
             if time.time() - last_refresh > ALLOWLIST_REFRESH_SEC:
                 weights_map, weights_sum, weights_updated = load_allow_weights()
+                with ctx_lock:
+                    ctx["weights_map"], ctx["weights_sum"] = weights_map, weights_sum
                 last_refresh = time.time()
                 log(f"[allowlist] refreshed: {len(weights_map)} gids, sum={weights_sum:.4f}")
+                lat = t.order_latency_stats()
+                if lat["count"]:
+                    log(f"[下单延迟] 最近{lat['count']}笔 信号→回报 {lat.get('signal_ms')} 前置 {lat.get('pre_ms')} 发送 {lat.get('send_ms')}")
+                log(f"[分发] {dispatcher.stats()}")
+                log(f"[信号延迟] {lag.stats()}")
 
-            if time.time() < cooldown_until:
+            if time.time() < ctx["cooldown_until"]:
                 time.sleep(2); continue
 
-            sigs = fetch_wait_live()
+            # 背压：分发队列积压时不再认领，积压的信号留在库里，交给其它实例或等 lane 消化
+            room = MAX_QUEUED - dispatcher.depth()
+            if room <= 0:
+                time.sleep(0.2); continue
+
+            sigs = fetch_wait_live(min(CLAIM_BATCH, room))
             if not sigs:
-                time.sleep(2); continue
+                sub.wait(IDLE_WAIT_SEC); continue
+            t_pick = time.time()  # 信号取出时刻，用于统计信号→下单回报延迟
+            for s in sigs:
+                for stage, ms in signal_lag_ms(s, t_pick).items():
+                    lag.add(f"{stage}→pick", ms)
 
-            # 计算本轮总可用预算池
+            # 计算本轮总可用预算池（账本只清掉查余额之前的预留）
             balance = float(t.get_available_balance("USDT") or 0)
             if balance <= 0:
                 log(f"{FAIL}[资金不足] 可用USDT=0，全部跳过{END}")
@@ -218,80 +363,13 @@ def main():
                 time.sleep(3)
                 continue
             total_pool = max(MIN_BUDGET, balance * RISK_FRACTION)
+            with ctx_lock:
+                ctx["total_pool"] = total_pool
+            ledger.refresh(total_pool, as_of=t_pick)
 
             for sig in sigs:
-                gid = (
-                    sig["meta"].get("param_group_id")
-                    or sig["meta"].get("gid")
-                    or sig["meta"].get("group_id")
-                    or sig["meta"].get("group")
-                )
-                if not gid:
-                    log(f"{FAIL}[SKIP] 信号缺少分组ID: {sig}{END}")
-                    mark_signal_done(sig["id"], "SKIP_NO_GID")
-                    continue
-                gid = int(gid)
-
-                if not is_gid_allowed(gid):
-                    log(f"[白名单拒绝] gid={gid} 非今日白名单，跳过 {sig['instId']}")
-                    mark_signal_done(sig["id"], "SKIP_NOT_ALLOWED")
-                    continue
-
-                # 按权重分配单信号预算
-                w = float(weights_map.get(gid, 0.0))
-                if weights_sum <= 0 or w <= 0:
-                    # 权重不可用：均分退化
-                    usdt_budget = min(MAX_BUDGET, max(MIN_BUDGET, total_pool))
-                    reason = "fallback_equal"
-                else:
-                    frac = w / weights_sum
-                    usdt_budget = total_pool * frac
-                    usdt_budget = min(MAX_BUDGET, max(MIN_BUDGET, usdt_budget))
-                    reason = f"weight={w:.4f}/{weights_sum:.4f} -> frac={frac:.4%}"
-
-                side = sig["meta"].get("side")
-                if not side:
-                    side = "buy" if str(sig["signal_type"]).upper().endswith("UP") else "sell"
-
-                lev = int(sig["meta"].get("lev") or 10)
-                sz = size_from_budget(t, sig["instId"], usdt_budget, lev)
-                if not sz or float(sz) <= 0:
-                    log(f"{FAIL}[SIZE_ZERO] gid={gid} 预算={usdt_budget:.2f} 无法覆盖合约最小门槛：{sig['instId']}{END}")
-                    mark_signal_done(sig["id"], "SKIP_SIZE_ZERO")
-                    continue
-
-                raw_tp = sig["meta"].get("tp")
-                raw_sl = sig["meta"].get("sl")
-                tp, sl = tp_sl_sanity(side, sig["price"], raw_tp, raw_sl)
-                if raw_tp and not tp: log(f"[TP过滤] {raw_tp} 不合法，已忽略")
-                if raw_sl and not sl: log(f"[SL过滤] {raw_sl} 不合法，已忽略")
-
-                try:
-                    _assert_gid_not_null(gid)
-                    resp = t.open_order(
-                        instId=sig["instId"], side=side, sz=sz, lever=lev,
-                        tdMode="cross", ordType="market",
-                        tp=tp, sl=sl, reduceOnly=False, clOrdId=None
-                    )
-                    if str(resp.get("code")) != "0":
-                        raise RuntimeError(resp)
-
-                    ord_id = (resp.get("data") or [{}])[0].get("ordId")
-                    done = t.wait_order_filled(sig["instId"], ordId=ord_id)
-                    state = (done or {}).get("state")
-                    log(f"[AI组 {gid}] 下单完成 state={state} ordId={ord_id} budget={usdt_budget:.2f} ({reason})")
-
-                    record_trade(sig["instId"], side, sig["price"], float(sz),
-                                 "OPEN", f"gid={gid}|budget={usdt_budget:.2f}|lev={lev}|w={w:.4f}")
-                    mark_signal_done(sig["id"], "DONE")
-                    consecutive_fail = 0
-
-                except Exception as e:
-                    consecutive_fail += 1
-                    backoff = min(60, 2 ** min(6, consecutive_fail))
-                    cooldown_until = time.time() + backoff
-                    log(f"{FAIL}[下单异常] gid={gid} {sig['instId']} err={e}，{backoff}s 后重试{END}")
-                    mark_signal_done(sig["id"], "ERROR")
+                sig["t_pick"] = t_pick
+                dispatcher.submit(sig)   # 已在队列/在途的信号会被去重
 
         except Exception as e:
             log(f"{FAIL}[主循环异常] {e}\n{traceback.format_exc()}{END}")
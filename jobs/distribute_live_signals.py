@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
-import os, time, sqlite3, json, traceback
+import os, time, sqlite3, traceback
 from utils.config import LOG_DIR, STRATEGY_POOL_DB, SIGNAL_POOL_DB
+from utils.signal_queue import ensure_queue_schema, peek
+from utils.signal_notify import subscribe
+from utils.db_writer import connect_tuned
 
 LOG_PATH = os.path.join(LOG_DIR, "live_dist.log")
 EXPIRE_SEC = int(os.getenv("LIVE_DIST_EXPIRE", "300"))   # 默认 5 分钟
@@ -36,60 +39,58 @@ def allowed_gids():
 def main_loop():
     log("[LIVE-DIST] start", also_print=True)
     last_beat = 0
+    ensure_queue_schema(SIGNAL_POOL_DB)
+    sub = subscribe(SIGNAL_POOL_DB)   # 信号库有写入立即唤醒，LIVE_DIST_SLEEP 只作兜底
     while True:
         try:
             allow = allowed_gids()
             now_ts = int(time.time())
 
             moved = expired = scanned = 0
-            with sqlite3.connect(SIGNAL_POOL_DB) as con:
-                rows = con.execute(f"""
-                    SELECT id, instId, COALESCE(period, interval), ts, close, vol, signal_type, meta
-                    FROM signals
-                    WHERE status='WAIT_SIMU'
-                    ORDER BY ts ASC
-                    LIMIT {BATCH_LIMIT}
-                """).fetchall()
+            # 走 (status, ts) 索引只取本批，状态变更收集后一次 executemany 提交
+            rows = peek("WAIT_SIMU", limit=BATCH_LIMIT, db_path=SIGNAL_POOL_DB, order="ts", skip_expired=False)
+            scanned = len(rows)
+            updates = []
+            for sig in rows:
+                m = sig["meta"]
+                gid = m.get("param_group_id") or m.get("gid")
+                if not gid:
+                    updates.append(("SKIP_NO_GID", sig["id"]))
+                    continue
 
-                scanned = len(rows)
-                for sid, inst, period, ts, close, vol, sigtype, meta in rows:
-                    try:
-                        m = json.loads(meta) if meta else {}
-                    except:
-                        m = {}
-                    gid = m.get("param_group_id") or m.get("gid")
-                    if not gid:
-                        con.execute("UPDATE signals SET status='SKIP_NO_GID' WHERE id=?", (sid,))
-                        continue
+                # 过期控制
+                if now_ts - sig["ts"] > EXPIRE_SEC:
+                    updates.append(("EXPIRED", sig["id"]))
+                    expired += 1
+                    continue
 
-                    # 过期控制
-                    try:
-                        sig_ts = int(ts or 0)
-                    except:
-                        sig_ts = 0
-                    if now_ts - sig_ts > EXPIRE_SEC:
-                        con.execute("UPDATE signals SET status='EXPIRED' WHERE id=?", (sid,))
-                        expired += 1
-                        continue
+                # 白名单 gating
+                if int(gid) in allow:
+                    updates.append(("WAIT_LIVE", sig["id"]))
+                    moved += 1
+                else:
+                    # 白名单之外保持 WAIT_SIMU
+                    pass
 
-                    # 白名单 gating
-                    if int(gid) in allow:
-                        con.execute("UPDATE signals SET status='WAIT_LIVE' WHERE id=?", (sid,))
-                        moved += 1
-                    else:
-                        # 白名单之外保持 WAIT_SIMU
-                        pass
+            if updates:
+                con = connect_tuned(SIGNAL_POOL_DB)
+                try:
+                    # 只改仍是 WAIT_SIMU 的，trade_engine 已处理掉的不回写
+                    con.executemany("UPDATE signals SET status=? WHERE id=? AND status='WAIT_SIMU'", updates)
+                    con.commit()
+                finally:
+                    con.close()
 
-                con.commit()
-
-            # 每轮都打印一条统计，便于观察
-            log(f"[LIVE-DIST] scanned={scanned}, moved={moved}, expired={expired}, allow_cnt={len(allow)}", also_print=True)
+            # 有变更或每分钟打印一条统计（被写入唤醒后轮次变密，不再每轮都打）
+            if updates or time.time() - last_beat >= 60:
+                log(f"[LIVE-DIST] scanned={scanned}, moved={moved}, expired={expired}, allow_cnt={len(allow)}", also_print=True)
+                last_beat = time.time()
 
         except Exception as e:
             log(f"[ERROR] {e}\n{traceback.format_exc()}", also_print=True)
 
-        # 心跳节流
-        time.sleep(SLEEP_SECONDS)
+        # 等新信号写入（或兜底超时）
+        sub.wait(SLEEP_SECONDS)
 
 if __name__ == "__main__":
     main_loop()
@@ -10,6 +10,7 @@ if ROOT not in sys.path:
 
 from utils.config import DB_DIR
 from core.okx_trader import OKXTrader
+from utils.kline_store import get_kline_store
 
 REVIEW_DB = os.path.join(DB_DIR, "review.db")
 
@@ -96,6 +97,15 @@ def kline_from_okx(t:OKXTrader, instId:str, start_ts:int, mins:int) -> List[Tupl
     统一返回 [(ts, o,h,l,c,vol)] 升序。
     """
     end_ts = start_ts + mins*60 + 60
+    need_missing = (end_ts - start_ts + 1) // 60 + 1
+
+    # 本地 K 线库（采集器已落库）够用就不碰缓存表和 OKX
+    if BAR == "1m":
+        k = get_kline_store().get(instId, BAR, start=start_ts, end=end_ts)
+        if len(k.ts) >= need_missing:
+            return list(zip(k.ts.tolist(), k.open.tolist(), k.high.tolist(),
+                            k.low.tolist(), k.close.tolist(), k.vol.tolist()))
+
     conn = open_db(REVIEW_DB)
     cur = conn.cursor()
 
@@ -109,7 +119,6 @@ def kline_from_okx(t:OKXTrader, instId:str, start_ts:int, mins:int) -> List[Tupl
     have = {r[0] for r in cached}
 
     # 不足再补
-    need_missing = (end_ts - start_ts + 1) // 60 + 1
     if len(cached) < need_missing:
         rows = t.get_kline_range(instId, bar=BAR,
                                  start_ts=start_ts-60, end_ts=end_ts+60,
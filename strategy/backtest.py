@@ -0,0 +1,524 @@
+# strategy/backtest.py
+"""
+回测引擎：存量 K 线 → 信号 → ai_risk_decision 定杠杆/仓位/TP/SL/追踪止盈 → 手续费 + 滑点 → 每组 ai_params 的 PnL 指标
+
+  python -m strategy.backtest --days 30 --bar 1m                      # 全部 instId × 参数池前 5 组
+  python -m strategy.backtest --start 2025-01-01 --end 2026-01-01 --insts BTC-USDT-SWAP,ETH-USDT-SWAP --groups 3,7
+  python -m strategy.backtest --source signals                       # 回放 signals 库里的历史信号（含盘口/成交流 tick 信号）
+
+两层：
+- 单 instId（按根向量化）：规则在 [1 × T] 面板上一次求值得到入场点；持仓内的出场按块向前搜
+  （最高价累计最大值 → 追踪止损线，一次比较找到第一根触发 TP / 止损 / 追踪 / 强平的 K 线），
+  一年 1m ≈ 52 万根，整段只扫一遍；瓶颈在读库，大区间建议 KLINE_STORE=columnar（见 utils/kline_store）
+- 组合（事件驱动）：所有 instId 的成交按开仓时间合并，平仓先于同时刻开仓结算；
+  开仓保证金 = 已实现权益 × max_pos_ratio，占用超过权益或当日开仓数达到 MAX_TRADE_PER_DAY 时跳过该笔
+
+成交口径（保守）：
+- 信号 K 线收盘后下一根开盘价入场，入场 / 止损 / 追踪 / 到期平仓按 BACKTEST_SLIPPAGE 吃滑点，TP 按限价成交不吃滑点
+- 跳空越过止损按开盘价成交；同一根同时够到 TP 和止损时按止损算
+- tf() 跨周期条件按收盘时间对齐：信号 K 线只能看到在它收盘时已收盘的高周期 K 线
+- 追踪止损线取入场到上一根的最高（空单最低）价，当根的极值不参与当根判断
+- 强平价 = 入场价 ∓ FORCE_CLOSE_RATIO / 杠杆；单笔亏损不超过保证金
+- 手续费 FEE_RATE 按开平两边名义价值收；同一 instId 同时只持一笔，不加仓（add_pos 不模拟）
+
+结果：SIMU_TRADES_DB 的 backtest_runs（每组一行指标）/ backtest_trades（逐笔），
+并把 win_rate / profit_rate / trade_count / max_drawdown / sharpe / score 写回 ai_params
+（成交不足 BACKTEST_MIN_TRADES 笔时不改 score，只更新其余指标）
+"""
+import os
+import time
+import json
+import heapq
+import sqlite3
+import argparse
+import datetime
+
+import numpy as np
+
+from ailearning.ai_engine import ai_risk_decision, load_ai_pool, ensure_ai_params_table
+from strategy import signal_rules as sr
+from utils.config import SIMU_TRADES_DB, AI_PARAMS_DB, SIGNAL_POOL_DB
+from utils.db_upgrade import ensure_table_fields
+from utils.kline_store import get_kline_store
+from utils.signal_queue import PERIOD_SECONDS
+
+BACKTEST_BAR = os.environ.get("BACKTEST_BAR", "1m")
+BACKTEST_DAYS = int(os.environ.get("BACKTEST_DAYS", "30"))
+INITIAL_EQUITY = float(os.environ.get("BACKTEST_EQUITY", "10000"))
+SLIPPAGE = float(os.environ.get("BACKTEST_SLIPPAGE", "0.0005"))           # 5bp
+MIN_TRADES = int(os.environ.get("BACKTEST_MIN_TRADES", "10"))
+SHORT_WORDS = ("DOWN", "SELL", "SHORT", "BEAR")
+
+FAILED_COLOR = '\033[91m'
+OK_COLOR = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+BACKTEST_RUNS_FIELDS = {
+    "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+    "param_group_id": "INTEGER",
+    "bar": "TEXT",
+    "source": "TEXT",
+    "start_ts": "INTEGER",
+    "end_ts": "INTEGER",
+    "insts": "INTEGER",
+    "trade_count": "INTEGER",
+    "win_rate": "REAL",
+    "profit_rate": "REAL",
+    "max_drawdown": "REAL",
+    "sharpe": "REAL",
+    "profit_factor": "REAL",
+    "fees": "REAL",
+    "final_equity": "REAL",
+    "skipped": "INTEGER",
+    "exit_reasons": "TEXT",
+    "params_json": "TEXT",
+    "elapsed_sec": "REAL",
+    "created_at": "TEXT"
+}
+BACKTEST_TRADES_FIELDS = {
+    "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+    "run_id": "INTEGER",
+    "param_group_id": "INTEGER",
+    "instId": "TEXT",
+    "side": "TEXT",
+    "signal_type": "TEXT",
+    "entry_ts": "INTEGER",
+    "entry_px": "REAL",
+    "exit_ts": "INTEGER",
+    "exit_px": "REAL",
+    "exit_reason": "TEXT",
+    "lever": "REAL",
+    "margin": "REAL",
+    "ret": "REAL",
+    "pnl": "REAL",
+    "fee": "REAL"
+}
+
+
+def side_of(signal_type, side=None):
+    """规则 / 信号的方向：显式 side 优先，否则 signal_type 含 DOWN/SELL/SHORT/BEAR 记空，其余记多"""
+    if side:
+        return -1 if str(side).lower() in ("short", "sell", "-1") else 1
+    t = str(signal_type or "").upper()
+    return -1 if any(w in t for w in SHORT_WORDS) else 1
+
+
+def parse_day(s):
+    if s is None:
+        return None
+    if str(s).isdigit():
+        return int(s)
+    return int(datetime.datetime.fromisoformat(str(s)).replace(tzinfo=datetime.timezone.utc).timestamp())
+
+
+# =============== 数据 ===============
+def load_klines(store, instId, bar, start, end):
+    """[start, end) 的 K 线，不经过窗口缓存（回测区间远大于实时窗口，进缓存只会把实时窗口挤掉）"""
+    k = store.get_all(bar, start, [instId]).get(instId)
+    if k is None or not len(k.ts):
+        return None
+    n = int(np.searchsorted(k.ts, end, side="left"))
+    return type(k)(*(a[:n] for a in k)) if n < len(k.ts) else k
+
+
+def warmup_sec(rules, bar):
+    """区间起点往前多读的秒数，保证起点处的指标窗口已满"""
+    return (max([r.lookback for r in rules if r.applies(bar)] or [0]) + 2) * PERIOD_SECONDS.get(bar, 60)
+
+
+def _kline_panel(k):
+    return sr.build_panel({"_": k}, len(k.ts))[1]
+
+
+class Entries:
+    """单 instId 的候选入场：信号所在 K 线下标（下一根开盘入场）、分数、方向、信号名，均按下标升序"""
+    __slots__ = ("idx", "score", "side", "name")
+
+    def __init__(self, idx, score, side, name):
+        self.idx, self.score, self.side, self.name = idx, score, side, name
+
+    def __len__(self):
+        return len(self.idx)
+
+
+def entries_from_rules(rules, k, bar, start, fetch=None):
+    """规则在 [1 × T] 面板上一次求值；同一根多条规则命中取 score 最高的一条（同分取配置里靠前的）
+    fetch(tf, since) -> 该 instId 的 tf 周期 K 线，供 tf() 跨周期条件使用；
+    tf() 按收盘时间对齐，信号根只能看到在它收盘时已经收盘的高周期 K 线，不会用到未来的收盘价"""
+    rules = [r for r in rules if r.applies(bar)]
+    if not rules or k is None or len(k.ts) < 2:
+        return Entries(np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int8), [])
+
+    def loader(tf):
+        need = max(r.needs.get(tf, 0) for r in rules) + 2
+        sub = fetch(tf, int(k.ts[0]) - need * PERIOD_SECONDS.get(tf, 60)) if fetch else None
+        if sub is None or not len(sub.ts):
+            return _kline_panel(type(k)(*(a[:0] for a in k)))
+        n = int(np.searchsorted(sub.ts, int(k.ts[-1]), side="right"))
+        return _kline_panel(type(sub)(*(a[:n] for a in sub)))
+
+    _, masks = sr.evaluate(rules, _kline_panel(k), loader, period=bar)
+    m = np.stack([mask[0] for _, mask in masks])                      # [R, T]
+    scores = np.array([r.score for r in rules])
+    sides = np.array([side_of(r.signal_type, r.side) for r in rules], dtype=np.int8)
+    best = np.argmax(np.where(m, scores[:, None], -np.inf), axis=0)
+    fire = m.any(axis=0) & (k.ts >= start)
+    fire[-1] = False                                                  # 最后一根之后没有下一根可入场
+    idx = np.flatnonzero(fire)
+    picked = best[idx]
+    return Entries(idx, scores[picked], sides[picked], [rules[j].signal_type for j in picked])
+
+
+def load_signal_rows(db_path, start, end, insts=None, periods=None):
+    """signals 库里 [start, end) 的历史信号 -> {instId: [(可入场时刻, score, signal_type)]}
+    可入场时刻取写库时间 created_at，但不晚于信号 K 线收盘（冷启动补扫的信号 created_at 会远晚于 K 线）"""
+    sql = "SELECT instId, period, ts, created_at, score, signal_type FROM signals WHERE ts >= ? AND ts < ?"
+    args = [int(start), int(end)]
+    if periods:
+        sql += f" AND period IN ({','.join('?' * len(periods))})"
+        args += list(periods)
+    wanted = set(insts) if insts else None
+    out = {}
+    conn = sqlite3.connect(db_path)
+    try:
+        for inst, period, ts, created, score, stype in conn.execute(sql + " ORDER BY ts", args):
+            if wanted is not None and inst not in wanted:
+                continue
+            at = int(ts) + PERIOD_SECONDS.get(period, 0)
+            if created:
+                at = min(at, int(created))
+            out.setdefault(inst, []).append((at, float(score if score is not None else 7.0), stype))
+    finally:
+        conn.close()
+    return out
+
+
+def entries_from_signals(rows, k, start=None):
+    """历史信号映射到 K 线：信号时刻所在的那根收盘后入场；start 之前（预热段）的信号不入场"""
+    if start is not None and rows:
+        rows = [r for r in rows if r[0] >= start]
+    if not rows or k is None or len(k.ts) < 2:
+        return Entries(np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int8), [])
+    at = np.array([r[0] for r in rows], dtype=np.int64)
+    idx = np.searchsorted(k.ts, at, side="right") - 1
+    ok = (idx >= 0) & (idx < len(k.ts) - 1)
+    idx, keep = np.unique(idx[ok], return_index=True)                  # 同一根多条信号取最早的一条
+    src = np.flatnonzero(ok)[keep]
+    return Entries(idx, np.array([rows[i][1] for i in src]), np.array([side_of(rows[i][2]) for i in src], dtype=np.int8),
+                   [rows[i][2] for i in src])
+
+
+# =============== 单 instId 撮合（按根向量化）===============
+def decision_for(params, score, cache):
+    """同一参数组内 ai_risk_decision 只取决于 score，按 score 缓存"""
+    d = cache.get(score)
+    if d is None:
+        r = ai_risk_decision({"score": score, "vol": 0}, params=params, mode="open")
+        d = cache[score] = None if not r.get("pass") else (
+            float(r["tp"]), float(r["sl"]), float(r["trailing_stop"]), float(r["lever"]), float(r["max_pos_ratio"]))
+    return d
+
+
+def _find_exit(o, h, low, c, e, px, tp, sl, trail, liq):
+    """多头视角（空单传入取负后的价格）：自第 e 根起第一根触发出场的 K 线 -> (下标, 成交价, 原因)
+    固定止损线 = max(止损, 强平)，追踪线 = 上一根为止的最高价 × (1 - trail)，块大小逐步放大"""
+    n = len(o)
+    tp_px = px + tp * abs(px)
+    sl_px, liq_px = px - sl * abs(px), px - liq * abs(px)
+    fixed = max(sl_px, liq_px)
+    peak, i, step = px, e, 64
+    while i < n:
+        j = min(n, i + step)
+        hh, ll = h[i:j], low[i:j]
+        if trail > 0:
+            prev = np.maximum.accumulate(np.concatenate(([peak], hh[:-1])))
+            stop = np.maximum(fixed, prev - trail * np.abs(prev))
+        else:
+            stop = np.full(j - i, fixed)
+        hit_stop, hit_tp = ll <= stop, hh >= tp_px
+        hit = hit_stop | hit_tp
+        if hit.any():
+            x = int(np.argmax(hit))
+            if hit_stop[x]:
+                lvl = stop[x]
+                reason = "trail" if lvl > fixed else ("liq" if liq_px >= sl_px else "sl")
+                return i + x, min(lvl, o[i + x]), reason
+            return i + x, max(tp_px, o[i + x]), "tp"
+        peak = max(peak, float(hh.max()))
+        i, step = j, min(step * 4, 1 << 16)
+    return n - 1, c[n - 1], "end"
+
+
+def simulate_inst(instId, k, entries, params, fee_rate=None, slippage=SLIPPAGE, cache=None):
+    """一个 instId × 一组参数：依次取"上一笔平仓之后"的第一个入场点 -> [trade dict]
+    ret 为扣除手续费、滑点后的名义收益率（未乘杠杆）"""
+    if not len(entries):
+        return []
+    cache = {} if cache is None else cache
+    fee = float(params.get("FEE_RATE", 0.0005) if fee_rate is None else fee_rate)
+    neg = {}
+    trades, pos, n_ent = [], 0, len(entries)
+    while pos < n_ent:
+        sig = int(entries.idx[pos])
+        d = decision_for(params, float(entries.score[pos]), cache)
+        if d is None:
+            pos += 1
+            continue
+        tp, sl, trail, lever, ratio = d
+        s = int(entries.side[pos])
+        if s < 0 and not neg:
+            neg.update(o=-k.open, h=-k.low, low=-k.high, c=-k.close)
+        o, h, low, c = (k.open, k.high, k.low, k.close) if s > 0 else (neg["o"], neg["h"], neg["low"], neg["c"])
+        e = sig + 1
+        px = o[e] + slippage * abs(o[e])
+        liq = float(params.get("FORCE_CLOSE_RATIO", 0.95)) / max(lever, 1.0)
+        x, fill, reason = _find_exit(o, h, low, c, e, px, tp, sl, trail, liq)
+        if reason != "tp":
+            fill = fill - slippage * abs(fill)
+        trade_fee = fee * (1 + abs(float(fill)) / abs(float(px)))
+        ret = float((fill - px) / abs(px)) - trade_fee
+        trades.append({
+            "instId": instId, "side": "long" if s > 0 else "short", "signal_type": entries.name[pos],
+            "entry_ts": int(k.ts[e]), "entry_px": abs(float(px)), "exit_ts": int(k.ts[x]), "exit_px": abs(float(fill)),
+            "exit_reason": reason, "lever": lever, "ratio": ratio, "ret": ret, "fee_rate": trade_fee,
+        })
+        # 平仓那根收盘后才能再发信号入场
+        pos = int(np.searchsorted(entries.idx, x, side="right"))
+    return trades
+
+
+# =============== 组合（事件驱动）===============
+def run_portfolio(trades, params, equity0=INITIAL_EQUITY, start=None, end=None):
+    """所有 instId 的成交合并成一条权益曲线 -> (metrics, 实际成交的 trades（补 margin/pnl/fee）)
+    start/end 为回测区间，日收益按区间内每个自然日计算（缺省取权益曲线首尾）"""
+    max_per_day = int(params.get("MAX_TRADE_PER_DAY", 30) or 0)
+    trades = sorted(trades, key=lambda t: (t["entry_ts"], t["instId"]))
+    equity, used, opened = float(equity0), 0.0, []
+    day_count, done, skipped = {}, [], 0
+    curve = [(trades[0]["entry_ts"] if trades else 0, equity)]
+
+    def settle(until):
+        nonlocal equity, used
+        while opened and opened[0][0] <= until:
+            exit_ts, _, t = heapq.heappop(opened)
+            used -= t["margin"]
+            equity += t["pnl"]
+            curve.append((exit_ts, equity))
+
+    for n, t in enumerate(trades):
+        settle(t["entry_ts"])
+        day = t["entry_ts"] // 86400
+        margin = equity * t["ratio"]
+        if (max_per_day and day_count.get(day, 0) >= max_per_day) or margin <= 0 or used + margin > equity:
+            skipped += 1
+            continue
+        day_count[day] = day_count.get(day, 0) + 1
+        notional = margin * t["lever"]
+        t = dict(t, margin=margin, pnl=max(notional * t["ret"], -margin), fee=notional * t["fee_rate"])
+        used += margin
+        heapq.heappush(opened, (t["exit_ts"], n, t))
+        done.append(t)
+    settle(float("inf"))
+    return _metrics(done, curve, equity0, skipped, start, end), done
+
+
+def daily_equity(curve, equity0, start, end):
+    """已实现权益曲线 -> 区间内每个自然日收盘时的权益（无平仓的日子沿用前一日），首项为期初权益"""
+    ct = np.array([ts for ts, _ in curve], dtype=np.int64)
+    cv = np.array([v for _, v in curve], dtype=np.float64)
+    d0 = int(start) // 86400
+    d1 = max(int(end) - 1, int(ct[-1]) if len(ct) else 0) // 86400
+    closes = (np.arange(d0, d1 + 1, dtype=np.int64) + 1) * 86400
+    idx = np.searchsorted(ct, closes, side="left") - 1
+    return np.r_[equity0, np.where(idx >= 0, cv[np.maximum(idx, 0)], equity0)]
+
+
+def _metrics(done, curve, equity0, skipped, start=None, end=None):
+    pnl = np.array([t["pnl"] for t in done]) if done else np.zeros(0)
+    eq = np.array([v for _, v in curve])
+    peak = np.maximum.accumulate(eq) if len(eq) else eq
+    max_dd = float(((peak - eq) / peak).max()) if len(eq) else 0.0
+    # 日收益：区间内每个自然日都算一期（没有平仓的日子收益为 0），再按 sqrt(365) 年化
+    if start is None:
+        start = curve[0][0] if curve else 0
+    if end is None:
+        end = (curve[-1][0] if curve else start) + 1
+    daily = daily_equity(curve, equity0, start, end)
+    rets = np.diff(daily) / daily[:-1] if len(daily) > 1 else np.zeros(0)
+    sharpe = float(rets.mean() / rets.std() * np.sqrt(365)) if len(rets) > 1 and rets.std() > 0 else 0.0
+    gain, loss = float(pnl[pnl > 0].sum()), float(-pnl[pnl < 0].sum())
+    reasons = {}
+    for t in done:
+        reasons[t["exit_reason"]] = reasons.get(t["exit_reason"], 0) + 1
+    final = float(eq[-1]) if len(eq) else equity0
+    return {
+        "trade_count": len(done),
+        "win_rate": round(float((pnl > 0).mean()), 4) if len(pnl) else 0.0,
+        "profit_rate": round(final / equity0 - 1, 6),
+        "max_drawdown": round(max_dd, 6),
+        "sharpe": round(sharpe, 4),
+        "profit_factor": round(gain / loss, 4) if loss > 0 else (None if gain == 0 else float("inf")),
+        "fees": round(float(sum(t["fee"] for t in done)), 4),
+        "final_equity": round(final, 4),
+        "skipped": skipped,
+        "exit_reasons": reasons,
+    }
+
+
+def backtest_score(m):
+    """0~10 分，与参数池 score 同量纲（load_ai_pool 按 score 排序 / 过滤）：夏普为主，回撤扣分"""
+    return round(float(np.clip(5 + 1.5 * m["sharpe"] - 10 * m["max_drawdown"], 0, 10)), 3)
+
+
+# =============== 主流程 ===============
+def run_backtest(groups, insts=None, bar=BACKTEST_BAR, start=None, end=None, source="rules",
+                 rules=None, store=None, equity0=INITIAL_EQUITY, slippage=SLIPPAGE, save=True):
+    """groups: load_ai_pool 格式的参数组列表；返回 [(group, metrics, trades)]
+    数据按 instId 逐个加载、信号只算一次，各参数组共用"""
+    t0 = time.time()
+    store = store or get_kline_store()
+    end = int(end or time.time())
+    start = int(start or end - BACKTEST_DAYS * 86400)
+    insts = list(insts or store.inst_ids(bar))
+    if source == "rules":
+        rules = rules if rules is not None else sr.load_rules()
+        warm = warmup_sec(rules, bar)
+        sig_rows = None
+    else:
+        warm, sig_rows = 0, load_signal_rows(SIGNAL_POOL_DB, start, end, insts)
+    d0, d1 = (datetime.datetime.fromtimestamp(t, datetime.timezone.utc) for t in (start, end))
+    print(f"[回测] {bar} {d0:%Y-%m-%d %H:%M} ~ {d1:%Y-%m-%d %H:%M} | instId {len(insts)} 个 | "
+          f"参数组 {len(groups)} 组 | 信号来源 {source}")
+    caches = [{} for _ in groups]
+    per_group = [[] for _ in groups]
+    bars = 0
+    for n, inst in enumerate(insts, 1):
+        try:
+            k = load_klines(store, inst, bar, start - warm, end)
+            if k is None:
+                continue
+            bars += len(k.ts)
+            if source == "rules":
+                ent = entries_from_rules(rules, k, bar, start, lambda tf, since: store.get_all(tf, since, [inst]).get(inst))
+            else:
+                ent = entries_from_signals(sig_rows.get(inst), k)
+            for g, group in enumerate(groups):
+                per_group[g] += simulate_inst(inst, k, ent, group["params"], slippage=slippage, cache=caches[g])
+        except Exception as e:
+            print(f"{FAILED_COLOR}[回测] {inst} 失败: {e}{RESET_COLOR}")
+        if n % 50 == 0:
+            print(f"[回测] 进度 {n}/{len(insts)} | 已读 {bars} 根 | {time.time() - t0:.1f}s")
+    results = []
+    for group, trades in zip(groups, per_group):
+        m, done = run_portfolio(trades, group["params"], equity0, start, end)
+        results.append((group, m, done))
+        pf = m["profit_factor"]
+        print(f"{OK_COLOR}[回测] 参数组ID={group.get('id')} | 成交 {m['trade_count']}（跳过 {m['skipped']}）| "
+              f"胜率 {m['win_rate'] * 100:.1f}% | 收益 {m['profit_rate'] * 100:.2f}% | 最大回撤 {m['max_drawdown'] * 100:.2f}% | "
+              f"夏普 {m['sharpe']:.2f} | 盈亏比 {pf if pf is None else round(pf, 2)} | 手续费 {m['fees']:.2f}{RESET_COLOR}")
+    elapsed = time.time() - t0
+    print(f"[回测] 完成：{bars} 根 K 线 × {len(groups)} 组，用时 {elapsed:.1f}s")
+    if save:
+        save_results(results, bar, source, start, end, len(insts), elapsed)
+        write_back_ai_params(results)
+    return results
+
+
+def ensure_backtest_tables(db_path=SIMU_TRADES_DB):
+    conn = sqlite3.connect(db_path)
+    for table, fields in (("backtest_runs", BACKTEST_RUNS_FIELDS), ("backtest_trades", BACKTEST_TRADES_FIELDS)):
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(f'{k} {v}' for k, v in fields.items())})")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_backtest_trades_run ON backtest_trades(run_id)")
+    conn.commit()
+    conn.close()
+    ensure_table_fields(db_path, "backtest_runs", BACKTEST_RUNS_FIELDS)
+    ensure_table_fields(db_path, "backtest_trades", BACKTEST_TRADES_FIELDS)
+
+
+def save_results(results, bar, source, start, end, n_insts, elapsed, db_path=SIMU_TRADES_DB):
+    ensure_backtest_tables(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        now = datetime.datetime.now().isoformat()
+        for group, m, done in results:
+            gid = group.get("id")
+            pf = m["profit_factor"]
+            cur = conn.execute(
+                "INSERT INTO backtest_runs (param_group_id, bar, source, start_ts, end_ts, insts, trade_count, win_rate, "
+                "profit_rate, max_drawdown, sharpe, profit_factor, fees, final_equity, skipped, exit_reasons, params_json, "
+                "elapsed_sec, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (gid, bar, source, start, end, n_insts, m["trade_count"], m["win_rate"], m["profit_rate"], m["max_drawdown"],
+                 m["sharpe"], None if pf in (None, float("inf")) else pf, m["fees"], m["final_equity"], m["skipped"],
+                 json.dumps(m["exit_reasons"], ensure_ascii=False), json.dumps(group.get("params"), ensure_ascii=False),
+                 round(elapsed, 3), now))
+            conn.executemany(
+                "INSERT INTO backtest_trades (run_id, param_group_id, instId, side, signal_type, entry_ts, entry_px, exit_ts, "
+                "exit_px, exit_reason, lever, margin, ret, pnl, fee) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(cur.lastrowid, gid, t["instId"], t["side"], t["signal_type"], t["entry_ts"], t["entry_px"], t["exit_ts"],
+                  t["exit_px"], t["exit_reason"], t["lever"], t["margin"], t["ret"], t["pnl"], t["fee"]) for t in done])
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"[回测] 结果已写入 {db_path}（backtest_runs {len(results)} 行）")
+
+
+def write_back_ai_params(results, db_path=AI_PARAMS_DB):
+    """闭环：回测指标写回 ai_params；成交太少时 score 不动"""
+    ensure_ai_params_table()
+    conn = sqlite3.connect(db_path)
+    updated = 0
+    try:
+        now = datetime.datetime.now().isoformat()
+        for group, m, _ in results:
+            gid = group.get("id")
+            if gid is None:
+                continue
+            conn.execute("UPDATE ai_params SET win_rate=?, profit_rate=?, trade_count=?, max_drawdown=?, sharpe=?, backtest_at=? "
+                         "WHERE id=?", (m["win_rate"], m["profit_rate"], m["trade_count"], m["max_drawdown"], m["sharpe"], now, gid))
+            if m["trade_count"] >= MIN_TRADES:
+                conn.execute("UPDATE ai_params SET score=? WHERE id=?", (backtest_score(m), gid))
+            updated += 1
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"[同步] 回测绩效已写回 ai_params 表，共更新 {updated} 组参数")
+
+
+def select_groups(ids=None, top_k=5):
+    if ids:
+        pool = load_ai_pool(min_win_rate=0, min_score=0, top_k=10 ** 6)
+        wanted = set(ids)
+        return [g for g in pool if g["id"] in wanted]
+    groups = load_ai_pool(min_win_rate=0, min_score=0, top_k=top_k)
+    if not groups:
+        print("[回测] 参数池为空，使用默认参数组")
+        from ailearning.ai_engine import merge_full_template
+        groups = [{"id": None, "params": merge_full_template({}), "score": None}]
+    return groups
+
+
+def main():
+    ap = argparse.ArgumentParser(description="K 线回测：信号规则 / 历史信号 × ai_params 参数组")
+    ap.add_argument("--bar", default=BACKTEST_BAR)
+    ap.add_argument("--days", type=int, default=BACKTEST_DAYS, help="未给 --start 时回测最近 N 天")
+    ap.add_argument("--start", help="YYYY-MM-DD 或秒级时间戳（UTC）")
+    ap.add_argument("--end", help="YYYY-MM-DD 或秒级时间戳（UTC），缺省为当前")
+    ap.add_argument("--insts", help="逗号分隔的 instId，缺省为该周期全部")
+    ap.add_argument("--groups", help="逗号分隔的 ai_params id，缺省取参数池 score 前 --top 组")
+    ap.add_argument("--top", type=int, default=5)
+    ap.add_argument("--source", choices=["rules", "signals"], default="rules")
+    ap.add_argument("--equity", type=float, default=INITIAL_EQUITY)
+    ap.add_argument("--slippage", type=float, default=SLIPPAGE)
+    ap.add_argument("--no-save", action="store_true", help="只打印，不写 backtest_runs / ai_params")
+    args = ap.parse_args()
+
+    end = parse_day(args.end) or int(time.time())
+    start = parse_day(args.start) or end - args.days * 86400
+    groups = select_groups([int(x) for x in args.groups.split(",")] if args.groups else None, args.top)
+    insts = [x.strip() for x in args.insts.split(",") if x.strip()] if args.insts else None
+    run_backtest(groups, insts, args.bar, start, end, args.source, equity0=args.equity,
+                 slippage=args.slippage, save=not args.no_save)
+
+
+if __name__ == "__main__":
+    main()
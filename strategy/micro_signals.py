@@ -0,0 +1,297 @@
+# strategy/micro_signals.py
+"""
+盘口 / 逐笔成交 / 爆仓 / 资金费率 的流式微观结构信号：在 ws_collector 进程里随推送实时计算，直接写入信号池
+
+每个 instId 一份状态，所有滚动统计都是定长时间桶环（RollingBuckets，窗口秒数 / BUCKET_SEC 个桶），
+内存与成交笔数、盘口帧数无关；时间用推送里的交易所时间戳，录制回放结果可复现。
+- 盘口失衡  imb = (Σ买量 - Σ卖量) / (Σ买量 + Σ卖量)（books5 前 5 档），ORDERBOOK_SIGNAL_WINDOW_SEC 窗口均值
+- 成交      VWAP、主动买卖净额（名义 USDT，按 ctVal 折算）、笔数，TRADE_SIGNAL_WINDOW_SEC 窗口
+- 爆发度    burst = 最近 BURST_SEC 的成交笔数速率 / 整个窗口的平均速率
+信号：
+  ORDERBOOK_BUY_PRESSURE / SELL_PRESSURE  窗口均值失衡 ≥ MICRO_OB_IMB 且当前帧同向，窗口内至少 MICRO_OB_FRAMES 帧
+  WHALE_BUY / WHALE_SELL                  单笔名义 ≥ MICRO_WHALE_USDT，或 BURST_SEC 内同向净额 ≥ MICRO_WHALE_USDT 且 burst ≥ MICRO_BURST_RATIO
+  LIQUIDATION_LONG / LIQUIDATION_SHORT    窗口内多头（卖单）/ 空头（买单）爆仓名义 ≥ MICRO_LIQ_USDT
+  FUNDING_SPIKE                           |资金费率| ≥ MICRO_FUNDING_TH
+方向：params / meta 里显式写 side（SIDES，与 strategy.backtest.side_of 一致），实盘不再按信号名后缀猜。
+同一 (instId, 信号类型) MICRO_COOLDOWN 秒内只发一次。写入走 signals.db 的 BatchWriter（≤ DBW_FLUSH_SEC 落盘），
+下游经 signal_notify 唤醒，推送到可消费亚秒级。MICRO_SIGNALS=0 关闭。
+"""
+import os
+import json
+import math
+import time
+import threading
+
+from utils.config import SIGNAL_POOL_DB
+from utils.db_writer import get_writer
+from strategy.signal_generator import (
+    TRADE_SIGNAL_WINDOW_SEC, ORDERBOOK_SIGNAL_WINDOW_SEC, SIGNAL_EXPIRE_SEC,
+    ensure_signal_pool_table, get_signal_priority_and_promotion,
+)
+
+MICRO_ENABLED = os.environ.get("MICRO_SIGNALS", "1") != "0"
+BUCKET_SEC = float(os.environ.get("MICRO_BUCKET_SEC", "1"))
+OB_IMB_TH = float(os.environ.get("MICRO_OB_IMB", "0.6"))
+OB_MIN_FRAMES = int(os.environ.get("MICRO_OB_FRAMES", "5"))
+WHALE_USDT = float(os.environ.get("MICRO_WHALE_USDT", "100000"))
+BURST_SEC = float(os.environ.get("MICRO_BURST_SEC", "3"))
+BURST_RATIO = float(os.environ.get("MICRO_BURST_RATIO", "3"))
+LIQ_USDT = float(os.environ.get("MICRO_LIQ_USDT", "50000"))
+FUNDING_TH = float(os.environ.get("MICRO_FUNDING_TH", "0.001"))
+COOLDOWN_SEC = float(os.environ.get("MICRO_COOLDOWN", "30"))
+MICRO_PERIOD = "tick"
+
+SCORES = {"ORDERBOOK_BUY_PRESSURE": 7.0, "ORDERBOOK_SELL_PRESSURE": 7.0, "WHALE_BUY": 7.5, "WHALE_SELL": 7.5,
+          "LIQUIDATION_LONG": 8.0, "LIQUIDATION_SHORT": 8.0, "FUNDING_SPIKE": 6.5}
+SIDES = {"ORDERBOOK_BUY_PRESSURE": "buy", "ORDERBOOK_SELL_PRESSURE": "sell", "WHALE_BUY": "buy", "WHALE_SELL": "sell",
+         "LIQUIDATION_LONG": "buy", "LIQUIDATION_SHORT": "sell", "FUNDING_SPIKE": "buy"}
+
+INSERT_SQL = """
+    INSERT INTO signals
+    (instId, period, ts, close, vol, signal_type, status, score, params, meta, created_at, source,
+     priority, promotion_level, expire_ts, source_tag, created_ms)
+    VALUES (?, ?, ?, ?, ?, ?, 'WAIT_SIMU', ?, ?, ?, ?, 'micro_detector', ?, ?, ?, 'signal_engine', ?)
+"""
+
+FAILED_COLOR = '\033[91m'
+OK_COLOR = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+
+class RollingBuckets:
+    """定长时间窗口的滚动和：n 个桶的环，按事件时间推进、过期桶清零；迟到的事件记入当前桶"""
+
+    def __init__(self, window_sec, fields, bucket_sec=BUCKET_SEC):
+        self.bucket_sec = float(bucket_sec)
+        self.n = max(1, int(math.ceil(float(window_sec) / self.bucket_sec)))
+        self.window_sec = self.n * self.bucket_sec
+        self.fields = fields
+        self.buckets = [[0.0] * fields for _ in range(self.n)]
+        self.total = [0.0] * fields
+        self.head = None          # 当前桶的绝对序号
+        self.first = None         # 第一个事件的时间，窗口未观察满之前速率类统计不可信
+
+    def advance(self, t):
+        b = int(t // self.bucket_sec)
+        if self.head is None:
+            self.head, self.first = b, t
+            return
+        if b <= self.head:
+            return
+        for i in range(self.head + 1, self.head + 1 + min(b - self.head, self.n)):
+            row = self.buckets[i % self.n]
+            for f in range(self.fields):
+                self.total[f] -= row[f]
+                row[f] = 0.0
+        self.head = b
+        if b % self.n == 0:       # 每转一圈从桶重算一次，消掉加减的浮点累计误差
+            self.total = [math.fsum(r[f] for r in self.buckets) for f in range(self.fields)]
+
+    def add(self, t, *vals):
+        self.advance(t)
+        row = self.buckets[self.head % self.n]
+        for f, v in enumerate(vals):
+            row[f] += v
+            self.total[f] += v
+
+    def warm(self):
+        return self.head is not None and (self.head + 1) * self.bucket_sec - self.first >= self.window_sec
+
+    def recent(self, k):
+        """最近 k 个桶（含当前桶）的和"""
+        if self.head is None:
+            return [0.0] * self.fields
+        k = min(max(1, int(k)), self.n)
+        rows = [self.buckets[(self.head - i) % self.n] for i in range(k)]
+        return [sum(r[f] for r in rows) for f in range(self.fields)]
+
+
+class MicroState:
+    """单个 instId：盘口 (Σimb, 帧数)、成交 (名义, 数量, 主动净额, 笔数)、爆仓 (多头名义, 空头名义)"""
+
+    def __init__(self):
+        self.book = RollingBuckets(ORDERBOOK_SIGNAL_WINDOW_SEC, 2)
+        self.flow = RollingBuckets(TRADE_SIGNAL_WINDOW_SEC, 4)
+        self.liq = RollingBuckets(TRADE_SIGNAL_WINDOW_SEC, 2)
+        self.imb = None
+        self.last_px = None
+        self.last_emit = {}
+
+    def imbalance(self):
+        s, n = self.book.total
+        return s / n if n else None
+
+    def vwap(self):
+        notional, qty = self.flow.total[0], self.flow.total[1]
+        return notional / qty if qty > 0 else None
+
+    def burst(self):
+        k = max(1, int(round(BURST_SEC / self.flow.bucket_sec)))
+        total = self.flow.total[3]
+        if total <= 0 or not self.flow.warm():
+            return 0.0
+        return (self.flow.recent(k)[3] / (k * self.flow.bucket_sec)) / (total / self.flow.window_sec)
+
+
+def _f(x, default=0.0):
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return default
+
+
+def book_imbalance(bids, asks, depth=5):
+    b = sum(_f(x[1]) for x in (bids or [])[:depth])
+    a = sum(_f(x[1]) for x in (asks or [])[:depth])
+    return (b - a) / (b + a) if b + a > 0 else None
+
+
+class MicroDetector:
+    def __init__(self, ct_val=None, db_path=SIGNAL_POOL_DB, emit=None):
+        """ct_val(instId) -> 合约面值（SWAP 的 sz 是张数）；emit(rows) 默认写信号池"""
+        self.ct_val = ct_val or (lambda instId: 1.0)
+        self.db_path = db_path
+        self.emit = emit or self._write
+        self.states = {}
+        self.lock = threading.Lock()
+        self.stats = {}
+        if emit is None:
+            ensure_signal_pool_table()
+
+    def _state(self, instId):
+        st = self.states.get(instId)
+        if st is None:
+            st = self.states[instId] = MicroState()
+        return st
+
+    def _ctval(self, instId):
+        try:
+            return float(self.ct_val(instId)) or 1.0
+        except Exception:
+            return 1.0
+
+    # ---------- 推送入口（返回本次触发的信号，便于测试 / 回放统计）----------
+    def on_books(self, instId, data):
+        out = []
+        with self.lock:
+            st = self._state(instId)
+            for d in data:
+                imb = book_imbalance(d.get("bids"), d.get("asks"))
+                if imb is None:
+                    continue
+                t = _f(d.get("ts"), time.time() * 1000) / 1000
+                st.book.add(t, imb, 1.0)
+                st.imb = imb
+                bids, asks = d.get("bids") or [], d.get("asks") or []
+                if bids and asks:
+                    st.last_px = (_f(bids[0][0]) + _f(asks[0][0])) / 2
+                avg, frames = st.imbalance(), st.book.total[1]
+                if frames < OB_MIN_FRAMES or avg is None:
+                    continue
+                for side, sig in ((1, "ORDERBOOK_BUY_PRESSURE"), (-1, "ORDERBOOK_SELL_PRESSURE")):
+                    if side * avg >= OB_IMB_TH and side * imb >= OB_IMB_TH:
+                        out += self._fire(st, instId, sig, t, st.last_px,
+                                          {"imb": round(imb, 4), "imb_avg": round(avg, 4), "frames": int(frames)})
+        return self._flush(out)
+
+    def on_trades(self, instId, data):
+        out = []
+        with self.lock:
+            st = self._state(instId)
+            ct = self._ctval(instId)
+            k = max(1, int(round(BURST_SEC / st.flow.bucket_sec)))
+            for tr in data:
+                px, sz = _f(tr.get("px")), _f(tr.get("sz"))
+                if px <= 0 or sz <= 0:
+                    continue
+                t = _f(tr.get("ts"), time.time() * 1000) / 1000
+                qty = sz * ct
+                notional = px * qty
+                sign = 1.0 if tr.get("side") == "buy" else -1.0
+                st.flow.add(t, notional, qty, sign * notional, _f(tr.get("count"), 1.0) or 1.0)
+                st.last_px = px
+                recent_signed = st.flow.recent(k)[2]
+                burst = st.burst()
+                for side, sig in ((1.0, "WHALE_BUY"), (-1.0, "WHALE_SELL")):
+                    big = sign == side and notional >= WHALE_USDT
+                    rush = side * recent_signed >= WHALE_USDT and burst >= BURST_RATIO
+                    if big or rush:
+                        out += self._fire(st, instId, sig, t, px, {
+                            "notional": round(notional, 2), "signed_burst": round(recent_signed, 2),
+                            "burst": round(burst, 2), "vwap": st.vwap(), "signed_window": round(st.flow.total[2], 2)})
+        return self._flush(out)
+
+    def on_liquidation(self, rows):
+        """rows: [{"instId", "ts"(ms), "px", "sz", "side"}]；卖单 = 多头被强平"""
+        out = []
+        with self.lock:
+            for r in rows:
+                instId = r.get("instId")
+                px, sz = _f(r.get("px")), _f(r.get("sz"))
+                if not instId or px <= 0 or sz <= 0:
+                    continue
+                st = self._state(instId)
+                t = _f(r.get("ts"), time.time() * 1000) / 1000
+                notional = px * sz * self._ctval(instId)
+                long_liq = r.get("side") == "sell"
+                st.liq.add(t, notional if long_liq else 0.0, 0.0 if long_liq else notional)
+                total = st.liq.total[0 if long_liq else 1]
+                if total >= LIQ_USDT:
+                    sig = "LIQUIDATION_LONG" if long_liq else "LIQUIDATION_SHORT"
+                    out += self._fire(st, instId, sig, t, px,
+                                      {"liq_notional": round(total, 2), "window_sec": st.liq.window_sec})
+        return self._flush(out)
+
+    def on_funding(self, instId, d):
+        rate = _f(d.get("fundingRate"), None)
+        if rate is None or abs(rate) < FUNDING_TH:
+            return []
+        with self.lock:
+            st = self._state(instId)
+            t = _f(d.get("ts"), time.time() * 1000) / 1000
+            out = self._fire(st, instId, "FUNDING_SPIKE", t, st.last_px or 0.0,
+                             {"funding_rate": rate, "next_rate": _f(d.get("nextFundingRate"), None)})
+        return self._flush(out)
+
+    # ---------- 产出 ----------
+    def _fire(self, st, instId, sig, t, px, params):
+        last = st.last_emit.get(sig)
+        if last is not None and t - last < COOLDOWN_SEC:
+            return []
+        st.last_emit[sig] = t
+        self.stats[sig] = self.stats.get(sig, 0) + 1
+        return [(instId, sig, t, px, params)]
+
+    def _flush(self, out):
+        if out:
+            self.emit(out)
+        return out
+
+    def _write(self, hits):
+        now = time.time()
+        rows = []
+        for instId, sig, t, px, params in hits:
+            priority, promotion_level = get_signal_priority_and_promotion(sig)
+            side = SIDES.get(sig, "buy")
+            rows.append((instId, MICRO_PERIOD, int(t), px, 0.0, sig, SCORES.get(sig, 7.0),
+                         json.dumps({**params, "side": side}, ensure_ascii=False), json.dumps({"side": side}),
+                         int(now), priority, promotion_level,
+                         int(now) + SIGNAL_EXPIRE_SEC, int(now * 1000)))
+        get_writer(self.db_path).submit(INSERT_SQL, rows)
+
+    def snapshot(self, instId):
+        """当前滚动统计（调试 / 面板用）"""
+        with self.lock:
+            st = self.states.get(instId)
+            if st is None:
+                return {}
+            return {"imb": st.imb, "imb_avg": st.imbalance(), "vwap": st.vwap(),
+                    "signed_notional": st.flow.total[2], "trades": st.flow.total[3], "burst": st.burst(),
+                    "liq_long": st.liq.total[0], "liq_short": st.liq.total[1]}
+
+    def report(self):
+        with self.lock:
+            st, self.stats = self.stats, {}
+        if st:
+            print(f"{OK_COLOR}[微观信号] " + " ".join(f"{k}:{v}" for k, v in sorted(st.items())) + RESET_COLOR)
+        return st
@@ -0,0 +1,508 @@
+# strategy/param_sweep.py
+"""
+参数扫描：[ai_params 参数组 / 参数网格] × instId × 日期区间，进程池并行回测
+
+  python -m strategy.param_sweep --top 20 --days 90 --workers 8
+  python -m strategy.param_sweep --grid '{"TP_RATE": [0.01, 0.02, 0.03], "SL_RATE": [0.005, 0.01]}' --base 7 \\
+      --ranges 2025-01-01:2025-04-01,2025-04-01:2025-07-01 --insts BTC-USDT-SWAP,ETH-USDT-SWAP
+  python -m strategy.param_sweep --resume <sweep_id>      # 中断后续跑（同样的参数直接重跑也会续跑）
+  python -m strategy.param_sweep --list / --show <sweep_id>
+
+- 行情只读一次：主进程把每个 instId 覆盖全部区间（含指标预热、tf() 引用的周期）的 K 线放进
+  multiprocessing.shared_memory，worker 只挂载，不各自读库
+- 任务 = (instId, 区间, 参数组分片)，分片大小保证任务数 >= 4 × worker；worker 在 instId × 区间上求一次信号，
+  再逐组撮合（strategy.backtest.simulate_inst），主进程只负责写库和最后的组合汇总
+- 断点续跑：任务的成交和 done 标记在同一事务里写入 SWEEP_DB（每 SWEEP_FLUSH_SEC 秒批量一次），
+  sweep_id 是扫描参数（含回测口径版本 ENGINE_VERSION）的哈希，重跑时跳过已完成任务；
+  口径变了的旧扫描不会被续跑复用，--resume 时按当前口径重新扫描
+- 全部完成后按 (参数组, 区间) 合并成交跑组合（run_portfolio），指标批量写 sweep_results；
+  --write-back 且只有一个区间时，把来自 ai_params 的参数组指标写回 ai_params
+"""
+import os
+import sys
+import time
+import json
+import hashlib
+import sqlite3
+import argparse
+import datetime
+import itertools
+import multiprocessing as mp
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ailearning.ai_engine import merge_full_template, load_ai_pool
+from strategy import backtest as bt
+from strategy import signal_rules as sr
+from utils.config import DB_DIR, SIGNAL_POOL_DB
+from utils.kline_store import get_kline_store, KlineArrays, POOL_SIZE
+from utils.signal_queue import PERIOD_SECONDS
+
+SWEEP_DB = os.environ.get("SWEEP_DB") or os.path.join(str(DB_DIR), "param_sweep.db")
+SWEEP_WORKERS = int(os.environ.get("SWEEP_WORKERS", "0")) or (os.cpu_count() or 1)
+FLUSH_SEC = float(os.environ.get("SWEEP_FLUSH_SEC", "5"))
+TASKS_PER_WORKER = 4
+ENGINE_VERSION = 2        # 信号 / 撮合口径版本，变更时 +1；2 = tf() 按收盘时间对齐（1 有未来函数）
+ENTRY_CACHE = 8           # worker 内缓存最近几个 (instId, 区间) 的入场点
+
+FAILED_COLOR = '\033[91m'
+OK_COLOR = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+TRADE_COLS = ("instId", "side", "signal_type", "entry_ts", "entry_px", "exit_ts", "exit_px", "exit_reason",
+              "lever", "ratio", "ret", "fee_rate")
+
+
+def ensure_sweep_tables(db_path=SWEEP_DB):
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS sweeps (
+        sweep_id TEXT PRIMARY KEY, spec_json TEXT, chunk INTEGER, tasks INTEGER,
+        status TEXT, created_at TEXT, finished_at TEXT, elapsed_sec REAL
+    )""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS sweep_tasks (
+        sweep_id TEXT, instId TEXT, range_idx INTEGER, chunk_idx INTEGER,
+        trades INTEGER, elapsed_sec REAL, done_at TEXT,
+        PRIMARY KEY (sweep_id, instId, range_idx, chunk_idx)
+    )""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS sweep_trades (
+        sweep_id TEXT, gidx INTEGER, range_idx INTEGER, instId TEXT, side TEXT, signal_type TEXT,
+        entry_ts INTEGER, entry_px REAL, exit_ts INTEGER, exit_px REAL, exit_reason TEXT,
+        lever REAL, ratio REAL, ret REAL, fee_rate REAL
+    )""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sweep_trades ON sweep_trades(sweep_id, gidx, range_idx)")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS sweep_results (
+        sweep_id TEXT, gidx INTEGER, range_idx INTEGER, param_group_id INTEGER, label TEXT,
+        start_ts INTEGER, end_ts INTEGER, trade_count INTEGER, win_rate REAL, profit_rate REAL,
+        max_drawdown REAL, sharpe REAL, profit_factor REAL, fees REAL, final_equity REAL,
+        skipped INTEGER, score REAL, params_json TEXT,
+        PRIMARY KEY (sweep_id, gidx, range_idx)
+    )""")
+    conn.commit()
+    conn.close()
+
+
+# =============== 扫描参数 ===============
+def grid_groups(grid, base=None):
+    """{"TP_RATE": [..], "SL_RATE": [..]} 在 base 参数组上做笛卡尔积；id 为空，label 记改动的键值"""
+    base_params = merge_full_template((base or {}).get("params", {}))
+    keys = list(grid)
+    values = [v if isinstance(v, list) else [v] for v in grid.values()]
+    prefix = f"base={base['id']} " if base and base.get("id") is not None else ""
+    out = []
+    for combo in itertools.product(*values):
+        params = dict(base_params)
+        params.update(zip(keys, combo))
+        out.append({"id": None, "params": params, "label": prefix + ",".join(f"{k}={v}" for k, v in zip(keys, combo))})
+    return out
+
+
+def pool_groups(ids=None, top_k=5):
+    pool = load_ai_pool(min_win_rate=0, min_score=0, top_k=10 ** 6 if ids else top_k)
+    if ids:
+        wanted = set(ids)
+        pool = [g for g in pool if g["id"] in wanted]
+    return [{"id": g["id"], "params": g["params"], "label": f"id={g['id']}"} for g in pool]
+
+
+def parse_ranges(s):
+    """"2025-01-01:2025-04-01,2025-04-01:2025-07-01" -> [(start, end)]"""
+    out = []
+    for part in s.split(","):
+        a, b = part.strip().split(":")
+        out.append((bt.parse_day(a), bt.parse_day(b)))
+    return out
+
+
+def make_spec(groups, insts, ranges, bar, source, rules_cfg, equity0, slippage):
+    return {"groups": groups, "insts": list(insts), "ranges": [list(r) for r in ranges], "bar": bar, "source": source,
+            "rules": rules_cfg if source == "rules" else None, "equity": equity0, "slippage": slippage,
+            "engine": ENGINE_VERSION}
+
+
+def sweep_id_of(spec):
+    return hashlib.sha1(json.dumps(spec, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+
+
+# =============== 共享内存行情 ===============
+class SharedKlines:
+    """主进程持有：每个 (instId, bar) 一块 [6 × n] float64（第 0 行是 ts 的 int64 位模式）；结束时 unlink"""
+
+    def __init__(self):
+        self.blocks = {}
+        self.index = {}       # (instId, bar) -> (shm 名, 根数)，传给 worker
+        self.bytes = 0
+
+    def put(self, key, k):
+        n = len(k.ts)
+        shm = shared_memory.SharedMemory(create=True, size=max(8, 6 * 8 * n))
+        buf = np.ndarray((6, n), dtype=np.float64, buffer=shm.buf)
+        buf[0].view(np.int64)[:] = k.ts
+        for i, a in enumerate(k[1:], 1):
+            buf[i] = a
+        self.blocks[key] = shm
+        self.index[key] = (shm.name, n)
+        self.bytes += 6 * 8 * n
+
+    def close(self):
+        for shm in self.blocks.values():
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self.blocks.clear()
+        self.index.clear()
+
+
+def load_shared(store, insts, needs, workers=POOL_SIZE):
+    """needs: {bar: 最早 ts}；多线程按 instId 读库（共享 KlineStore 连接池）后写入共享内存"""
+    sk = SharedKlines()
+    jobs = [(inst, bar, since) for inst in insts for bar, since in needs.items()]
+
+    def load(job):
+        inst, bar, since = job
+        return inst, bar, store.get_all(bar, since, [inst]).get(inst)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            for inst, bar, k in ex.map(load, jobs):
+                if k is not None and len(k.ts):
+                    sk.put((inst, bar), k)
+    except BaseException:
+        sk.close()
+        raise
+    return sk
+
+
+# =============== worker ===============
+_W = {}
+
+
+def _init_worker(spec, index, chunk, sig_rows):
+    _W.clear()
+    _W.update(spec=spec, index=index, chunk=chunk, sig_rows=sig_rows, shm={}, entries=OrderedDict(), caches={})
+    if spec["source"] == "rules":
+        _W["rules"] = [r for r in sr.compile_rules(spec["rules"]) if r.applies(spec["bar"])]
+        _W["warm"] = bt.warmup_sec(_W["rules"], spec["bar"])
+    else:
+        _W["rules"], _W["warm"] = [], 0
+
+
+def _attach(inst, bar):
+    key = (inst, bar)
+    hit = _W["shm"].get(key)
+    if hit is None:
+        if key not in _W["index"]:
+            return None
+        name, n = _W["index"][key]
+        shm = shared_memory.SharedMemory(name=name)
+        buf = np.ndarray((6, n), dtype=np.float64, buffer=shm.buf)
+        buf.flags.writeable = False
+        hit = _W["shm"][key] = (shm, KlineArrays(buf[0].view(np.int64), *buf[1:]))
+    return hit[1]
+
+
+def _slice(k, start, end):
+    if k is None:
+        return None
+    lo, hi = np.searchsorted(k.ts, [start, end], side="left")
+    return KlineArrays(*(a[lo:hi] for a in k)) if hi > lo else None
+
+
+def _entries(inst, r, k, start):
+    key = (inst, r)
+    cache = _W["entries"]
+    ent = cache.get(key)
+    if ent is None:
+        if _W["spec"]["source"] == "rules":
+            ent = bt.entries_from_rules(_W["rules"], k, _W["spec"]["bar"], start,
+                                        lambda tf, since: _slice(_attach(inst, tf), since, int(k.ts[-1]) + 1))
+        else:
+            ent = bt.entries_from_signals(_W["sig_rows"].get(inst), k, start)
+        cache[key] = ent
+        while len(cache) > ENTRY_CACHE:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(key)
+    return ent
+
+
+def _run_task(task):
+    """(instId, 区间序号, 分片序号) -> (task, [(gidx, trade)], 用时, 错误)"""
+    inst, r, c = task
+    t0 = time.time()
+    try:
+        spec = _W["spec"]
+        start, end = spec["ranges"][r]
+        k = _slice(_attach(inst, spec["bar"]), start - _W["warm"], end)
+        out = []
+        if k is not None and len(k.ts) >= 2:
+            ent = _entries(inst, r, k, start)
+            groups = spec["groups"]
+            for g in range(c * _W["chunk"], min(len(groups), (c + 1) * _W["chunk"])):
+                cache = _W["caches"].setdefault(g, {})
+                out += [(g, t) for t in bt.simulate_inst(inst, k, ent, groups[g]["params"], slippage=spec["slippage"],
+                                                         cache=cache)]
+        return task, out, time.time() - t0, None
+    except Exception as e:
+        return task, [], time.time() - t0, f"{type(e).__name__}: {e}"
+
+
+# =============== 主进程 ===============
+def _flush(conn, sweep_id, buf):
+    if not buf:
+        return
+    now = datetime.datetime.now().isoformat()
+    with conn:
+        conn.executemany(
+            f"INSERT INTO sweep_trades (sweep_id, gidx, range_idx, {', '.join(TRADE_COLS)}) "
+            f"VALUES (?, ?, ?, {', '.join('?' * len(TRADE_COLS))})",
+            [(sweep_id, g, task[1], *(t[c] for c in TRADE_COLS)) for task, out, _ in buf for g, t in out])
+        conn.executemany(
+            "INSERT OR REPLACE INTO sweep_tasks (sweep_id, instId, range_idx, chunk_idx, trades, elapsed_sec, done_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(sweep_id, *task, len(out), round(dt, 4), now) for task, out, dt in buf])
+    buf.clear()
+
+
+def run_sweep(spec, workers=SWEEP_WORKERS, db_path=SWEEP_DB, store=None, write_back=False):
+    """跑完（或续跑完）一次扫描，返回 sweep_results 行"""
+    t0 = time.time()
+    ensure_sweep_tables(db_path)
+    sweep_id = sweep_id_of(spec)
+    groups, insts, ranges = spec["groups"], spec["insts"], [tuple(r) for r in spec["ranges"]]
+    conn = sqlite3.connect(db_path)
+    row = conn.execute("SELECT chunk, status FROM sweeps WHERE sweep_id=?", (sweep_id,)).fetchone()
+    if row:
+        chunk = row[0]
+        print(f"[扫描] {sweep_id} 已存在（{row[1]}），" + ("重新汇总" if row[1] == "done" else "续跑"))
+    else:
+        units = max(1, len(insts) * len(ranges))
+        n_chunks = min(len(groups), max(1, -(-TASKS_PER_WORKER * workers // units)))
+        chunk = max(1, -(-len(groups) // n_chunks))
+    tasks_all = [(inst, r, c) for r in range(len(ranges)) for inst in insts for c in range(-(-len(groups) // chunk))]
+    if not row:
+        with conn:
+            conn.execute("INSERT INTO sweeps (sweep_id, spec_json, chunk, tasks, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                         (sweep_id, json.dumps(spec, ensure_ascii=False), chunk, len(tasks_all), "running",
+                          datetime.datetime.now().isoformat()))
+    done = set(conn.execute("SELECT instId, range_idx, chunk_idx FROM sweep_tasks WHERE sweep_id=?", (sweep_id,)))
+    todo = [t for t in tasks_all if t not in done]
+    print(f"[扫描] {sweep_id} | 参数组 {len(groups)} × instId {len(insts)} × 区间 {len(ranges)} | "
+          f"任务 {len(tasks_all)}（已完成 {len(tasks_all) - len(todo)}，分片 {chunk} 组/任务）| worker {workers}")
+
+    if todo:
+        try:
+            _execute(spec, todo, chunk, workers, conn, sweep_id, store)
+        except KeyboardInterrupt:
+            print(f"{FAILED_COLOR}[扫描] 已中断，已完成的任务已落盘；续跑：python -m strategy.param_sweep --resume {sweep_id}{RESET_COLOR}")
+            conn.close()
+            return None
+        left = len(tasks_all) - conn.execute("SELECT COUNT(*) FROM sweep_tasks WHERE sweep_id=?", (sweep_id,)).fetchone()[0]
+        if left:
+            print(f"{FAILED_COLOR}[扫描] 还有 {left} 个任务失败，修复后 --resume {sweep_id} 重跑这些任务{RESET_COLOR}")
+            conn.close()
+            return None
+
+    results = finalize(conn, sweep_id, spec)
+    with conn:
+        conn.execute("UPDATE sweeps SET status='done', finished_at=?, elapsed_sec=COALESCE(elapsed_sec, 0) + ? WHERE sweep_id=?",
+                     (datetime.datetime.now().isoformat(), round(time.time() - t0, 3), sweep_id))
+    conn.close()
+    print(f"{OK_COLOR}[扫描] {sweep_id} 完成，用时 {time.time() - t0:.1f}s{RESET_COLOR}")
+    if write_back:
+        if len(ranges) != 1:
+            print("[扫描] 多个区间的结果不写回 ai_params（--write-back 只在单区间时生效）")
+        else:
+            bt.write_back_ai_params([(groups[g], m, []) for g, _, m in results if groups[g].get("id") is not None])
+    return results
+
+
+def _execute(spec, todo, chunk, workers, conn, sweep_id, store):
+    store = store or get_kline_store()
+    bar, ranges = spec["bar"], spec["ranges"]
+    start0, end0 = min(r[0] for r in ranges), max(r[1] for r in ranges)
+    sig_rows = None
+    if spec["source"] == "rules":
+        rules = [r for r in sr.compile_rules(spec["rules"]) if r.applies(bar)]
+        needs = {bar: start0 - bt.warmup_sec(rules, bar)}
+        for r in rules:
+            for tf, n in r.needs.items():
+                since = needs[bar] - (n + 2) * PERIOD_SECONDS.get(tf, 60)
+                needs[tf] = min(needs.get(tf, since), since)
+    else:
+        needs = {bar: start0}
+        sig_rows = bt.load_signal_rows(SIGNAL_POOL_DB, start0, end0, spec["insts"])
+    insts = sorted({t[0] for t in todo})
+    t0 = time.time()
+    sk = load_shared(store, insts, needs)
+    print(f"[扫描] 行情已载入共享内存：{len(sk.index)} 段 {sk.bytes / 1e6:.1f}MB，用时 {time.time() - t0:.1f}s")
+    buf, n_done, n_trades, n_fail, last = [], 0, 0, 0, time.time()
+    t0 = time.time()
+    pool = None
+    try:
+        initargs = (spec, sk.index, chunk, sig_rows)
+        if workers <= 1:
+            _init_worker(*initargs)
+            it = map(_run_task, todo)
+        else:
+            pool = mp.Pool(workers, initializer=_init_worker, initargs=initargs)
+            it = pool.imap_unordered(_run_task, todo)
+        for task, out, dt, err in it:
+            if err:
+                n_fail += 1
+                print(f"{FAILED_COLOR}[扫描] 任务 {task} 失败: {err}{RESET_COLOR}")
+                continue
+            buf.append((task, out, dt))
+            n_done += 1
+            n_trades += len(out)
+            if time.time() - last >= FLUSH_SEC:
+                _flush(conn, sweep_id, buf)
+                last = time.time()
+                rate = n_done / max(time.time() - t0, 1e-9)
+                print(f"[扫描] 进度 {n_done}/{len(todo)} | 成交 {n_trades} | {rate:.1f} 任务/s | "
+                      f"剩余约 {(len(todo) - n_done - n_fail) / max(rate, 1e-9):.0f}s")
+        _flush(conn, sweep_id, buf)
+    except BaseException:
+        _flush(conn, sweep_id, buf)
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _W.clear()
+        sk.close()
+    print(f"[扫描] 任务 {n_done} 个完成（失败 {n_fail}）| 成交 {n_trades} | 用时 {time.time() - t0:.1f}s")
+
+
+def finalize(conn, sweep_id, spec):
+    """按 (参数组, 区间) 合并所有 instId 的成交跑组合，批量写 sweep_results -> [(gidx, 区间序号, metrics)]"""
+    groups, ranges = spec["groups"], spec["ranges"]
+    trades = {}
+    for row in conn.execute(f"SELECT gidx, range_idx, {', '.join(TRADE_COLS)} FROM sweep_trades WHERE sweep_id=?", (sweep_id,)):
+        trades.setdefault((row[0], row[1]), []).append(dict(zip(TRADE_COLS, row[2:])))
+    results, rows = [], []
+    for g, group in enumerate(groups):
+        for r, (start, end) in enumerate(ranges):
+            m, _ = bt.run_portfolio(trades.get((g, r), []), group["params"], spec["equity"], start, end)
+            score = bt.backtest_score(m)
+            pf = m["profit_factor"]
+            results.append((g, r, m))
+            rows.append((sweep_id, g, r, group.get("id"), group.get("label"), start, end, m["trade_count"], m["win_rate"],
+                         m["profit_rate"], m["max_drawdown"], m["sharpe"], None if pf in (None, float("inf")) else pf,
+                         m["fees"], m["final_equity"], m["skipped"], score, json.dumps(group["params"], ensure_ascii=False)))
+    with conn:
+        conn.executemany(f"INSERT OR REPLACE INTO sweep_results VALUES ({', '.join('?' * 18)})", rows)
+    show(sweep_id, conn=conn)
+    return results
+
+
+def show(sweep_id, top=20, conn=None, db_path=SWEEP_DB):
+    own = conn is None
+    conn = conn or sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT label, range_idx, trade_count, win_rate, profit_rate, max_drawdown, sharpe, score FROM sweep_results "
+            "WHERE sweep_id=? ORDER BY score DESC, profit_rate DESC LIMIT ?", (sweep_id, top)).fetchall()
+    finally:
+        if own:
+            conn.close()
+    print(f"\n{'参数组':<36}{'区间':>4}{'成交':>7}{'胜率':>8}{'收益':>9}{'回撤':>8}{'夏普':>7}{'得分':>6}")
+    for label, r, n, wr, pr, dd, sh, score in rows:
+        print(f"{str(label)[:35]:<36}{r:>4}{n:>7}{wr * 100:>7.1f}%{pr * 100:>8.2f}%{dd * 100:>7.2f}%{sh:>7.2f}{score:>6.2f}")
+
+
+def list_sweeps(db_path=SWEEP_DB):
+    ensure_sweep_tables(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT s.sweep_id, s.status, s.tasks, COUNT(t.sweep_id), s.created_at, s.elapsed_sec "
+                            "FROM sweeps s LEFT JOIN sweep_tasks t ON t.sweep_id = s.sweep_id "
+                            "GROUP BY s.sweep_id ORDER BY s.created_at DESC").fetchall()
+    finally:
+        conn.close()
+    for sid, status, tasks, done, created, elapsed in rows:
+        print(f"{sid}  {status:<8} 任务 {done}/{tasks}  创建 {created}  用时 {elapsed or 0:.1f}s")
+
+
+def load_spec(sweep_id, db_path=SWEEP_DB):
+    ensure_sweep_tables(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute("SELECT spec_json FROM sweeps WHERE sweep_id=?", (sweep_id,)).fetchone()
+    finally:
+        conn.close()
+    return json.loads(row[0]) if row else None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="ai_params 参数组 × instId × 日期区间 并行回测扫描")
+    ap.add_argument("--groups", help="逗号分隔的 ai_params id")
+    ap.add_argument("--top", type=int, default=5, help="未给 --groups/--grid 时取参数池 score 前 N 组")
+    ap.add_argument("--grid", help="参数网格 JSON（或 .json 文件路径），如 {\"TP_RATE\": [0.01, 0.02]}")
+    ap.add_argument("--base", type=int, help="网格的基础参数组 ai_params id，缺省为模板默认值")
+    ap.add_argument("--insts", help="逗号分隔的 instId，缺省为该周期全部")
+    ap.add_argument("--ranges", help="逗号分隔的 起:止 日期区间（UTC），如 2025-01-01:2025-04-01")
+    ap.add_argument("--days", type=int, default=bt.BACKTEST_DAYS, help="未给 --ranges 时回测最近 N 天（截到整点，便于续跑）")
+    ap.add_argument("--bar", default=bt.BACKTEST_BAR)
+    ap.add_argument("--source", choices=["rules", "signals"], default="rules")
+    ap.add_argument("--equity", type=float, default=bt.INITIAL_EQUITY)
+    ap.add_argument("--slippage", type=float, default=bt.SLIPPAGE)
+    ap.add_argument("--workers", type=int, default=SWEEP_WORKERS)
+    ap.add_argument("--write-back", action="store_true", help="单区间时把指标写回 ai_params")
+    ap.add_argument("--resume", metavar="SWEEP_ID")
+    ap.add_argument("--show", metavar="SWEEP_ID")
+    ap.add_argument("--list", action="store_true")
+    args = ap.parse_args()
+
+    if args.list:
+        list_sweeps()
+        return
+    if args.show:
+        show(args.show)
+        return
+    if args.resume:
+        spec = load_spec(args.resume)
+        if spec is None:
+            print(f"{FAILED_COLOR}[扫描] 找不到 {args.resume}{RESET_COLOR}")
+            sys.exit(1)
+        if spec.get("engine") != ENGINE_VERSION:
+            print(f"{FAILED_COLOR}[扫描] {args.resume} 是旧版回测口径的结果，按当前口径重新扫描{RESET_COLOR}")
+            spec["engine"] = ENGINE_VERSION
+    else:
+        if args.grid:
+            grid = json.load(open(args.grid, encoding="utf-8")) if os.path.exists(args.grid) else json.loads(args.grid)
+            base = pool_groups([args.base]) if args.base is not None else []
+            groups = grid_groups(grid, base[0] if base else None)
+        else:
+            groups = pool_groups([int(x) for x in args.groups.split(",")] if args.groups else None, args.top)
+        if not groups:
+            print(f"{FAILED_COLOR}[扫描] 没有参数组可扫{RESET_COLOR}")
+            sys.exit(1)
+        if args.ranges:
+            ranges = parse_ranges(args.ranges)
+        else:
+            end = int(time.time()) // 3600 * 3600
+            ranges = [(end - args.days * 86400, end)]
+        insts = [x.strip() for x in args.insts.split(",") if x.strip()] if args.insts else get_kline_store().inst_ids(args.bar)
+        rules_cfg = None
+        if args.source == "rules":
+            sr.load_rules()          # 不存在时写入默认规则
+            with open(sr.RULES_FILE, "r", encoding="utf-8") as f:
+                rules_cfg = json.load(f)
+        spec = make_spec(groups, insts, ranges, args.bar, args.source, rules_cfg, args.equity, args.slippage)
+    run_sweep(spec, workers=max(1, args.workers), write_back=args.write_back)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,22 @@
 import os
+import json
 import time
 import sqlite3
 import numpy as np
 from utils.config import DB_DIR, SIGNAL_POOL_DB
+from utils.signal_queue import ensure_queue_schema, PERIOD_SECONDS
+from utils.signal_notify import subscribe, Subscription
+from utils.kline_store import get_kline_store
+from strategy.signal_rules import load_rules, evaluate, build_panel
 
 PERIODS = ["1m", "3m", "5m", "15m", "1H", "4H", "1D"]
 TRADE_SIGNAL_WINDOW_SEC = 30
 ORDERBOOK_SIGNAL_WINDOW_SEC = 30
 KLINE_PERIOD_WINDOW = {"1m": 90, "3m": 200, "5m": 300, "15m": 900, "1H": 2000, "4H": 9000, "1D": 90000}
+SIGNAL_EXPIRE_SEC = int(os.environ.get("SIGNAL_EXPIRE_SEC", "10"))   # 信号有效期（秒）
+GEN_SLEEP_SEC = float(os.environ.get("SIGNAL_GEN_SLEEP", "60"))      # 无新 K 线时的兜底扫描周期
+GEN_MIN_GAP_SEC = float(os.environ.get("SIGNAL_GEN_MIN_GAP", "1"))   # K 线库有写入时两次扫描的最小间隔
+HEALTH_CHECK_SEC = 60
 
 def ensure_signal_pool_table():
     conn = sqlite3.connect(SIGNAL_POOL_DB)
@@ -28,6 +37,7 @@ def ensure_signal_pool_table():
     )""")
     conn.commit()
     conn.close()
+    ensure_queue_schema(SIGNAL_POOL_DB)
 
 def get_signal_cursor(instId, period, signal_type):
     conn = sqlite3.connect(SIGNAL_POOL_DB)
@@ -56,28 +66,12 @@ def is_real_symbol(symbol):
     return any(s.endswith(e) for e in allowed_ends)
 
 def get_strategy_symbols(period):
-    dbfile = f'kline_{period}.db'
-    tablename = f'kline_{period}'
-    path = os.path.join(DB_DIR, dbfile)
-    if not os.path.exists(path): return []
-    conn = sqlite3.connect(path)
-    cur = conn.cursor()
-    cur.execute(f"SELECT DISTINCT instId FROM {tablename}")
-    symbols = [row[0] for row in cur.fetchall() if is_real_symbol(row[0])]
-    conn.close()
-    return symbols
+    return [s for s in get_kline_store().inst_ids(period) if is_real_symbol(s)]
 
 def get_latest_kline(instId, period, window=20):
-    dbfile = f'kline_{period}.db'
-    tablename = f'kline_{period}'
-    path = os.path.join(DB_DIR, dbfile)
-    if not os.path.exists(path): return []
-    conn = sqlite3.connect(path)
-    cur = conn.cursor()
-    cur.execute(f"SELECT ts, close FROM {tablename} WHERE instId=? ORDER BY ts ASC LIMIT ?", (instId, window))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    """最近 window 根 [(ts, close)] 升序（原来 ORDER BY ts ASC LIMIT 取到的是最老的一段）"""
+    k = get_kline_store().latest(instId, period, window)
+    return list(zip(k.ts.tolist(), k.close.tolist()))
 
 def simple_ma(series, window=5):
     if len(series) < window: return None
@@ -105,7 +99,7 @@ def get_signal_priority_and_promotion(signal_type):
 
 def insert_signal(instId, period, ts, close, vol, signal_type, score=7.0, params=None, source="signal_engine_v2"):
     now_ts = int(time.time())
-    expire_ts = now_ts + 10
+    expire_ts = now_ts + SIGNAL_EXPIRE_SEC
     priority, promotion_level = get_signal_priority_and_promotion(signal_type)
     params = params or {}
     conn = sqlite3.connect(SIGNAL_POOL_DB)
@@ -120,45 +114,113 @@ def insert_signal(instId, period, ts, close, vol, signal_type, score=7.0, params
         return
     c.execute("""
         INSERT INTO signals
-        (instId, period, ts, close, vol, signal_type, status, score, params, created_at, source, priority, promotion_level, expire_ts, source_tag)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        (instId, period, ts, close, vol, signal_type, status, score, params, created_at, source, priority, promotion_level, expire_ts, source_tag, created_ms)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """, (
         instId, period, ts, close, vol, signal_type, 'WAIT_SIMU', score,
-        json.dumps(params or {}, ensure_ascii=False), now_ts, source, priority, promotion_level, expire_ts, "signal_engine"
+        json.dumps(params or {}, ensure_ascii=False), now_ts, source, priority, promotion_level, expire_ts, "signal_engine",
+        int(time.time() * 1000)
     ))
     conn.commit()
     conn.close()
 
-# =============== 增量K线信号主逻辑 ===============
+# =============== 增量K线信号主逻辑（批量 + 规则配置见 strategy/signal_rules.py）===============
+def load_signal_cursors(conn, period=None):
+    """一次读出全部游标（或某个周期的）：(instId, period, signal_type) -> last_ts"""
+    sql, args = "SELECT instId, period, signal_type, last_ts FROM signal_cursor", ()
+    if period is not None:
+        sql, args = sql + " WHERE period=?", (period,)
+    return {(i, p, s): int(t or 0) for i, p, s, t in conn.execute(sql, args)}
+
+def _load_panel(store, period, since, lookback, insts=None, keep_order=False):
+    """since 之后的候选 K 线 + 往前 lookback 根；按时间多取一倍，容忍缺根
+    insts 限定 instId 范围（分片扫描）；keep_order=True 时面板行严格按 insts 排（跨周期对齐用）"""
+    bar_sec = PERIOD_SECONDS.get(period, 60)
+    series = store.get_all(period, since - 2 * (lookback + 2) * bar_sec, insts)
+    if not keep_order:
+        insts = [i for i in series if is_real_symbol(i)]
+    width = lookback + KLINE_PERIOD_WINDOW.get(period, 90) // bar_sec + 3
+    return build_panel(series, width, insts)
+
+def scan_period(period, cursors, now_ts, rules=None, store=None, insts=None):
+    """一个周期的全部 instId（或 insts 这一片）一次取数、全部规则一次求值，
+    返回命中 [(instId, period, ts, price, signal_type, params, score)]"""
+    rules = [r for r in (load_rules() if rules is None else rules) if r.applies(period)]
+    if not rules:
+        return []
+    store = store or get_kline_store()
+    since = now_ts - KLINE_PERIOD_WINDOW.get(period, 90)
+    insts, panel = _load_panel(store, period, since, max(r.lookback for r in rules), insts)
+    if not insts:
+        return []
+    needs = {}
+    for r in rules:
+        for tf, n in r.needs.items():
+            needs[tf] = max(needs.get(tf, 0), n)
+
+    def loader(tf):
+        return _load_panel(store, tf, since, needs[tf], insts, keep_order=True)[1]
+
+    ts, close = panel["ts"], panel["close"]
+    fresh = ts >= max(since, 1)
+    ctx, masks = evaluate(rules, panel, loader)
+    hits = []
+    for rule, mask in masks:
+        cur = np.array([[cursors.get((i, period, rule.signal_type), 0)] for i in insts], dtype=np.int64)
+        for r, c in zip(*np.nonzero(mask & fresh & (ts > cur))):
+            hits.append((insts[r], period, int(ts[r, c]), float(close[r, c]), rule.signal_type,
+                         rule.params(ctx, r, c), rule.score))
+    return hits
+
+def write_kline_signals(conn, hits, source="kline_engine", guard=None):
+    """信号 + 游标一个写事务（BEGIN IMMEDIATE）写完；同 (instId, period, type, ts) 已有待消费信号的不重复插，
+    游标只前进不后退。guard(conn) 在同一事务里先执行，返回 False 时整批丢弃；返回是否写入"""
+    now_ts = int(time.time())
+    now_ms = int(time.time() * 1000)
+    rows, cursor_rows = [], {}
+    for (instId, period, ts, price, signal_type, params, score) in hits:
+        priority, promotion_level = get_signal_priority_and_promotion(signal_type)
+        rows.append((instId, period, ts, price, 0.01, signal_type, 'WAIT_SIMU', score,
+                     json.dumps(params, ensure_ascii=False), now_ts, source, priority, promotion_level,
+                     now_ts + SIGNAL_EXPIRE_SEC, "signal_engine", now_ms,
+                     instId, period, signal_type, ts))
+        key = (instId, period, signal_type)
+        cursor_rows[key] = max(cursor_rows.get(key, 0), ts)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if guard is not None and not guard(conn):
+            conn.execute("ROLLBACK")
+            return False
+        conn.executemany("""
+            INSERT INTO signals
+            (instId, period, ts, close, vol, signal_type, status, score, params, created_at, source,
+             priority, promotion_level, expire_ts, source_tag, created_ms)
+            SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM signals WHERE instId=? AND period=? AND signal_type=? AND ts=?
+                              AND status='WAIT_SIMU')
+        """, rows)
+        conn.executemany("INSERT INTO signal_cursor (instId, period, signal_type, last_ts) VALUES (?, ?, ?, ?) "
+                         "ON CONFLICT (instId, period, signal_type) DO UPDATE SET last_ts=MAX(last_ts, excluded.last_ts)",
+                         [(*k, v) for k, v in cursor_rows.items()])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return True
+
 def fetch_kline_signals():
-    total_signal = 0
     now_ts = int(time.time())
-    for period in PERIODS:
-        window_sec = KLINE_PERIOD_WINDOW.get(period, 90)
-        symbols = get_strategy_symbols(period)
-        for instId in symbols:
-            kline_rows = get_latest_kline(instId, period, window=20)
-            if len(kline_rows) < 15: continue
-            for signal_type, judge_func in [
-                ('BREAKOUT_UP', lambda closes, ma5, ma10, rsi, price: price > ma5 and price > ma10 and rsi and rsi > 70),
-                ('BREAKOUT_DOWN', lambda closes, ma5, ma10, rsi, price: price < ma5 and price < ma10 and rsi and rsi < 30)
-            ]:
-                last_cursor = get_signal_cursor(instId, period, signal_type)
-                for ts, price in kline_rows:
-                    ts = int(ts)
-                    if ts <= last_cursor or ts < now_ts - window_sec: continue
-                    closes = [float(x[1]) for x in kline_rows if int(x[0]) <= ts]
-                    ma5 = simple_ma(closes, window=5)
-                    ma10 = simple_ma(closes, window=10)
-                    rsi = simple_rsi(closes, window=14)
-                    if ma5 is None or ma10 is None or rsi is None: continue
-                    if judge_func(closes, ma5, ma10, rsi, price):
-                        insert_signal(instId, period, ts, price, 0.01, signal_type, score=7.5,
-                                     params={"ma5": ma5, "ma10": ma10, "rsi": rsi}, source="kline_engine")
-                        update_signal_cursor(instId, period, signal_type, ts)
-                        total_signal += 1
-    print(f"[K线信号] 共产出 {total_signal} 个信号。")
-    return total_signal
+    conn = sqlite3.connect(SIGNAL_POOL_DB, timeout=30)
+    try:
+        cursors = load_signal_cursors(conn)
+        rules = load_rules()
+        hits = [h for period in PERIODS for h in scan_period(period, cursors, now_ts, rules)]
+        if hits:
+            write_kline_signals(conn, hits)
+    finally:
+        conn.close()
+    print(f"[K线信号] 共产出 {len(hits)} 个信号。")
+    return len(hits)
 
 # ========== 健康巡检：信号表检查 ==========
 def signal_health_check():
@@ -188,18 +250,30 @@ def mark_cold_start_signals():
     conn.close()
     print("[冷启动] 已把历史老信号批量标记为COLD_START。")
 
+def kline_subscription():
+    """1m K线库有写入即唤醒扫描；库还不存在时退化为定时扫描"""
+    path = os.path.join(DB_DIR, f"kline_{PERIODS[0]}.db")
+    return subscribe(path) if os.path.exists(path) else Subscription(None)
+
 def main():
     ensure_signal_pool_table()
     print("=== 增量闭环信号生成器 启动 ===")
     cold_start = True
+    sub = kline_subscription()
+    last_health = 0
     while True:
+        t0 = time.time()
         if cold_start:
             mark_cold_start_signals()  # 冷启动信号归档，只归档历史
             cold_start = False
         signal_total = fetch_kline_signals()
-        signal_health_check()          # 每轮巡检，实时输出信号池状态
+        if time.time() - last_health >= HEALTH_CHECK_SEC:
+            signal_health_check()      # 巡检信号池状态
+            last_health = time.time()
         print(f"\033[94m[信号汇总] 本轮产出 {signal_total} 个信号。\033[0m")
-        time.sleep(60)
+        # 新 K 线落库立即进入下一轮（至少间隔 GEN_MIN_GAP_SEC），没有写入时按 GEN_SLEEP_SEC 兜底
+        time.sleep(max(0.0, GEN_MIN_GAP_SEC - (time.time() - t0)))
+        sub.wait(GEN_SLEEP_SEC)
 
 if __name__ == "__main__":
     main()
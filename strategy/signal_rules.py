@@ -0,0 +1,539 @@
+# strategy/signal_rules.py
+"""
+声明式信号规则：规则写在 JSON 配置里，加载时编译一次成 NumPy 面板表达式，
+每轮对 [instId × K线] 整个面板求值 —— 新策略 = 加一条配置，不用再写循环
+
+配置文件默认 JSON_DIR/signal_rules.json（不存在时写入默认规则，SIGNAL_RULES_FILE 可改路径，文件改动后自动重载）：
+  {"rules": [
+    {"name": "BREAKOUT_UP", "signal_type": "BREAKOUT_UP", "periods": "*",      # 或 ["1m", "5m"]
+     "when": "close > ma5 and close > ma10 and rsi14 > 70",
+     "score": 7.5, "record": {"ma5": "ma5", "rsi": "rsi14"}, "side": "long", "enabled": true}
+  ]}
+
+表达式是 Python 语法的子集（编译期白名单校验，不 eval）：
+  列     open high low close vol
+  简写   ma5 ema12 rsi14 std20 = ma(close, 5) ...；highest20 = highest(high, 20)；lowest20 = lowest(low, 20)；atr14
+  函数   ma ema rsi std highest lowest (x, n)；shift change pct (x, k=1)；abs(x)；tr()；atr(n)；
+         cross_above(a, b) / cross_below(a, b)
+  跨周期 tf("1H", rsi14 > 50) —— 取 ts 不晚于当前 K 线的最近一根 1H（与实时扫描口径一致，含未收盘的那根）
+  运算   + - * /，比较（可连写 30 < rsi14 < 70），and / or / not
+- 同一次求值里相同子表达式只算一遍（上百条规则都引用 ma5 也只算一次）
+- 窗口未满的位置是 NaN，比较结果为 False，不用再单独判断"够不够根数"
+- rsi 与 signal_generator.simple_rsi 同口径：窗口内涨幅均值 / 跌幅均值，单边为空取 1e-6
+"""
+import os
+import re
+import ast
+import json
+import threading
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.config import JSON_DIR
+from utils.signal_queue import PERIOD_SECONDS
+
+RULES_FILE = os.environ.get("SIGNAL_RULES_FILE") or os.path.join(str(JSON_DIR), "signal_rules.json")
+COLUMNS = ("open", "high", "low", "close", "vol")
+EMA_WARMUP = 4            # ema(n) 多取 4n 根预热，adjust=False 递推的初值影响 < 0.1%
+_ROW_SPAN = 1 << 42       # asof 对齐时把每行 ts 平移到互不重叠的区间，一次 searchsorted
+
+FAILED_COLOR = '\033[91m'
+OK_COLOR = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+DEFAULT_RULES = {"rules": [
+    {"name": "BREAKOUT_UP", "signal_type": "BREAKOUT_UP", "periods": "*",
+     "when": "close > ma5 and close > ma10 and rsi14 > 70", "score": 7.5,
+     "record": {"ma5": "ma5", "ma10": "ma10", "rsi": "rsi14"}},
+    {"name": "BREAKOUT_DOWN", "signal_type": "BREAKOUT_DOWN", "periods": "*",
+     "when": "close < ma5 and close < ma10 and 0 < rsi14 < 30", "score": 7.5,
+     "record": {"ma5": "ma5", "ma10": "ma10", "rsi": "rsi14"}},
+]}
+
+
+# =============== 面板原语（[N, W]，沿 W 方向滚动，NaN 传播）===============
+def _nan_like(x):
+    return np.full(x.shape, np.nan)
+
+
+def _rolling(x, n, reduce):
+    out = _nan_like(x)
+    if x.shape[1] >= n:
+        out[:, n - 1:] = reduce(sliding_window_view(x, n, axis=1), axis=-1)
+    return out
+
+
+def _prefix(x):
+    """前缀和（值, NaN 个数）：同一序列的所有窗口长度共用，每个窗口和只剩一次相减"""
+    nan = np.isnan(x)
+    c = np.zeros((x.shape[0], x.shape[1] + 1))
+    np.cumsum(np.where(nan, 0.0, x), axis=1, out=c[:, 1:])
+    k = np.zeros(c.shape, dtype=np.int64)
+    np.cumsum(nan, axis=1, out=k[:, 1:])
+    return c, k
+
+
+def _window_sum(pre, n):
+    """窗口和，O(N·W) 与窗口长度无关；窗口内有 NaN 则为 NaN"""
+    c, k = pre
+    out = np.full((c.shape[0], c.shape[1] - 1), np.nan)
+    if c.shape[1] > n:
+        out[:, n - 1:] = np.where(k[:, n:] - k[:, :-n] > 0, np.nan, c[:, n:] - c[:, :-n])
+    return out
+
+
+def _rolling_ext(x, n, op):
+    """窗口最大 / 最小：倍增（窗口 2^k 两两合并），O(N·W·log n)"""
+    out = _nan_like(x)
+    w = x.shape[1]
+    if w < n:
+        return out
+    m, span = x, 1
+    while span * 2 <= n:
+        m = op(m[:, :-span], m[:, span:])      # m[:, i] 覆盖 x[:, i:i+2span]
+        span *= 2
+    out[:, n - 1:] = op(m[:, :w - n + 1], m[:, n - span:w - span + 1])
+    return out
+
+
+def _ma_window(pre, n):
+    return _window_sum(pre, n) / n
+
+
+def p_ma(x, n):
+    return _ma_window(_prefix(x), n)
+
+
+def p_std(x, n):
+    """样本标准差（ddof=1），与 pandas rolling().std() 一致"""
+    return _rolling(x, n, lambda w, axis: w.std(axis=axis, ddof=1)) if n > 1 else _nan_like(x)
+
+
+def p_highest(x, n):
+    return _rolling_ext(x, n, np.maximum)
+
+
+def p_lowest(x, n):
+    return _rolling_ext(x, n, np.minimum)
+
+
+def p_ema(x, n):
+    """ewm(span=n, adjust=False)，从每行第一个非 NaN 起递推"""
+    a = 2.0 / (n + 1)
+    out = _nan_like(x)
+    prev = np.full(x.shape[0], np.nan)
+    for c in range(x.shape[1]):
+        v = x[:, c]
+        prev = np.where(np.isnan(prev), v, prev + a * (v - prev))
+        out[:, c] = prev
+    return out
+
+
+def _rsi_prefix(x):
+    d = np.diff(x, axis=1)
+    nan = np.isnan(d)
+    return (_prefix(np.maximum(d, 0.0)), _prefix(np.minimum(d, 0.0)),     # NaN 原样传播
+            _prefix(np.where(nan, np.nan, d > 0)), _prefix(np.where(nan, np.nan, d < 0)))
+
+
+def _rsi_window(pre, n):
+    up, dn, n_up, n_dn = (_window_sum(p, n) for p in pre)
+    out = np.full((up.shape[0], up.shape[1] + 1), np.nan)
+    gain = np.where(n_up > 0, up / np.maximum(n_up, 1), 1e-6)
+    loss = np.where(n_dn > 0, -dn / np.maximum(n_dn, 1), 1e-6)
+    out[:, 1:] = np.where(np.isnan(n_up), np.nan, 100 - 100 / (1 + gain / loss))
+    return out
+
+
+def p_rsi(x, n):
+    return _rsi_window(_rsi_prefix(x), n)
+
+
+def p_shift(x, k=1):
+    if k == 0:
+        return x
+    out = np.zeros(x.shape, dtype=bool) if x.dtype == bool else _nan_like(x)
+    if k < x.shape[1]:
+        out[:, k:] = x[:, :-k]
+    return out
+
+
+def p_change(x, k=1):
+    return x - p_shift(x, k)
+
+
+def p_pct(x, k=1):
+    return x / p_shift(x, k) - 1
+
+
+def p_cross_above(a, b):
+    return (a > b) & (p_shift(a) <= p_shift(b))
+
+
+def p_cross_below(a, b):
+    return (a < b) & (p_shift(a) >= p_shift(b))
+
+
+def p_tr(high, low, close):
+    """真实波幅，第一根没有前收盘时取 high - low（与 IndicatorState 一致）"""
+    pc = p_shift(close, 1)
+    return np.fmax(high - low, np.fmax(np.abs(high - pc), np.abs(low - pc)))
+
+
+def asof_align(src_ts, src_val, dst_ts):
+    """逐行把另一周期的值对齐到本周期每根 K 线：取 ts <= 本根 ts 的最近一根，没有则 NaN / False"""
+    n, w = src_ts.shape
+    off = (np.arange(n, dtype=np.int64) * _ROW_SPAN)[:, None]
+    idx = np.searchsorted((src_ts + off).ravel(), (dst_ts + off).ravel(), side="right") - 1
+    ok = idx >= np.repeat(np.arange(n) * w, dst_ts.shape[1])
+    vals = np.broadcast_to(src_val, src_ts.shape).ravel()
+    fill = False if vals.dtype == bool else np.nan
+    return np.where(ok, vals[np.maximum(idx, 0)], fill).reshape(dst_ts.shape)
+
+
+# 名称 -> (实现, 参数形态, 额外回看根数)；x = 序列，n = 窗口（必填正整数），k = 位移（默认 1）
+FUNCS = {
+    "ma": (p_ma, "xn", lambda n: n - 1),
+    "std": (p_std, "xn", lambda n: n - 1),
+    "highest": (p_highest, "xn", lambda n: n - 1),
+    "lowest": (p_lowest, "xn", lambda n: n - 1),
+    "ema": (p_ema, "xn", lambda n: EMA_WARMUP * n),
+    "rsi": (p_rsi, "xn", lambda n: n),
+    "shift": (p_shift, "xk", lambda k: k),
+    "change": (p_change, "xk", lambda k: k),
+    "pct": (p_pct, "xk", lambda k: k),
+    "abs": (np.abs, "x", lambda _: 0),
+    "cross_above": (p_cross_above, "xx", lambda _: 1),
+    "cross_below": (p_cross_below, "xx", lambda _: 1),
+}
+# 按窗口滚动的函数：前缀（与窗口无关，同一序列只算一次）+ 窗口差分
+PREFIXED = {"ma": (_prefix, _ma_window), "rsi": (_rsi_prefix, _rsi_window)}
+SHORTHAND = re.compile(r"^(ma|ema|rsi|std|highest|lowest|atr)(\d+)$")
+SHORTHAND_SRC = {"highest": "high", "lowest": "low"}
+
+_BINOPS = {ast.Add: ("+", np.add), ast.Sub: ("-", np.subtract), ast.Mult: ("*", np.multiply),
+           ast.Div: ("/", np.divide)}
+_CMPOPS = {ast.Gt: (">", np.greater), ast.GtE: (">=", np.greater_equal), ast.Lt: ("<", np.less),
+           ast.LtE: ("<=", np.less_equal), ast.Eq: ("==", np.equal), ast.NotEq: ("!=", np.not_equal)}
+
+
+# =============== 编译 ===============
+class Expr:
+    """编译后的节点：key 用于一次求值内的子表达式去重，lookback = 需要往前多少根（本周期）"""
+    __slots__ = ("key", "fn", "lookback", "const")
+
+    def __init__(self, key, fn, lookback=0, const=False):
+        self.key = key
+        self.fn = fn
+        self.lookback = lookback
+        self.const = const
+
+    def __call__(self, ctx):
+        v = ctx.cache.get(self.key)
+        if v is None:
+            v = ctx.cache[self.key] = self.fn(ctx)
+        return v
+
+
+class _Compiler:
+    def __init__(self):
+        self.needs = {}       # 跨周期引用：tf -> 该周期需要的回看根数
+        self.src = ""
+
+    def compile(self, src):
+        self.src = str(src)
+        try:
+            tree = ast.parse(self.src.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"表达式语法错误: {self.src!r} ({e.msg})")
+        return self.visit(tree.body)
+
+    def fail(self, msg):
+        raise ValueError(f"{msg}: {self.src!r}")
+
+    def visit(self, node):
+        m = getattr(self, "_" + type(node).__name__, None)
+        if m is None:
+            self.fail(f"不支持的语法 {type(node).__name__}")
+        return m(node)
+
+    def _Constant(self, node):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            self.fail(f"只支持数字常量，不支持 {node.value!r}")
+        v = float(node.value)
+        return Expr(repr(v), lambda ctx: v, const=True)
+
+    def _Name(self, node):
+        name = "vol" if node.id == "volume" else node.id
+        if name in COLUMNS:
+            return Expr(name, lambda ctx: ctx.col(name))
+        if name == "tr":
+            return self._tr()
+        m = SHORTHAND.match(name)
+        if m:
+            fname, n = m.group(1), int(m.group(2))
+            if fname == "atr":
+                return self._apply("ma", [self._tr()], n)
+            return self._apply(fname, [self._Name(ast.Name(SHORTHAND_SRC.get(fname, "close")))], n)
+        self.fail(f"未知名称 {node.id!r}")
+
+    def _tr(self):
+        return Expr("tr", lambda ctx: p_tr(ctx.col("high"), ctx.col("low"), ctx.col("close")), 1)
+
+    def _apply(self, fname, xs, n=None):
+        impl, kinds, extra = FUNCS[fname]
+        if any(x.const for x in xs):
+            self.fail(f"{fname}() 的序列参数不能是常量")
+        args = ",".join([x.key for x in xs] + ([] if n is None else [str(n)]))
+        lookback = max(x.lookback for x in xs) + extra(n)
+        if fname in PREFIXED:
+            pre_fn, win_fn = PREFIXED[fname]
+            x = xs[0]
+            pre = Expr(f"{pre_fn.__name__}({x.key})", lambda ctx: pre_fn(x(ctx)), x.lookback)
+
+            def fn(ctx):
+                return win_fn(pre(ctx), n)
+        elif n is None:
+            def fn(ctx):
+                return impl(*[x(ctx) for x in xs])
+        else:
+            def fn(ctx):
+                return impl(*[x(ctx) for x in xs], n)
+        return Expr(f"{fname}({args})", fn, lookback)
+
+    def _int_arg(self, node, fname, minimum):
+        if not isinstance(node, ast.Constant) or isinstance(node.value, bool) or not isinstance(node.value, int) \
+                or node.value < minimum:
+            self.fail(f"{fname}() 的窗口 / 位移参数必须是 >= {minimum} 的整数")
+        return node.value
+
+    def _Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            self.fail("只支持 name(参数, ...) 形式的函数调用")
+        fname, args = node.func.id, node.args
+        if fname == "tf":
+            return self._tf(args)
+        if fname == "tr" and not args:
+            return self._tr()
+        if fname == "atr" and len(args) == 1:
+            return self._apply("ma", [self._tr()], self._int_arg(args[0], fname, 1))
+        if fname not in FUNCS:
+            self.fail(f"未知函数 {fname}()")
+        kinds = FUNCS[fname][1]
+        nx = kinds.count("x")
+        if kinds.endswith("k") and len(args) == nx:
+            n = 1
+        elif len(args) != len(kinds):
+            self.fail(f"{fname}() 参数个数不对")
+        else:
+            n = None if len(kinds) == nx else self._int_arg(args[-1], fname, 1 if kinds.endswith("n") else 0)
+        return self._apply(fname, [self.visit(a) for a in args[:nx]], n)
+
+    def _tf(self, args):
+        if len(args) != 2 or not isinstance(args[0], ast.Constant) or args[0].value not in PERIOD_SECONDS:
+            self.fail(f"tf() 用法为 tf(\"周期\", 表达式)，周期取值 {list(PERIOD_SECONDS)}")
+        tf = args[0].value
+        inner = _Compiler()
+        inner.src = self.src
+        sub = inner.visit(args[1])
+        if inner.needs:
+            self.fail("tf() 不能嵌套")
+        self.needs[tf] = max(self.needs.get(tf, 0), sub.lookback)
+        return Expr(f"tf({tf},{sub.key})", lambda ctx: ctx.align(tf, sub))
+
+    def _BinOp(self, node):
+        if type(node.op) not in _BINOPS:
+            self.fail(f"不支持的运算 {type(node.op).__name__}")
+        sym, op = _BINOPS[type(node.op)]
+        a, b = self.visit(node.left), self.visit(node.right)
+        return Expr(f"({a.key}{sym}{b.key})", lambda ctx: op(a(ctx), b(ctx)),
+                    max(a.lookback, b.lookback), a.const and b.const)
+
+    def _UnaryOp(self, node):
+        x = self.visit(node.operand)
+        if isinstance(node.op, ast.Not):
+            return Expr(f"not({x.key})", lambda ctx: np.logical_not(x(ctx)), x.lookback, x.const)
+        if isinstance(node.op, ast.USub):
+            return Expr(f"-({x.key})", lambda ctx: -x(ctx), x.lookback, x.const)
+        if isinstance(node.op, ast.UAdd):
+            return x
+        self.fail(f"不支持的运算 {type(node.op).__name__}")
+
+    def _BoolOp(self, node):
+        xs = [self.visit(v) for v in node.values]
+        sym, op = ("and", np.logical_and) if isinstance(node.op, ast.And) else ("or", np.logical_or)
+
+        def fn(ctx):
+            v = xs[0](ctx)
+            for x in xs[1:]:
+                v = op(v, x(ctx))
+            return v
+        return Expr(f"{sym}({','.join(x.key for x in xs)})", fn,
+                    max(x.lookback for x in xs), all(x.const for x in xs))
+
+    def _Compare(self, node):
+        items = [self.visit(node.left)] + [self.visit(c) for c in node.comparators]
+        pairs = []
+        for a, o, b in zip(items, node.ops, items[1:]):
+            if type(o) not in _CMPOPS:
+                self.fail(f"不支持的比较 {type(o).__name__}")
+            sym, op = _CMPOPS[type(o)]
+            pairs.append(Expr(f"({a.key}{sym}{b.key})", lambda ctx, a=a, b=b, op=op: op(a(ctx), b(ctx)),
+                              max(a.lookback, b.lookback), a.const and b.const))
+        if len(pairs) == 1:
+            return pairs[0]
+
+        def fn(ctx):
+            v = pairs[0](ctx)
+            for p in pairs[1:]:
+                v = np.logical_and(v, p(ctx))
+            return v
+        return Expr(f"and({','.join(p.key for p in pairs)})", fn,
+                    max(p.lookback for p in pairs), all(p.const for p in pairs))
+
+
+def compile_expr(src):
+    """单个表达式 -> (Expr, 跨周期需求 {tf: 回看根数})"""
+    c = _Compiler()
+    return c.compile(src), c.needs
+
+
+# =============== 求值 ===============
+class PanelContext:
+    """一次求值：面板 + 子表达式缓存；跨周期面板由 loader(tf) 按需加载（行顺序须与本面板相同）
+    period 给定时 tf() 按收盘时间对齐：只取在本根收盘时已经收盘的那根（回测用，历史 K 线都是收盘后的终值）"""
+
+    def __init__(self, panel, loader=None, period=None):
+        self.panel = panel            # {"ts": int64[N, W], "open"/"high"/...: float[N, W]}
+        self.loader = loader
+        self.period = period
+        self.cache = {}
+        self._subs = {}
+
+    @property
+    def shape(self):
+        return self.panel["ts"].shape
+
+    def col(self, name):
+        return self.panel[name]
+
+    def align(self, tf, expr):
+        sub = self._subs.get(tf)
+        if sub is None:
+            if self.loader is None:
+                raise ValueError(f"规则引用了 {tf} 周期，但求值时没有提供该周期的数据")
+            sub = self._subs[tf] = PanelContext(self.loader(tf))
+        src_ts, dst_ts = sub.panel["ts"], self.panel["ts"]
+        if self.period:
+            src_ts = src_ts + PERIOD_SECONDS[tf]
+            dst_ts = dst_ts + PERIOD_SECONDS.get(self.period, 60)
+        return asof_align(src_ts, expr(sub), dst_ts)
+
+
+class Rule:
+    def __init__(self, d):
+        self.name = d.get("name") or d.get("signal_type")
+        self.signal_type = d.get("signal_type") or self.name
+        if not self.name or not d.get("when"):
+            raise ValueError(f"规则缺少 name/signal_type 或 when: {d}")
+        periods = d.get("periods", "*")
+        self.periods = None if periods in (None, "*") else set([periods] if isinstance(periods, str) else periods)
+        self.score = float(d.get("score", 7.0))
+        self.side = d.get("side")     # 回测方向：long / short，缺省按 signal_type 推断
+        c = _Compiler()
+        self.when = c.compile(d["when"])
+        self.record = {k: c.compile(v) for k, v in (d.get("record") or {}).items()}
+        self.needs = c.needs
+        self.lookback = max([self.when.lookback] + [e.lookback for e in self.record.values()])
+
+    def applies(self, period):
+        return self.periods is None or period in self.periods
+
+    def mask(self, ctx):
+        v = np.asarray(self.when(ctx))
+        if v.dtype != bool:
+            v = (v != 0) & ~np.isnan(v)
+        return np.broadcast_to(v, ctx.shape)
+
+    def params(self, ctx, r, c):
+        out = {}
+        for k, e in self.record.items():
+            v = np.broadcast_to(e(ctx), ctx.shape)[r, c]
+            out[k] = None if v != v else (bool(v) if isinstance(v, np.bool_) else float(v))
+        return out
+
+    def __repr__(self):
+        return f"Rule({self.name}: {self.when.key})"
+
+
+def compile_rules(cfg):
+    """配置 dict -> [Rule]；单条编译失败只跳过该条并打印原因"""
+    rules = []
+    for d in cfg.get("rules", []):
+        if not d.get("enabled", True):
+            continue
+        try:
+            rules.append(Rule(d))
+        except Exception as e:
+            print(f"{FAILED_COLOR}[信号规则] 跳过 {d.get('name') or d.get('signal_type')}: {e}{RESET_COLOR}")
+    return rules
+
+
+def evaluate(rules, panel, loader=None, period=None):
+    """一个面板上求全部规则，返回 (ctx, [(rule, bool[N, W])])；ctx 可继续用于 rule.params
+    period = 本面板周期，给定时 tf() 只看已收盘的高周期 K 线（见 PanelContext）"""
+    ctx = PanelContext(panel, loader, period)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return ctx, [(r, r.mask(ctx)) for r in rules]
+
+
+def build_panel(series, width, insts=None):
+    """{instId: KlineArrays} -> (insts, panel)；每行取最近 width 根右对齐，左侧 ts 补 0、价格补 NaN"""
+    insts = list(series) if insts is None else list(insts)
+    panel = {"ts": np.zeros((len(insts), width), dtype=np.int64)}
+    for c in COLUMNS:
+        panel[c] = np.full((len(insts), width), np.nan)
+    for r, inst in enumerate(insts):
+        k = series.get(inst)
+        if k is None or not len(k.ts):
+            continue
+        n = min(width, len(k.ts))
+        panel["ts"][r, width - n:] = k.ts[-n:]
+        for c in COLUMNS:
+            panel[c][r, width - n:] = getattr(k, c)[-n:]
+    return insts, panel
+
+
+# =============== 配置加载（按 mtime 热更新）===============
+_LOADED = {"path": None, "mtime": None, "rules": None}
+_LOCK = threading.Lock()
+
+
+def save_rules(cfg, path=None):
+    p = str(path or RULES_FILE)
+    os.makedirs(os.path.dirname(p) or ".", exist_ok=True)
+    tmp = p + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cfg, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, p)
+
+
+def load_rules(path=None):
+    p = str(path or RULES_FILE)
+    if not os.path.exists(p):
+        save_rules(DEFAULT_RULES, p)
+    mtime = os.path.getmtime(p)
+    with _LOCK:
+        if _LOADED["path"] == p and _LOADED["mtime"] == mtime:
+            return _LOADED["rules"]
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                cfg = json.load(f)
+        except Exception as e:
+            print(f"{FAILED_COLOR}[信号规则] 读取 {p} 失败，沿用上一版: {e}{RESET_COLOR}")
+            return _LOADED["rules"] if _LOADED["path"] == p else compile_rules(DEFAULT_RULES)
+        rules = compile_rules(cfg)
+        _LOADED.update(path=p, mtime=mtime, rules=rules)
+    print(f"{OK_COLOR}[信号规则] 已加载 {len(rules)} 条规则 ← {p}{RESET_COLOR}")
+    return rules
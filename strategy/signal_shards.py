@@ -0,0 +1,288 @@
+# strategy/signal_shards.py
+"""
+K 线信号分片扫描：(周期, instId 哈希桶) 为一个分片，分给多个 worker 进程（可跨多台机器共用同一个 signals.db）
+
+- 分片租约存在 signals.db：signal_shards（分片 -> owner / lease_until / 最近一次扫描耗时、instId 数、命中数）
+  + signal_workers（worker 心跳）。每轮 worker 在一个 BEGIN IMMEDIATE 事务里：续约自己的分片，
+  按 ceil(分片数 / 存活 worker 数) 算公平份额，多了释放、少了认领无主或租约过期的分片
+  —— worker 挂掉后心跳和租约到期（SIGNAL_SHARD_LEASE 秒），其余 worker 下一轮自动接手；新 worker 加入时老 worker 让出多余分片
+- 每个分片只读自己那一桶 instId 的 K 线（WHERE instId IN ...），游标按周期读，信号 + 游标一个事务写入；
+  写入事务里先确认分片租约仍归自己，卡住超过租约的 worker 醒来后丢弃命中，不和新 owner 重复写
+- instId -> 桶 用 crc32（进程间稳定，不能用 hash()）
+- 单进程的 signal_generator.main 保留；分片模式由本模块的协调进程负责冷启动归档、健康巡检、拉起挂掉的 worker
+
+用法：
+  python -m strategy.signal_shards --workers 4        # 本机 4 个 worker（另一台机器再起一份即可加入）
+  python -m strategy.signal_shards --status           # 各分片 owner / 租约 / 扫描耗时
+可调环境变量：SIGNAL_SHARD_BUCKETS（每个周期的桶数，默认 8）、SIGNAL_SHARD_LEASE（默认 180 秒）
+"""
+import os
+import math
+import time
+import zlib
+import socket
+import sqlite3
+import argparse
+import multiprocessing as mp
+
+from utils.config import SIGNAL_POOL_DB
+from utils.kline_store import get_kline_store
+from strategy.signal_rules import load_rules
+from strategy.signal_generator import (
+    PERIODS, GEN_SLEEP_SEC, GEN_MIN_GAP_SEC, HEALTH_CHECK_SEC,
+    ensure_signal_pool_table, is_real_symbol, load_signal_cursors, scan_period, write_kline_signals,
+    signal_health_check, mark_cold_start_signals, kline_subscription,
+)
+
+SHARD_BUCKETS = int(os.environ.get("SIGNAL_SHARD_BUCKETS", "8"))
+SHARD_LEASE_SEC = int(os.environ.get("SIGNAL_SHARD_LEASE", "180"))
+INST_TTL_SEC = 60          # 每个周期的 instId 清单缓存
+REPORT_SEC = 60
+
+FAILED_COLOR = '\033[91m'
+OK_COLOR = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+
+def shard_of(instId, buckets=SHARD_BUCKETS):
+    return zlib.crc32(instId.encode("utf-8")) % buckets
+
+
+def ensure_shard_tables(db_path=SIGNAL_POOL_DB, buckets=SHARD_BUCKETS, periods=PERIODS):
+    """建表 + 补齐 (周期, 桶)；桶数变小时删掉多出来的分片"""
+    conn = sqlite3.connect(str(db_path), timeout=30)
+    try:
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS signal_shards (
+            period TEXT, bucket INTEGER, owner TEXT, lease_until INTEGER DEFAULT 0,
+            last_scan_at INTEGER DEFAULT 0, scan_ms REAL, insts INTEGER, hits INTEGER, scans INTEGER DEFAULT 0,
+            PRIMARY KEY (period, bucket)
+        )""")
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS signal_workers (
+            owner TEXT PRIMARY KEY, host TEXT, pid INTEGER, started_at INTEGER, heartbeat INTEGER
+        )""")
+        conn.executemany("INSERT OR IGNORE INTO signal_shards (period, bucket) VALUES (?, ?)",
+                         [(p, b) for p in periods for b in range(buckets)])
+        conn.execute(f"DELETE FROM signal_shards WHERE bucket >= ? OR period NOT IN ({','.join('?' * len(periods))})",
+                     (buckets, *periods))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class ShardWorker:
+    def __init__(self, owner=None, db_path=SIGNAL_POOL_DB, lease_sec=SHARD_LEASE_SEC, store=None):
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.db_path = str(db_path)
+        self.lease_sec = int(lease_sec)
+        self.store = store
+        self.buckets = None
+        self._insts = {}           # period -> (加载时间, [instId])
+
+    def _conn(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def register(self):
+        now = int(time.time())
+        host, _, pid = self.owner.rpartition(":")
+        conn = self._conn()
+        try:
+            conn.execute("INSERT OR REPLACE INTO signal_workers (owner, host, pid, started_at, heartbeat) "
+                         "VALUES (?, ?, ?, ?, ?)", (self.owner, host, int(pid) if pid.isdigit() else None, now, now))
+        finally:
+            conn.close()
+
+    def acquire(self):
+        """心跳 + 续约 + 按公平份额释放 / 认领；返回本轮负责的 [(period, bucket)]"""
+        now = int(time.time())
+        until = now + self.lease_sec
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE signal_workers SET heartbeat=? WHERE owner=?", (now, self.owner))
+            conn.execute("DELETE FROM signal_workers WHERE heartbeat < ?", (now - 10 * self.lease_sec,))
+            live = conn.execute("SELECT COUNT(*) FROM signal_workers WHERE heartbeat >= ?",
+                                (now - self.lease_sec,)).fetchone()[0]
+            total, self.buckets = conn.execute("SELECT COUNT(*), MAX(bucket) + 1 FROM signal_shards").fetchone()
+            fair = math.ceil(total / max(1, live))
+            conn.execute("UPDATE signal_shards SET lease_until=? WHERE owner=? AND lease_until >= ?",
+                         (until, self.owner, now))
+            mine = conn.execute("SELECT period, bucket FROM signal_shards WHERE owner=? AND lease_until >= ? "
+                                "ORDER BY period, bucket", (self.owner, now)).fetchall()
+            if len(mine) > fair:
+                conn.executemany("UPDATE signal_shards SET owner=NULL, lease_until=0 WHERE period=? AND bucket=?",
+                                 mine[fair:])
+                mine = mine[:fair]
+            elif len(mine) < fair:
+                mine += conn.execute("""
+                    UPDATE signal_shards SET owner=?, lease_until=?
+                    WHERE rowid IN (
+                        SELECT rowid FROM signal_shards WHERE owner IS NULL OR lease_until < ?
+                        ORDER BY last_scan_at LIMIT ?
+                    )
+                    RETURNING period, bucket
+                """, (self.owner, until, now, fair - len(mine))).fetchall()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return [tuple(x) for x in mine]
+
+    def release(self):
+        conn = self._conn()
+        try:
+            conn.execute("UPDATE signal_shards SET owner=NULL, lease_until=0 WHERE owner=?", (self.owner,))
+            conn.execute("DELETE FROM signal_workers WHERE owner=?", (self.owner,))
+        finally:
+            conn.close()
+
+    def _shard_insts(self, period, bucket):
+        t, insts = self._insts.get(period, (0, None))
+        if insts is None or time.time() - t > INST_TTL_SEC:
+            insts = [i for i in (self.store or get_kline_store()).inst_ids(period) if is_real_symbol(i)]
+            self._insts[period] = (time.time(), insts)
+        return [i for i in insts if shard_of(i, self.buckets) == bucket]
+
+    def owns(self, conn, period, bucket):
+        """分片租约是否仍归自己（在写事务里调用）"""
+        return conn.execute("SELECT 1 FROM signal_shards WHERE period=? AND bucket=? AND owner=? AND lease_until>=?",
+                            (period, bucket, self.owner, int(time.time()))).fetchone() is not None
+
+    def scan(self, period, bucket, rules, now_ts):
+        """扫一个分片，返回 (instId 数, 命中数, 耗时 ms)，同时把统计写回 signal_shards"""
+        t0 = time.time()
+        insts = self._shard_insts(period, bucket)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            hits = scan_period(period, load_signal_cursors(conn, period), now_ts, rules, self.store, insts) \
+                if insts else []
+            if hits and not write_kline_signals(conn, hits, guard=lambda c: self.owns(c, period, bucket)):
+                print(f"{FAILED_COLOR}[分片] {self.owner} 已失去 {period}#{bucket} 的租约，丢弃本轮 {len(hits)} 条命中{RESET_COLOR}")
+                hits = []
+            ms = (time.time() - t0) * 1000
+            with conn:
+                conn.execute("UPDATE signal_shards SET last_scan_at=?, scan_ms=?, insts=?, hits=?, scans=scans+1 "
+                             "WHERE period=? AND bucket=? AND owner=?",
+                             (int(time.time()), round(ms, 1), len(insts), len(hits), period, bucket, self.owner))
+        finally:
+            conn.close()
+        return len(insts), len(hits), ms
+
+    def run_once(self):
+        shards = self.acquire()
+        rules = load_rules()
+        now_ts = int(time.time())
+        stats = []
+        for period, bucket in shards:
+            try:
+                stats.append((period, bucket) + self.scan(period, bucket, rules, now_ts))
+            except Exception as e:
+                print(f"{FAILED_COLOR}[分片] {self.owner} 扫描 {period}#{bucket} 异常: {e}{RESET_COLOR}")
+        return stats
+
+
+def run_worker(owner=None, stop=None):
+    """worker 进程入口：有新 K 线写入即扫一轮（至少间隔 GEN_MIN_GAP_SEC），否则按 GEN_SLEEP_SEC 兜底；
+    等待上限不超过租约的 1/3，保证按时续约"""
+    ensure_signal_pool_table()
+    w = ShardWorker(owner)
+    w.register()
+    sub = kline_subscription()
+    wait_sec = min(GEN_SLEEP_SEC, w.lease_sec / 3)
+    last_report, acc = time.time(), []
+    print(f"{OK_COLOR}[分片] worker {w.owner} 启动{RESET_COLOR}")
+    try:
+        while stop is None or not stop.is_set():
+            t0 = time.time()
+            try:
+                stats = w.run_once()
+            except sqlite3.Error as e:
+                print(f"{FAILED_COLOR}[分片] {w.owner} 认领分片失败，下一轮重试: {e}{RESET_COLOR}")
+                stats = []
+            acc += stats
+            hits = sum(s[3] for s in stats)
+            if hits or time.time() - last_report >= REPORT_SEC:
+                slow = max(acc, key=lambda s: s[4]) if acc else None
+                print(f"[分片] {w.owner} 分片 {len(stats)} 个 | 本轮命中 {hits} | 本轮耗时 {(time.time() - t0) * 1000:.0f}ms"
+                      + (f" | 最慢 {slow[0]}#{slow[1]} {slow[4]:.0f}ms（{slow[2]} 个 instId）" if slow else ""))
+                last_report, acc = time.time(), []
+            time.sleep(max(0.0, GEN_MIN_GAP_SEC - (time.time() - t0)))
+            deadline = time.time() + wait_sec
+            while (stop is None or not stop.is_set()) and time.time() < deadline:
+                if sub.wait(min(1.0, deadline - time.time())):
+                    break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        w.release()
+
+
+def print_status(db_path=SIGNAL_POOL_DB):
+    now = int(time.time())
+    conn = sqlite3.connect(str(db_path), timeout=30)
+    try:
+        workers = conn.execute("SELECT owner, heartbeat FROM signal_workers ORDER BY owner").fetchall()
+        rows = conn.execute("SELECT period, bucket, owner, lease_until, last_scan_at, scan_ms, insts, hits, scans "
+                            "FROM signal_shards ORDER BY period, bucket").fetchall()
+    finally:
+        conn.close()
+    print(f"worker {len(workers)} 个：" + "，".join(f"{o}（心跳 {now - (hb or 0)}s 前）" for o, hb in workers))
+    print(f"{'周期':<5}{'桶':>3}  {'owner':<28}{'租约剩余':>8}{'上次扫描':>9}{'耗时ms':>9}{'instId':>8}{'命中':>6}{'次数':>8}")
+    for period, bucket, owner, lease, last, ms, insts, hits, scans in rows:
+        alive = lease and lease >= now
+        print(f"{period:<5}{bucket:>3}  {(owner if alive else '-') or '-':<28}{(lease - now) if alive else 0:>8}"
+              f"{(str(now - last) + 's') if last else '-':>9}{ms if ms is not None else '-':>9}"
+              f"{insts if insts is not None else '-':>8}{hits if hits is not None else '-':>6}{scans or 0:>8}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="K 线信号分片扫描（多进程 / 多机）")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="本机 worker 进程数")
+    ap.add_argument("--status", action="store_true", help="只打印分片状态")
+    args = ap.parse_args()
+
+    ensure_signal_pool_table()
+    ensure_shard_tables()
+    if args.status:
+        print_status()
+        return
+    print(f"=== 分片信号生成器 启动：{len(PERIODS)} 个周期 × {SHARD_BUCKETS} 桶，本机 worker {args.workers} 个 ===")
+    mark_cold_start_signals()
+    stop = mp.Event()
+    host = socket.gethostname()
+    procs = {}
+
+    def spawn(k):
+        p = mp.Process(target=run_worker, args=(None, stop), name=f"signal-shard-{k}", daemon=False)
+        p.start()
+        procs[k] = p
+
+    for k in range(args.workers):
+        spawn(k)
+    last_health = 0
+    try:
+        while True:
+            time.sleep(5)
+            for k, p in list(procs.items()):
+                if not p.is_alive():
+                    print(f"{FAILED_COLOR}[分片] {host}:{p.pid} 退出（code={p.exitcode}），重新拉起；"
+                          f"它的分片租约到期后由其它 worker 接手{RESET_COLOR}")
+                    spawn(k)
+            if time.time() - last_health >= HEALTH_CHECK_SEC:
+                signal_health_check()
+                last_health = time.time()
+    except KeyboardInterrupt:
+        print("[分片] 收到退出信号，等待 worker 释放分片 ...")
+    finally:
+        stop.set()
+        for p in procs.values():
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+# tests/conftest.py
+"""pytest 公共设置：仓库根目录加入 sys.path；OKX 密钥给占位值，core.okx_trader 可直接 import（测试不连交易所）"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import utils.config as _config  # noqa: E402
+
+for _k in ("OKX_API_KEY", "OKX_SECRET_KEY", "OKX_PASSPHRASE"):
+    if not getattr(_config, _k, None):
+        setattr(_config, _k, "test")
@@ -0,0 +1,42 @@
+# tests/test_backtest.py
+import numpy as np
+
+from strategy import backtest as bt
+from strategy import signal_rules as sr
+from utils.kline_store import KlineArrays
+
+T0 = 1_700_002_800          # 整点
+
+
+def _bars(ts, close):
+    close = np.asarray(close, dtype=np.float64)
+    return KlineArrays(np.asarray(ts, dtype=np.int64), close, close, close, close, np.ones(len(close)))
+
+
+def _hourly(k1m):
+    """1m -> 1H，收盘取每小时最后一根"""
+    hours = np.unique(k1m.ts // 3600 * 3600)
+    close = [k1m.close[k1m.ts // 3600 * 3600 == h][-1] for h in hours]
+    return _bars(hours, close)
+
+
+def test_tf_rule_cannot_see_future_close():
+    # 第 0 小时前 59 分钟收盘 100，第 59 分钟涨到 200 → 该小时 1H 收盘价 200
+    close = np.full(180, 100.0)
+    close[59] = 200.0
+    k = _bars(T0 + 60 * np.arange(180), close)
+    h = _hourly(k)
+    rule = sr.Rule({"name": "HTF_UP", "when": 'tf("1H", close > 150)'})
+    ent = bt.entries_from_rules([rule], k, "1m", int(k.ts[0]), lambda tf, since: h)
+    # 第 59 分钟收盘时该 1H 才收盘，之前的分钟线不能用到它的收盘价
+    assert len(ent) and ent.idx[0] == 59
+    assert list(ent.idx) == list(range(59, 119))
+
+
+def test_evaluate_without_period_keeps_asof_alignment():
+    # 实盘（不传 period）仍按开盘 ts 对齐，读到的是当时正在走的高周期 K 线
+    k = _bars(T0 + 60 * np.arange(60), np.full(60, 100.0))
+    h = _bars([T0], [200.0])
+    rule = sr.Rule({"name": "HTF_UP", "when": 'tf("1H", close > 150)'})
+    _, masks = sr.evaluate([rule], sr.build_panel({"_": k}, 60)[1], lambda tf: sr.build_panel({"_": h}, 1)[1])
+    assert masks[0][1][0].all()
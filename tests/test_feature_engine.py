@@ -0,0 +1,34 @@
+# tests/test_feature_engine.py
+import sqlite3
+
+import pytest
+
+from collectors import feature_engine as fe
+from collectors.indicator_state import IndicatorState
+
+
+def _rows(start, n):
+    return [(start + 60 * i, 101.0 + i % 7, 99.0 - i % 5, 100.0 + (i % 11) * 0.1) for i in range(n)]
+
+
+def test_failed_upsert_does_not_checkpoint_advanced_state(monkeypatch, tmp_path):
+    st = IndicatorState()
+    for row in _rows(0, 60):
+        st.update(*row)
+    states = {"A": st}
+    new_rows = _rows(60 * 60, 5)
+    monkeypatch.setattr(fe, "fetch_kline_since", lambda db, table, inst, after: [r for r in new_rows if r[0] > after])
+    monkeypatch.setattr(fe, "ensure_feature_table", lambda db, table: None)
+
+    def locked(*a):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(fe, "upsert_feature_rows", locked)
+    with pytest.raises(sqlite3.OperationalError):
+        fe.update_features_incremental(tmp_path, "kline_1m", tmp_path, "features_1m", "A", states)
+    assert states["A"] is st and st.ts == 59 * 60
+
+    written = []
+    monkeypatch.setattr(fe, "upsert_feature_rows", lambda db, table, inst, items: written.extend(items) or len(items))
+    assert fe.update_features_incremental(tmp_path, "kline_1m", tmp_path, "features_1m", "A", states) == 5
+    assert [ts for ts, _ in written] == [r[0] for r in new_rows]
+    assert states["A"].ts == new_rows[-2][0]            # 最后一根未收盘，只预览不推进
@@ -0,0 +1,31 @@
+# tests/test_micro_signals.py
+import json
+import sqlite3
+
+from strategy import backtest as bt
+from strategy import micro_signals as ms
+from strategy import signal_generator as sg
+from utils.db_writer import flush_all
+
+
+def test_sides_match_backtest():
+    # 实盘方向必须和回测 side_of 一致，否则 WHALE_BUY 之类会被做成空单
+    assert set(ms.SIDES) == set(ms.SCORES)
+    for sig, side in ms.SIDES.items():
+        assert bt.side_of(sig) == (1 if side == "buy" else -1), sig
+
+
+def test_write_carries_side(tmp_path, monkeypatch):
+    path = str(tmp_path / "signals.db")
+    monkeypatch.setattr(sg, "SIGNAL_POOL_DB", path)
+    det = ms.MicroDetector(db_path=path)
+    det._write([("BTC-USDT-SWAP", sig, 1760000000, 100.0, {"x": 1}) for sig in ms.SCORES])
+    flush_all()
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT signal_type, params, meta FROM signals").fetchall()
+    conn.close()
+    assert len(rows) == len(ms.SCORES)
+    for sig, params, meta in rows:
+        assert json.loads(params) == {"x": 1, "side": ms.SIDES[sig]}
+        # zero_engine 从 meta 取 side
+        assert json.loads(meta)["side"] == ms.SIDES[sig]
@@ -0,0 +1,189 @@
+# tests/test_order_tracker.py
+"""OrderTracker 对本地回放服务（tools/ws_replay_server.py）+ 桩 trader"""
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from core import order_tracker
+from core.order_tracker import OrderTracker
+from tools.ws_replay_server import ReplayServer
+
+INST = "BTC-USDT-SWAP"
+NOOP = {"t": 0, "kind": "private", "msg": {"event": "noop"}}
+
+
+class StubClock:
+    def now_ms(self):
+        return int(time.time() * 1000)
+
+
+class StubTrader:
+    """OrderTracker 用到的 OKXTrader 接口；get_order 返回 rest_state 状态的订单"""
+
+    def __init__(self, rest_state="filled"):
+        self.clock = StubClock()
+        self.api_key, self.api_secret, self.passphrase = "k", "s", "p"
+        self.rest_state = rest_state
+        self.rest_calls = []
+        self.tracked, self.forgotten = [], []
+
+    def get_order(self, instId, ordId=None, clOrdId=None):
+        self.rest_calls.append((instId, ordId, clOrdId))
+        if self.rest_state is None:
+            raise ConnectionError("rest down")
+        return {"code": "0", "data": [{"instId": instId, "ordId": ordId or "900", "clOrdId": clOrdId or "",
+                                       "state": self.rest_state}]}
+
+    def get_fills(self, instType=None, instId=None, ordId=None):
+        return {"code": "0", "data": [{"ordId": ordId, "tradeId": "t1"}]}
+
+    def _track_open_order(self, instId, ordId):
+        self.tracked.append(ordId)
+
+    def _forget_open_orders(self, instId, ordIds):
+        self.forgotten += list(ordIds)
+
+
+def order_push(ordId, state, clOrdId="", t=0.0):
+    return {"t": t, "kind": "private",
+            "msg": {"arg": {"channel": "orders", "instType": "SWAP"},
+                    "data": [{"instId": INST, "ordId": ordId, "clOrdId": clOrdId, "state": state}]}}
+
+
+@pytest.fixture
+def replay():
+    servers = []
+
+    def start(frames, drop_after=0):
+        srv = ReplayServer(("127.0.0.1", 0), frames, speed=1.0, drop_after=drop_after)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        servers.append(srv)
+        return f"ws://127.0.0.1:{srv.server_address[1]}/ws/v5/private"
+
+    yield start
+    for srv in servers:
+        srv.shutdown()
+        srv.server_close()
+
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return cond()
+
+
+def test_orders_push_completes_watch(replay):
+    url = replay([NOOP, order_push("101", "filled", t=0.1)])
+    tr = OrderTracker(StubTrader(), url=url)
+    fut = tr.watch(INST, ordId="101")
+    tr.start()
+    try:
+        res = fut.result(timeout=5)
+    finally:
+        tr.stop()
+    assert res["state"] == "filled"
+    assert res["order"]["ordId"] == "101"
+    assert res["fills"] == {"code": "0", "data": []}
+    assert tr.stats["resolved_ws"] == 1 and tr.stats["resolved_rest"] == 0
+    assert tr.pending() == 0
+    assert tr.trader.forgotten == ["101"]
+
+
+def test_clordid_watch_is_rekeyed_to_ordid(replay):
+    url = replay([NOOP, order_push("202", "live", clOrdId="c202", t=0.1)])
+    tr = OrderTracker(StubTrader(), url=url)
+    fut = tr.watch(INST, clOrdId="c202")
+    tr.start()
+    try:
+        assert wait_for(lambda: "202" in tr.watchers)
+    finally:
+        tr.stop()
+    assert "cl:c202" not in tr.watchers
+    assert not fut.done()
+    assert tr.trader.tracked == ["202"]
+    # 终态推送只带 ordId 也能完成原来按 clOrdId 挂的 watch
+    tr._on_order({"instId": INST, "ordId": "202", "state": "filled"})
+    assert fut.result(timeout=1)["state"] == "filled"
+
+
+def test_reconnect_reconciles_pending_watches_over_rest(replay):
+    trader = StubTrader(rest_state="filled")
+    url = replay([NOOP], drop_after=1)                  # 每个连接发一条就断
+    tr = OrderTracker(trader, url=url)
+    fut = tr.watch(INST, ordId="303", timeout=60)
+    tr.ws.start()                                       # 不起兜底线程：只有重连后的对账会走 REST
+    try:
+        res = fut.result(timeout=10)
+    finally:
+        tr.stop()
+    assert tr.ws.stats["connects"] >= 2
+    assert trader.rest_calls and trader.rest_calls[0] == (INST, "303", None)
+    assert res["state"] == "filled" and res["order"]["ordId"] == "303"
+    assert tr.stats["resolved_rest"] == 1
+    assert tr.pending() == 0
+
+
+@pytest.mark.parametrize("rest_state", ["live", None])
+def test_timeout_result_shape(rest_state):
+    tr = OrderTracker(StubTrader(rest_state=rest_state), url="ws://127.0.0.1:9/unused")
+    fut = tr.watch(INST, ordId="404", timeout=0)
+    tr._reconcile()
+    res = fut.result(timeout=1)
+    assert set(res) == {"state", "order", "fills"}
+    if rest_state is None:
+        assert res == {"state": "unknown", "order": None, "fills": None}
+    else:
+        assert res["state"] == "live" and res["order"]["ordId"] == "404"
+        assert res["fills"]["data"][0]["ordId"] == "404"
+    assert tr.pending() == 0
+    assert tr.stats["resolved_rest"] == 1
+
+
+class SlowFuture(Future):
+    """done() 查完后停一下，放大“两个线程都看到未完成再去 set_result”的窗口"""
+
+    def done(self):
+        d = super().done()
+        time.sleep(0.002)
+        return d
+
+
+def test_ws_and_sweeper_resolving_same_future_race(monkeypatch):
+    monkeypatch.setattr(order_tracker, "Future", SlowFuture)
+    tr = OrderTracker(StubTrader(rest_state="filled"), url="ws://127.0.0.1:9/unused")
+    errors, futs = [], []
+    for i in range(50):
+        ordId = str(1000 + i)
+        fut = tr.watch(INST, ordId=ordId, timeout=60)
+        futs.append(fut)
+        gate = threading.Barrier(2)
+
+        def ws_thread():
+            gate.wait()
+            try:
+                tr._on_order({"instId": INST, "ordId": ordId, "state": "filled"})
+            except Exception as e:
+                errors.append(e)
+
+        def sweeper_thread():
+            gate.wait()
+            try:
+                tr._reconcile(only_expired=False)
+            except Exception as e:
+                errors.append(e)
+
+        ths = [threading.Thread(target=ws_thread), threading.Thread(target=sweeper_thread)]
+        for t in ths:
+            t.start()
+        for t in ths:
+            t.join()
+    assert errors == []
+    assert all(f.done() and f.result()["state"] == "filled" for f in futs)
+    # 每个 Future 只计一次
+    assert tr.stats["resolved_ws"] + tr.stats["resolved_rest"] == len(futs)
+    assert tr.pending() == 0
@@ -0,0 +1,32 @@
+# tests/test_param_sweep.py
+import numpy as np
+
+from strategy import param_sweep as ps
+from utils.kline_store import KlineArrays
+
+T0 = 1_700_002_800          # 整点
+
+
+def _bars(ts, close):
+    close = np.asarray(close, dtype=np.float64)
+    return KlineArrays(np.asarray(ts, dtype=np.int64), close, close, close, close, np.ones(len(close)))
+
+
+def test_sweep_entries_use_closed_higher_timeframe_bars(monkeypatch):
+    close = np.full(180, 100.0)
+    close[59] = 200.0
+    k = _bars(T0 + 60 * np.arange(180), close)
+    h = _bars(T0 + 3600 * np.arange(3), [200.0, 100.0, 100.0])
+    cfg = {"rules": [{"name": "HTF_UP", "when": 'tf("1H", close > 150)'}]}
+    spec = ps.make_spec([], ["A"], [(T0, T0 + 180 * 60)], "1m", "rules", cfg, 10000, 0)
+    ps._init_worker(spec, {}, 1, None)
+    monkeypatch.setattr(ps, "_attach", lambda inst, bar: {"1m": k, "1H": h}[bar])
+    ent = ps._entries("A", 0, k, T0)
+    assert list(ent.idx) == list(range(59, 119))
+
+
+def test_sweep_id_depends_on_engine_version():
+    spec = ps.make_spec([], ["A"], [(T0, T0 + 60)], "1m", "rules", {"rules": []}, 10000, 0)
+    old = {k: v for k, v in spec.items() if k != "engine"}
+    assert spec["engine"] == ps.ENGINE_VERSION
+    assert ps.sweep_id_of(spec) != ps.sweep_id_of(old)
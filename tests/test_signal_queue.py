@@ -0,0 +1,89 @@
+# tests/test_signal_queue.py
+import sqlite3
+import time
+
+import pytest
+
+from core.dispatcher import SignalDispatcher
+from utils import signal_queue as sq
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "signals.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE signals (id INTEGER PRIMARY KEY AUTOINCREMENT, instId TEXT, interval TEXT, period TEXT,
+                    ts INTEGER, close REAL, vol REAL, signal_type TEXT, status TEXT, detected_at TEXT, meta TEXT,
+                    priority INTEGER DEFAULT 3, promotion_level INTEGER DEFAULT 0, expire_ts INTEGER DEFAULT 0)""")
+    conn.executemany("INSERT INTO signals (instId, period, ts, close, signal_type, status, expire_ts) VALUES (?,?,?,?,?,?,?)",
+                     [(f"I{i}-USDT-SWAP", "1m", 1000 + i, 1.0, "X_UP", "WAIT_LIVE", 0) for i in range(3)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _status(db, sid):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute("SELECT status, lease_owner FROM signals WHERE id=?", (sid,)).fetchone()
+    finally:
+        conn.close()
+
+
+def test_extend_lease_keeps_own_signals_from_being_reclaimed(db):
+    sigs = sq.claim("WAIT_LIVE", n=3, owner="me", lease_sec=-1, db_path=db)    # 租约已过期
+    assert len(sigs) == 3
+    sq.extend_lease([sigs[0]["id"]], owner="me", db_path=db, wait=True)
+    sq.extend_lease([sigs[1]["id"]], owner="other", db_path=db, wait=True)     # 不是自己的租约，不续
+    assert sq.reclaim_expired("WAIT_LIVE", db_path=db) == 2
+    assert _status(db, sigs[0]["id"]) == ("WAIT_LIVE_LEASED", "me")
+    assert _status(db, sigs[1]["id"])[0] == "WAIT_LIVE"
+    # 放回的可以被重新认领，续租中的不会
+    again = sq.claim("WAIT_LIVE", n=10, owner="me2", db_path=db)
+    assert sorted(s["id"] for s in again) == sorted(s["id"] for s in sigs[1:])
+
+
+def test_ack_many_wait_is_durable(db):
+    sig = sq.claim("WAIT_LIVE", n=1, owner="me", db_path=db)[0]
+    sq.ack_many([(sig["id"], "SENT")], db_path=db, wait=True)
+    assert _status(db, sig["id"]) == ("SENT", None)
+
+
+def test_dispatcher_pending_ids_cover_queued_and_in_flight():
+    gate = []
+    started = []
+
+    def handler(item):
+        started.append(item["id"])
+        while not gate:
+            time.sleep(0.01)
+
+    d = SignalDispatcher(handler, workers=1)
+    try:
+        for i in range(3):
+            d.submit({"id": i, "instId": "A"})
+        deadline = time.time() + 2
+        while not started and time.time() < deadline:
+            time.sleep(0.01)
+        assert sorted(d.pending_ids()) == [0, 1, 2]        # 0 在途，1、2 排队
+        assert d.depth() == 2
+        gate.append(True)
+        deadline = time.time() + 2
+        while d.pending_ids() and time.time() < deadline:
+            time.sleep(0.01)
+        assert d.pending_ids() == []
+    finally:
+        d.stop()
+
+
+def test_owner_scoped_ack_leaves_reclaimed_signals_alone(db):
+    now = int(time.time())
+    sig = sq.claim("WAIT_LIVE", n=1, owner="me", lease_sec=-1, db_path=db)[0]
+    assert sig["lease_until"] < now
+    sq.reclaim_expired("WAIT_LIVE", db_path=db)
+    again = sq.claim("WAIT_LIVE", n=1, owner="other", db_path=db)[0]
+    assert again["id"] == sig["id"] and again["lease_until"] >= now
+    sq.ack_many([(sig["id"], "EXPIRED")], db_path=db, wait=True, owner="me")     # 租约已不是自己的
+    assert _status(db, sig["id"]) == ("WAIT_LIVE_LEASED", "other")
+    sq.ack_many([(sig["id"], "DONE")], db_path=db, wait=True, owner="other")
+    assert _status(db, sig["id"]) == ("DONE", None)
@@ -0,0 +1,72 @@
+# tests/test_signal_rules.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from strategy import signal_rules as sr
+from strategy.signal_generator import simple_ma, simple_rsi
+
+
+def _panel(rows, w=60, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, (rows, w)), axis=1)
+    close[1, :10] = np.nan            # 第二行左侧没有数据（新币）
+    return {"ts": np.tile(np.arange(w, dtype=np.int64) * 60, (rows, 1)), "close": close,
+            "high": close + rng.uniform(0, 1, close.shape), "low": close - 1, "open": close, "vol": close * 0 + 1}
+
+
+def _eval(src, panel):
+    expr, _ = sr.compile_expr(src)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.broadcast_to(expr(sr.PanelContext(panel)), panel["ts"].shape)
+
+
+@pytest.mark.parametrize("src", [
+    "close.real > 1",                 # 属性访问
+    "__import__('os')",               # 未知函数
+    "foo > 1",                        # 未知名称
+    "close > 'a'",                    # 字符串常量
+    "close > True",                   # 布尔常量
+    "ma(close, n=5) > 1",             # 关键字参数
+    "ma(close, 0) > 1",               # 窗口 < 1
+    "ma(close, 2.5) > 1",             # 窗口不是整数
+    "ma(close, ma5) > 1",             # 窗口不是常量
+    "ma(close) > 1",                  # 参数个数
+    "ma(5, 3) > 1",                   # 序列参数是常量
+    "tf('1H', tf('4H', close > 1))",  # tf 嵌套
+    "tf('7m', close > 1)",            # 未知周期
+    "close ** 2 > 1",                 # 不支持的运算
+    "close if close else 1",          # 不支持的语法
+    "[close][0] > 1",
+    "close >",                        # 语法错误
+])
+def test_compile_rejects(src):
+    with pytest.raises(ValueError):
+        sr.compile_expr(src)
+
+
+@pytest.mark.parametrize("n", [1, 5, 14])
+def test_ma_rsi_match_simple(n):
+    panel = _panel(3)
+    ma, rsi = _eval(f"ma(close, {n})", panel), _eval(f"rsi(close, {n})", panel)
+    for r in range(3):
+        row = panel["close"][r]
+        first = int(np.argmax(~np.isnan(row)))
+        for c in range(panel["ts"].shape[1]):
+            s = row[first:c + 1]
+            want_ma = simple_ma(s, n) if c >= first else None
+            want_rsi = simple_rsi(s, n) if c >= first else None
+            # 窗口未满 -> NaN
+            assert np.isnan(ma[r, c]) if want_ma is None else ma[r, c] == pytest.approx(want_ma)
+            assert np.isnan(rsi[r, c]) if want_rsi is None else rsi[r, c] == pytest.approx(want_rsi)
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 7, 16, 20])
+def test_highest_lowest_match_pandas(n):
+    panel = _panel(3)
+    hi, lo = _eval(f"highest{n}", panel), _eval(f"lowest(low, {n})", panel)
+    for r in range(3):
+        want_hi = pd.Series(panel["high"][r]).rolling(n).max().to_numpy()
+        want_lo = pd.Series(panel["low"][r]).rolling(n).min().to_numpy()
+        np.testing.assert_allclose(hi[r], want_hi, equal_nan=True)
+        np.testing.assert_allclose(lo[r], want_lo, equal_nan=True)
@@ -0,0 +1,63 @@
+# tests/test_signal_shards.py
+import sqlite3
+
+import pytest
+
+from strategy import signal_generator as sg
+from strategy import signal_shards as ss
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = str(tmp_path / "signals.db")
+    monkeypatch.setattr(sg, "SIGNAL_POOL_DB", path)
+    sg.ensure_signal_pool_table()
+    ss.ensure_shard_tables(path, buckets=1, periods=["1m"])
+    return path
+
+
+def _hit(ts):
+    return ("BTC-USDT-SWAP", "1m", ts, 100.0, "X_UP", {}, 7.0)
+
+
+def _rows(db, sql):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_stalled_worker_drops_hits_after_losing_lease(db, monkeypatch):
+    a = ss.ShardWorker("host:1", db_path=db, lease_sec=60)
+    b = ss.ShardWorker("host:2", db_path=db, lease_sec=60)
+    a.register()
+    assert a.acquire() == [("1m", 0)]
+    # a 卡住超过租约，b 接手并写到 ts=2000
+    conn = sqlite3.connect(db)
+    conn.execute("UPDATE signal_shards SET lease_until=1")
+    conn.commit()
+    conn.close()
+    b.register()
+    assert b.acquire() == [("1m", 0)]
+    monkeypatch.setattr(ss.ShardWorker, "_shard_insts", lambda self, period, bucket: ["BTC-USDT-SWAP"])
+    monkeypatch.setattr(ss, "scan_period", lambda *a, **kw: [_hit(2000)])
+    assert b.scan("1m", 0, [], 0)[1] == 1
+    # a 醒来，拿着旧的命中（更早的 ts）写库：整批丢弃，游标不后退
+    monkeypatch.setattr(ss, "scan_period", lambda *a, **kw: [_hit(1000)])
+    assert a.scan("1m", 0, [], 0)[1] == 0
+    assert _rows(db, "SELECT ts FROM signals") == [(2000,)]
+    assert _rows(db, "SELECT last_ts FROM signal_cursor") == [(2000,)]
+    assert _rows(db, "SELECT owner, scans FROM signal_shards") == [("host:2", 1)]
+
+
+def test_cursor_never_moves_backward(db):
+    conn = sqlite3.connect(db)
+    try:
+        assert sg.write_kline_signals(conn, [_hit(2000)])
+        assert sg.write_kline_signals(conn, [_hit(1000)])
+        assert not sg.write_kline_signals(conn, [_hit(3000)], guard=lambda c: False)
+    finally:
+        conn.close()
+    assert _rows(db, "SELECT last_ts FROM signal_cursor") == [(2000,)]
+    assert sorted(_rows(db, "SELECT ts FROM signals")) == [(1000,), (2000,)]
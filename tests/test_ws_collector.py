@@ -0,0 +1,80 @@
+# tests/test_ws_collector.py
+"""WsCollector 对本地回放服务：每个连接发 2 条就断、断线期间丢 1 条 → 重连重订阅 + 缺口补采"""
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from collectors import super_collector as sc
+from collectors import ws_collector as wsc
+from tools.ws_replay_server import ReplayServer, load_frames
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "ws_frames.jsonl")
+INST = "BTC-USDT-SWAP"
+T0 = 1_760_000_040
+
+
+class StubTrader:
+    def __init__(self):
+        self.kline_calls, self.trade_calls = [], []
+
+    def get_kline_range(self, instId, bar="1m", start_ts=None, end_ts=None, limit_per_page=300, **kw):
+        self.kline_calls.append((instId, bar, start_ts, end_ts))
+        return [(ts, 90.0, 91.0, 89.0, 90.5, 5.0) for ts in range(start_ts, end_ts + 1, 60)]
+
+    def get_trades(self, instId, limit=100):
+        self.trade_calls.append(instId)
+        return [{"instId": instId, "tradeId": "102", "px": "100.5", "sz": "1", "side": "sell", "ts": str((T0 + 2) * 1000)}]
+
+    def get_orderbook(self, instId):
+        return None
+
+
+@pytest.fixture
+def collector(tmp_path, monkeypatch):
+    monkeypatch.setattr(sc, "DB_DIR", str(tmp_path))
+    monkeypatch.setattr(wsc, "MICRO_ENABLED", False)
+    sc.ensure_all_tables()
+    srv = ReplayServer(("127.0.0.1", 0), load_frames(FIXTURE), speed=1.0, drop_after=2, drop_lose=1)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    base = f"ws://127.0.0.1:{srv.server_address[1]}/ws/v5"
+    wc = wsc.WsCollector(StubTrader(), [INST], bars=["1m"], public_url=f"{base}/public", business_url=f"{base}/business")
+    yield wc, str(tmp_path)
+    srv.shutdown()
+    srv.server_close()
+
+
+def _rows(db, sql):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_reconnect_gap_backfill_and_storage(collector):
+    wc, db_dir = collector
+    wc.start()
+    try:
+        deadline = time.time() + 15
+        while time.time() < deadline and not (wc.stats["gap_candle"] and wc.stats["gap_trades"]
+                                               and wc.stats["backfill_rows"] >= 2):
+            time.sleep(0.05)
+    finally:
+        wc.stop()                     # 等补采线程结束并 flush 批量写
+    # 断线重连后重新订阅，才能收到第二个连接回放的推送
+    assert wc.business.stats["connects"] >= 2 and wc.public.stats["connects"] >= 2
+    assert wc.stats["candle"] == 3 and wc.stats["trades"] == 3
+    # K 线：T0+120 在断线期间丢失 → 下一根 T0+180 触发补采这一根
+    assert wc.stats["gap_candle"] == 1
+    assert wc.trader.kline_calls == [(INST, "1m", T0 + 120, T0 + 120)]
+    kdb = os.path.join(db_dir, "kline_1m.db")
+    assert _rows(kdb, "SELECT ts, close FROM kline_1m ORDER BY ts") == [
+        (T0, 100.5), (T0 + 60, 101.5), (T0 + 120, 90.5), (T0 + 180, 103.5)]
+    assert _rows(kdb, "SELECT instId, last_ts FROM kline_hwm") == [(INST, T0 + 180)]
+    # 成交：tradeId 102 丢失 → 103 触发补采
+    assert wc.stats["gap_trades"] == 1 and wc.trader.trade_calls == [INST]
+    assert _rows(os.path.join(db_dir, "trades.db"), "SELECT trade_id FROM trades ORDER BY trade_id") == [
+        ("100",), ("101",), ("102",), ("103",)]
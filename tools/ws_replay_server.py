@@ -0,0 +1,269 @@
+# tools/ws_replay_server.py
+"""
+本地 WebSocket 回放服务：把录制的 OKX 推送按原节奏重放，给 ws 采集器/订单跟踪做联调。
+
+录制文件为 JSONL，每行 {"t": 相对秒, "kind": "public|business|private", "msg": 原始推送}
+（collectors/ws_collector.py --record 生成）。
+
+- 只依赖标准库（手写 RFC6455 握手与帧编解码）
+- 客户端按 URL 路径区分 kind：/ws/v5/public、/ws/v5/business、/ws/v5/private
+- 应答 subscribe / login / "ping"，只回放客户端已订阅频道的消息
+- --drop-after N：每个连接发完 N 条后主动断开，重连后从断开处接着回放，用于测试重连与缺口补采；
+  --drop-lose M 再跳过 M 条，模拟断线期间客户端错过的推送
+
+用法：
+  python -m tools.ws_replay_server frames.jsonl --port 8765 --speed 5
+  OKX_WS_PUBLIC=ws://127.0.0.1:8765/ws/v5/public OKX_WS_BUSINESS=ws://127.0.0.1:8765/ws/v5/business \
+      python -m collectors.ws_collector
+"""
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import struct
+import hashlib
+import argparse
+import threading
+import socketserver
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def load_frames(path):
+    frames = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                frames.append(json.loads(line))
+            except Exception:
+                pass
+    frames.sort(key=lambda x: float(x.get("t", 0)))
+    return frames
+
+
+def _recv_exact(sock, n):
+    buf = b""
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("client closed")
+        buf += chunk
+    return buf
+
+
+def recv_frame(sock):
+    """返回 (opcode, payload bytes)"""
+    b1, b2 = _recv_exact(sock, 2)
+    opcode = b1 & 0x0F
+    masked = b2 & 0x80
+    ln = b2 & 0x7F
+    if ln == 126:
+        ln = struct.unpack(">H", _recv_exact(sock, 2))[0]
+    elif ln == 127:
+        ln = struct.unpack(">Q", _recv_exact(sock, 8))[0]
+    mask = _recv_exact(sock, 4) if masked else b"\x00\x00\x00\x00"
+    data = bytearray(_recv_exact(sock, ln))
+    for i in range(ln):
+        data[i] ^= mask[i % 4]
+    return opcode, bytes(data)
+
+
+def send_frame(sock, payload, opcode=0x1):
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    ln = len(payload)
+    if ln < 126:
+        header = struct.pack(">BB", 0x80 | opcode, ln)
+    elif ln < (1 << 16):
+        header = struct.pack(">BBH", 0x80 | opcode, 126, ln)
+    else:
+        header = struct.pack(">BBQ", 0x80 | opcode, 127, ln)
+    sock.sendall(header + payload)
+
+
+def _arg_key(arg):
+    return (arg.get("channel"), arg.get("instId"), arg.get("instType"))
+
+
+class ReplayHandler(socketserver.BaseRequestHandler):
+    def handshake(self):
+        data = b""
+        while b"\r\n\r\n" not in data:
+            chunk = self.request.recv(4096)
+            if not chunk:
+                raise ConnectionError("client closed during handshake")
+            data += chunk
+        head = data.decode("latin-1").split("\r\n")
+        path = head[0].split(" ")[1] if len(head[0].split(" ")) > 1 else "/"
+        headers = {}
+        for line in head[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        accept = base64.b64encode(hashlib.sha1((headers.get("sec-websocket-key", "") + GUID).encode()).digest()).decode()
+        self.request.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode())
+        return path
+
+    def handle(self):
+        srv = self.server
+        try:
+            path = self.handshake()
+        except Exception:
+            return
+        kind = path.rstrip("/").split("/")[-1] or "public"
+        subs = set()
+        sub_event = threading.Event()
+        closed = threading.Event()
+        send_lock = threading.Lock()
+
+        def send(text):
+            with send_lock:
+                send_frame(self.request, text)
+
+        def reader():
+            try:
+                while not closed.is_set():
+                    op, payload = recv_frame(self.request)
+                    if op == 0x8:
+                        break
+                    if op == 0x9:
+                        with send_lock:
+                            send_frame(self.request, payload, opcode=0xA)
+                        continue
+                    text = payload.decode("utf-8", "ignore")
+                    if text == "ping":
+                        send("pong")
+                        continue
+                    try:
+                        msg = json.loads(text)
+                    except Exception:
+                        continue
+                    if msg.get("op") == "login":
+                        send(json.dumps({"event": "login", "code": "0", "msg": ""}))
+                    elif msg.get("op") == "subscribe":
+                        for a in msg.get("args") or []:
+                            subs.add(_arg_key(a))
+                            send(json.dumps({"event": "subscribe", "arg": a}))
+                        sub_event.set()
+                    elif msg.get("op") in ("order", "batch-orders", "cancel-order"):
+                        send(json.dumps({"id": msg.get("id"), "op": msg.get("op"), "code": "0", "data": []}))
+            except Exception:
+                pass
+            finally:
+                closed.set()
+
+        threading.Thread(target=reader, daemon=True).start()
+        sub_event.wait(5)
+
+        def wanted(arg):
+            k = _arg_key(arg)
+            return (k in subs
+                    or (k[0], k[1], None) in subs
+                    or (k[0], None, k[2]) in subs
+                    or (k[0], None, None) in subs)
+
+        frames = [fr for fr in srv.frames if fr.get("kind", "public") == kind]
+        pos = srv.resume_at(kind)
+        sent = 0
+        try:
+            while not closed.is_set():
+                prev_t = None
+                for i in range(pos, len(frames)):
+                    fr = frames[i]
+                    if closed.is_set():
+                        break
+                    msg = fr.get("msg") or {}
+                    if isinstance(msg, dict) and "arg" in msg and not wanted(msg["arg"]):
+                        continue
+                    t = float(fr.get("t", 0))
+                    if prev_t is not None and t > prev_t:
+                        time.sleep((t - prev_t) / srv.speed)
+                    prev_t = t
+                    send(msg if isinstance(msg, str) else json.dumps(msg, separators=(',', ':')))
+                    sent += 1
+                    if srv.drop_after and sent >= srv.drop_after:
+                        srv.dropped_at(kind, i + 1)
+                        print(f"[replay] {kind} 已发送 {sent} 条，模拟断线")
+                        return
+                if not srv.loop:
+                    break
+                pos = 0
+            # 回放结束后保持连接，直到客户端断开
+            while not closed.is_set():
+                time.sleep(0.2)
+        except Exception:
+            pass
+        finally:
+            closed.set()
+            try:
+                # 先 shutdown 才能让阻塞在 recv 的读线程和客户端立刻感知断开
+                self.request.shutdown(socket.SHUT_RDWR)
+                self.request.close()
+            except Exception:
+                pass
+
+
+class ReplayServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, addr, frames, speed=1.0, loop=False, drop_after=0, drop_lose=0):
+        super().__init__(addr, ReplayHandler)
+        self.frames = frames
+        self.speed = max(1e-6, float(speed))
+        self.loop = loop
+        self.drop_after = int(drop_after or 0)
+        self.drop_lose = int(drop_lose or 0)
+        self._resume = {}          # kind -> 下一个连接从第几帧开始（只在 drop_after 模式下使用）
+        self._resume_lock = threading.Lock()
+
+    def resume_at(self, kind):
+        with self._resume_lock:
+            return self._resume.get(kind, 0) if self.drop_after else 0
+
+    def dropped_at(self, kind, pos):
+        with self._resume_lock:
+            self._resume[kind] = pos + self.drop_lose
+
+
+def serve(path, host="127.0.0.1", port=8765, speed=1.0, loop=False, drop_after=0, drop_lose=0):
+    """在后台线程启动回放服务，返回 server（server.shutdown() 关闭）"""
+    srv = ReplayServer((host, port), load_frames(path), speed=speed, loop=loop, drop_after=drop_after,
+                       drop_lose=drop_lose)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def main():
+    ap = argparse.ArgumentParser(description="OKX WebSocket 录制回放服务")
+    ap.add_argument("frames", help="录制文件 (JSONL)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--speed", type=float, default=1.0, help="回放倍速")
+    ap.add_argument("--loop", action="store_true", help="循环回放")
+    ap.add_argument("--drop-after", type=int, default=0, help="每个连接发送 N 条后断开，重连后接着回放")
+    ap.add_argument("--drop-lose", type=int, default=0, help="断线后跳过 M 条（模拟断线期间丢失的推送）")
+    args = ap.parse_args()
+    if not os.path.exists(args.frames):
+        print(f"[replay] 文件不存在: {args.frames}")
+        sys.exit(1)
+    srv = ReplayServer((args.host, args.port), load_frames(args.frames),
+                       speed=args.speed, loop=args.loop, drop_after=args.drop_after, drop_lose=args.drop_lose)
+    print(f"[replay] ws://{args.host}:{args.port}/ws/v5/{{public|business|private}}  帧数={len(srv.frames)}")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# utils/db_writer.py
+"""
+长连接批量写入器：每个 SQLite 库一个写线程 + 队列。
+
+- WAL + synchronous=NORMAL：读者（signal_generator 等）不再被写锁挡住
+- submit(sql, rows) 只是入队，写线程按 条数(batch_size) / 时间(flush_sec) 触发
+  一次 executemany + commit，把成千上万次 connect/fsync 合并成少数几次
+- flush() 阻塞到此前提交的数据全部落盘，用于"写完马上要读"的场景
+- 进程内按库路径共享：get_writer(path)
+
+可调环境变量：DBW_BATCH（默认 1000 行）、DBW_FLUSH_SEC（默认 0.5 秒）
+"""
+import os
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+
+BATCH_SIZE = int(os.environ.get("DBW_BATCH", "1000"))
+FLUSH_SEC = float(os.environ.get("DBW_FLUSH_SEC", "0.5"))
+
+FAILED_COLOR = '\033[91m'
+RESET_COLOR = '\033[0m'
+
+WRITER_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA cache_size=-32000;",
+    "PRAGMA busy_timeout=30000;",
+    "PRAGMA wal_autocheckpoint=2000;",
+)
+
+
+def connect_tuned(db_path, readonly=False):
+    """统一的连接调优；读连接也走 WAL，不会阻塞写线程"""
+    conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+    for p in WRITER_PRAGMAS:
+        if readonly and "journal_mode" in p:
+            continue
+        conn.execute(p)
+    return conn
+
+
+class _Flush:
+    __slots__ = ("event",)
+
+    def __init__(self):
+        self.event = threading.Event()
+
+
+_STOP = object()
+
+
+class BatchWriter:
+    def __init__(self, db_path, batch_size=BATCH_SIZE, flush_sec=FLUSH_SEC):
+        self.db_path = str(db_path)
+        self.batch_size = int(batch_size)
+        self.flush_sec = float(flush_sec)
+        self.q = queue.Queue()
+        self.rows_written = 0
+        self.commits = 0
+        self.errors = 0
+        self._thread = threading.Thread(target=self._loop, name=f"dbw-{os.path.basename(self.db_path)}", daemon=True)
+        self._thread.start()
+
+    # ---------- 生产者 ----------
+    def submit(self, sql, rows):
+        """rows: 参数元组列表；空列表直接忽略"""
+        if rows:
+            self.q.put((sql, list(rows)))
+
+    def flush(self, timeout=None):
+        f = _Flush()
+        self.q.put(f)
+        return f.event.wait(timeout)
+
+    def close(self):
+        if self._thread.is_alive():
+            self.q.put(_STOP)
+            self._thread.join(timeout=10)
+
+    # ---------- 写线程 ----------
+    def _write(self, conn, pending):
+        conn.execute("BEGIN")
+        for sql, rows in pending.items():
+            conn.execute("SAVEPOINT dbw")
+            try:
+                conn.executemany(sql, rows)
+                conn.execute("RELEASE dbw")
+                self.rows_written += len(rows)
+            except Exception:
+                # 批量失败时逐行定位坏数据，其余照常写入
+                conn.execute("ROLLBACK TO dbw")
+                conn.execute("RELEASE dbw")
+                ok = 0
+                for r in rows:
+                    try:
+                        conn.execute(sql, r)
+                        ok += 1
+                    except Exception as e2:
+                        self.errors += 1
+                        print(f"{FAILED_COLOR}[DBW][{os.path.basename(self.db_path)}] 写入异常: {e2} row={r}{RESET_COLOR}")
+                self.rows_written += ok
+        conn.execute("COMMIT")
+        self.commits += 1
+
+    def _loop(self):
+        conn = connect_tuned(self.db_path)
+        conn.isolation_level = None  # 事务由 _write 显式控制
+        pending = {}
+        n_pending = 0
+        first_ts = None
+        waiters = []
+        stop = False
+        while not stop:
+            timeout = None if first_ts is None else max(0.0, self.flush_sec - (time.monotonic() - first_ts))
+            try:
+                item = self.q.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                stop = True
+            elif isinstance(item, _Flush):
+                waiters.append(item)
+            elif item is not None:
+                sql, rows = item
+                pending.setdefault(sql, []).extend(rows)
+                n_pending += len(rows)
+                if first_ts is None:
+                    first_ts = time.monotonic()
+                # 队列里还有数据就先攒着，减少 commit 次数
+                if n_pending < self.batch_size and not self.q.empty():
+                    continue
+
+            due = first_ts is not None and (time.monotonic() - first_ts) >= self.flush_sec
+            if pending and (stop or waiters or due or n_pending >= self.batch_size):
+                try:
+                    self._write(conn, pending)
+                except Exception as e:
+                    self.errors += 1
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    print(f"{FAILED_COLOR}[DBW][{os.path.basename(self.db_path)}] 提交异常: {e}{RESET_COLOR}")
+                pending = {}
+                n_pending = 0
+                first_ts = None
+            for w in waiters:
+                w.event.set()
+            waiters = []
+        conn.close()
+
+
+_WRITERS = {}
+_WRITERS_LOCK = threading.Lock()
+
+
+def get_writer(db_path):
+    key = os.path.abspath(str(db_path))
+    with _WRITERS_LOCK:
+        w = _WRITERS.get(key)
+        if w is None:
+            w = BatchWriter(key)
+            _WRITERS[key] = w
+        return w
+
+
+def flush_all(timeout=None):
+    with _WRITERS_LOCK:
+        writers = list(_WRITERS.values())
+    for w in writers:
+        w.flush(timeout)
+
+
+def close_all():
+    with _WRITERS_LOCK:
+        writers = list(_WRITERS.values())
+        _WRITERS.clear()
+    for w in writers:
+        w.close()
+
+
+atexit.register(close_all)
@@ -0,0 +1,535 @@
+# utils/kline_store.py
+"""
+K 线统一读接口 KlineStore + 可选列式存储
+
+KlineStore（进程内共享：get_kline_store()）
+- get(instId, bar, start, end, limit) / latest(instId, bar, n) 一律返回 KlineArrays（numpy 数组，ts 为 int64 秒）
+- 后端：KLINE_STORE=sqlite（默认，kline_<bar>.db）或 columnar（下面的 memmap 列存）
+- SQLite 后端每个库一个只读连接池（KLINE_POOL_SIZE），不再每次查询 connect 一次
+- LRU 缓存每个 (instId, bar) 最近一段窗口，总行数上限 KLINE_CACHE_ROWS：
+    每次读先在该库的专用连接上查 PRAGMA data_version（微秒级），任何其它连接 / 进程提交过就视为脏；
+    本进程采集器写入（mirror_klines）还会精确标脏对应窗口
+    标脏的窗口下次读时只补查 ts >= 窗口最后一根 的增量并拼接（覆盖未收盘 K 线刷新）
+    更早位置的缺口补采由本进程写入时直接丢弃窗口；跨进程的补采靠 KLINE_CACHE_TTL 兜底过期
+- 返回的数组是只读的，调用方需要修改时自行 copy
+
+列式存储（分析链路用，可选）
+
+目录布局：DB_DIR/kline_cols/<bar>/<instId>/{ts.i8, open.f8, high.f8, low.f8, close.f8, vol.f8}
+- 每列一个裸二进制文件（小端 int64 / float64），按 ts 升序；采集器写 SQLite 的同时追加这里
+- 读取用 np.memmap，按 ts 二分定位区间后直接切片返回视图：不走 SQL，不产生逐行 Python 对象
+- 追加：新 ts 直接 append；与最后几根同 ts 的（未收盘 K 线刷新）原位覆盖；
+  更早的缺口补采走合并重写（少见路径）
+- 各列长度以最短的为准：进程在写到一半时崩溃也只会丢掉最后一根，不会读到错位数据
+- Windows 下被其它进程 memmap 着的文件不能替换，合并重写失败时跳过并告警；读方可传 copy=True
+
+开启：KLINE_COLUMNAR=1（采集器同步追加）；首次导入已有 SQLite 数据：
+  python -m utils.kline_store sync --bars 1m,5m
+"""
+import os
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from collections import namedtuple, OrderedDict
+
+import numpy as np
+
+from utils.config import DB_DIR
+
+COLUMNAR_ENABLED = os.environ.get("KLINE_COLUMNAR", "0") == "1"
+COLUMNAR_DIR = os.environ.get("KLINE_COLUMNAR_DIR") or os.path.join(str(DB_DIR), "kline_cols")
+STORE_BACKEND = os.environ.get("KLINE_STORE", "sqlite").strip().lower()
+POOL_SIZE = int(os.environ.get("KLINE_POOL_SIZE", "4"))
+CACHE_ROWS = int(os.environ.get("KLINE_CACHE_ROWS", "2000000"))     # 约 100MB
+CACHE_TTL = float(os.environ.get("KLINE_CACHE_TTL", "300"))
+
+COLUMNS = (("ts", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"), ("vol", "<f8"))
+ROW_BYTES = 8
+
+FAILED_COLOR = '\033[91m'
+RESET_COLOR = '\033[0m'
+
+KlineArrays = namedtuple("KlineArrays", [c for c, _ in COLUMNS])
+
+
+def _empty():
+    return KlineArrays(*(np.empty(0, dtype=dt) for _, dt in COLUMNS))
+
+
+class ColumnarKlineStore:
+    def __init__(self, root=COLUMNAR_DIR):
+        self.root = str(root)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _dir(self, instId, bar):
+        return os.path.join(self.root, bar, instId.replace("/", "_"))
+
+    def _lock(self, instId, bar):
+        with self._locks_guard:
+            return self._locks.setdefault((bar, instId), threading.Lock())
+
+    def _length(self, d):
+        try:
+            return min(os.path.getsize(os.path.join(d, f"{c}.{dt[1:]}")) for c, dt in COLUMNS) // ROW_BYTES
+        except OSError:
+            return 0
+
+    def _map(self, d, n):
+        return KlineArrays(*(np.memmap(os.path.join(d, f"{c}.{dt[1:]}"), dtype=dt, mode="r", shape=(n,))
+                             for c, dt in COLUMNS))
+
+    # ---------- 读 ----------
+    def get(self, instId, bar, start=None, end=None, limit=None, copy=False):
+        """[start, end] 闭区间（秒）；limit 取区间内最近 limit 根；返回 KlineArrays（默认是 memmap 视图）"""
+        d = self._dir(instId, bar)
+        n = self._length(d)
+        if n == 0:
+            return _empty()
+        cols = self._map(d, n)
+        lo = 0 if start is None else int(np.searchsorted(cols.ts, int(start), side="left"))
+        hi = n if end is None else int(np.searchsorted(cols.ts, int(end), side="right"))
+        if limit is not None:
+            lo = max(lo, hi - int(limit))
+        out = KlineArrays(*(c[lo:hi] for c in cols))
+        return KlineArrays(*(np.array(c) for c in out)) if copy else out
+
+    def latest(self, instId, bar, n, copy=False):
+        return self.get(instId, bar, limit=n, copy=copy)
+
+    def get_all(self, bar, start, insts=None):
+        return {i: k for i in (self.inst_ids(bar) if insts is None else insts)
+                for k in [self.get(i, bar, start=start)] if len(k.ts)}
+
+    def last_ts(self, instId, bar):
+        d = self._dir(instId, bar)
+        n = self._length(d)
+        return int(self._map(d, n).ts[-1]) if n else None
+
+    def inst_ids(self, bar):
+        try:
+            return sorted(os.listdir(os.path.join(self.root, bar)))
+        except FileNotFoundError:
+            return []
+
+    # ---------- 写 ----------
+    def append(self, instId, bar, rows, replace=False):
+        """rows: [(ts秒, open, high, low, close, vol)]；replace=True 覆盖已有同 ts 的 K 线"""
+        if not rows:
+            return 0
+        new = np.array(sorted((int(r[0]), *map(float, r[1:6])) for r in rows), dtype=float)
+        ts_new = new[:, 0].astype(np.int64)
+        d = self._dir(instId, bar)
+        with self._lock(instId, bar):
+            os.makedirs(d, exist_ok=True)
+            n = self._length(d)
+            last = int(self._map(d, n).ts[-1]) if n else None
+            if last is not None and ts_new[0] <= last:
+                old_ts = np.array(self._map(d, n).ts)
+                pos = np.searchsorted(old_ts, ts_new)
+                hit = (pos < n) & (old_ts[np.minimum(pos, n - 1)] == ts_new)
+                tail = ts_new > last
+                if not np.all(hit | tail):
+                    return self._merge(d, n, new, replace)
+                if replace and hit.any():
+                    self._overwrite(d, pos[hit], new[hit])
+                new, ts_new = new[tail], ts_new[tail]
+            if len(new):
+                self._write_tail(d, n, new, ts_new)
+            return len(new)
+
+    def _write_tail(self, d, n, new, ts_new):
+        # 先截掉上次崩溃留下的多余尾巴，保证各列从同一行号开始追加
+        for i, (c, dt) in enumerate(COLUMNS):
+            path = os.path.join(d, f"{c}.{dt[1:]}")
+            with open(path, "ab") as f:
+                if f.tell() != n * ROW_BYTES:
+                    f.truncate(n * ROW_BYTES)
+                f.write((ts_new if c == "ts" else new[:, i]).astype(dt).tobytes())
+
+    def _overwrite(self, d, positions, rows):
+        for i, (c, dt) in enumerate(COLUMNS):
+            if c == "ts":
+                continue
+            with open(os.path.join(d, f"{c}.{dt[1:]}"), "r+b") as f:
+                for p, v in zip(positions, rows[:, i]):
+                    f.seek(int(p) * ROW_BYTES)
+                    f.write(np.array([v], dtype=dt).tobytes())
+
+    def _merge(self, d, n, new, replace):
+        old = self._map(d, n)
+        old_rows = np.column_stack([np.asarray(c, dtype=float) for c in old]) if n else np.empty((0, len(COLUMNS)))
+        # 排在后面的优先：replace 时新数据覆盖旧数据，否则旧数据保留
+        both = np.vstack([old_rows, new] if replace else [new, old_rows])
+        ts = both[:, 0].astype(np.int64)
+        _, idx = np.unique(ts[::-1], return_index=True)
+        merged = both[::-1][idx]
+        try:
+            for i, (c, dt) in enumerate(COLUMNS):
+                path = os.path.join(d, f"{c}.{dt[1:]}")
+                col = merged[:, 0].astype(np.int64) if c == "ts" else merged[:, i]
+                with open(path + ".tmp", "wb") as f:
+                    f.write(col.astype(dt).tobytes())
+                os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"{FAILED_COLOR}[列存] {d} 合并重写失败（文件被占用?）: {e}{RESET_COLOR}")
+            return 0
+        return len(merged) - n
+
+    def rewrite(self, instId, bar, rows):
+        """整段覆盖（sync 导入用）"""
+        d = self._dir(instId, bar)
+        with self._lock(instId, bar):
+            os.makedirs(d, exist_ok=True)
+            for c, dt in COLUMNS:
+                path = os.path.join(d, f"{c}.{dt[1:]}")
+                if os.path.exists(path):
+                    os.remove(path)
+            return self.append(instId, bar, rows)
+
+
+def _to_arrays(rows):
+    if not rows:
+        return _empty()
+    a = np.array(rows, dtype=float)
+    return KlineArrays(a[:, 0].astype(np.int64), *(np.ascontiguousarray(a[:, i]) for i in range(1, 6)))
+
+
+class SqliteKlineBackend:
+    """kline_<bar>.db 只读连接池"""
+
+    def __init__(self, db_dir=DB_DIR, pool_size=POOL_SIZE):
+        self.db_dir = str(db_dir)
+        self.pool_size = max(1, int(pool_size))
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+        self._ver = {}            # bar -> [专用连接, 锁]
+
+    def db_path(self, bar):
+        return os.path.join(self.db_dir, f"kline_{bar}.db")
+
+    @contextmanager
+    def _conn(self, bar):
+        """池里有空闲连接就复用，没有且未到上限就新建，否则等别人归还"""
+        with self._pools_lock:
+            pool = self._pools.setdefault(bar, {"q": queue.Queue(), "n": 0})
+            create = pool["q"].empty() and pool["n"] < self.pool_size
+            if create:
+                pool["n"] += 1
+        if create:
+            try:
+                conn = self._open(bar)
+            except Exception:
+                with self._pools_lock:
+                    pool["n"] -= 1
+                raise
+        else:
+            conn = pool["q"].get()
+        try:
+            yield conn
+        finally:
+            pool["q"].put(conn)
+
+    def _open(self, bar):
+        conn = sqlite3.connect(f"file:{self.db_path(bar)}?mode=ro", uri=True, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA query_only=1")
+        return conn
+
+    def exists(self, bar):
+        return os.path.exists(self.db_path(bar))
+
+    def version(self, bar):
+        """该库的 data_version：同一连接上两次读数不同 ⇔ 期间有其它连接提交过"""
+        if not self.exists(bar):
+            return None
+        with self._pools_lock:
+            v = self._ver.get(bar)
+            if v is None:
+                v = self._ver[bar] = [self._open(bar), threading.Lock()]
+        with v[1]:
+            return v[0].execute("PRAGMA data_version").fetchone()[0]
+
+    def get(self, instId, bar, start=None, end=None, limit=None):
+        if not self.exists(bar):
+            return _empty()
+        sql = f"SELECT ts, open, high, low, close, vol FROM kline_{bar} WHERE instId=?"
+        params = [instId]
+        if start is not None:
+            sql += " AND ts>=?"; params.append(int(start))
+        if end is not None:
+            sql += " AND ts<=?"; params.append(int(end))
+        with self._conn(bar) as conn:
+            if limit is not None:
+                rows = conn.execute(sql + " ORDER BY ts DESC LIMIT ?", params + [int(limit)]).fetchall()
+                rows.reverse()
+            else:
+                rows = conn.execute(sql + " ORDER BY ts", params).fetchall()
+        return _to_arrays(rows)
+
+    @staticmethod
+    def _has_hwm(conn):
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='kline_hwm'").fetchone() \
+            and conn.execute("SELECT 1 FROM kline_hwm LIMIT 1").fetchone()
+
+    def inst_ids(self, bar):
+        """优先读 kline_hwm（采集器维护的 instId 清单，几百行），没有才对整张 K 线表 DISTINCT"""
+        if not self.exists(bar):
+            return []
+        with self._conn(bar) as conn:
+            if self._has_hwm(conn):
+                return [r[0] for r in conn.execute("SELECT instId FROM kline_hwm ORDER BY instId")]
+            return [r[0] for r in conn.execute(f"SELECT DISTINCT instId FROM kline_{bar}")]
+
+    def get_all(self, bar, start, insts=None):
+        """所有 instId（或 insts 指定的一部分）在 ts >= start 的 K 线；返回 {instId: KlineArrays}
+        有 kline_hwm（采集器维护的 instId 清单）时逐 instId 走主键 (instId, ts) 区间，避免整表扫描"""
+        if not self.exists(bar):
+            return {}
+        cols = "k.instId, k.ts, k.open, k.high, k.low, k.close, k.vol"
+        with self._conn(bar) as conn:
+            if insts is not None:
+                insts, rows = list(insts), []
+                for i in range(0, len(insts), 500):      # SQLite 参数个数上限
+                    chunk = insts[i:i + 500]
+                    rows += conn.execute(f"SELECT {cols} FROM kline_{bar} k WHERE k.instId IN "
+                                         f"({','.join('?' * len(chunk))}) AND k.ts >= ? ORDER BY k.instId, k.ts",
+                                         (*chunk, int(start))).fetchall()
+            elif self._has_hwm(conn):
+                rows = conn.execute(f"SELECT {cols} FROM kline_hwm h JOIN kline_{bar} k "
+                                    f"ON k.instId = h.instId AND k.ts >= ? ORDER BY k.instId, k.ts",
+                                    (int(start),)).fetchall()
+            else:
+                rows = conn.execute(f"SELECT {cols} FROM kline_{bar} k WHERE k.ts >= ? ORDER BY k.instId, k.ts",
+                                    (int(start),)).fetchall()
+        out, i = {}, 0
+        while i < len(rows):
+            j = i
+            while j < len(rows) and rows[j][0] == rows[i][0]:
+                j += 1
+            out[rows[i][0]] = _to_arrays([r[1:] for r in rows[i:j]])
+            i = j
+        return out
+
+
+class _Window:
+    __slots__ = ("arr", "full", "stale", "seq", "loaded_at")
+
+    def __init__(self, arr, full, seq):
+        self.arr = arr
+        self.full = full          # 窗口是否包含该 instId 全部历史
+        self.stale = False
+        self.seq = seq
+        self.loaded_at = time.time()
+
+
+def _readonly(arr):
+    for c in arr:
+        c.setflags(write=False)
+    return arr
+
+
+class KlineStore:
+    """统一读接口：get / latest 按 (instId, bar, start, end) 返回 KlineArrays，带最近窗口 LRU 缓存"""
+
+    def __init__(self, backend=None, cache_rows=CACHE_ROWS, ttl=CACHE_TTL):
+        self.backend = backend or (ColumnarKlineStore() if STORE_BACKEND == "columnar" else SqliteKlineBackend())
+        self.cache_rows = int(cache_rows)
+        self.ttl = float(ttl)
+        self._cache = OrderedDict()     # (instId, bar) -> _Window
+        self._rows = 0
+        self.lock = threading.Lock()
+        self.stats = {"hit": 0, "miss": 0, "refresh": 0, "evict": 0}
+        # 列存本身就是 memmap，不需要再缓存一层
+        self._cached = isinstance(self.backend, SqliteKlineBackend) and self.cache_rows > 0
+
+    # ---------- 写入感知 ----------
+    def _seq(self, bar):
+        return self.backend.version(bar)
+
+    # ---------- 读 ----------
+    def get(self, instId, bar, start=None, end=None, limit=None):
+        if not self._cached:
+            return self.backend.get(instId, bar, start=start, end=end, limit=limit)
+        w = self._window(instId, bar, start, limit)
+        if w is None:
+            return self.backend.get(instId, bar, start=start, end=end, limit=limit)
+        ts = w.arr.ts
+        lo = 0 if start is None else int(np.searchsorted(ts, int(start), side="left"))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, int(end), side="right"))
+        if limit is not None:
+            lo = max(lo, hi - int(limit))
+        if not w.full and limit is not None and hi - lo < int(limit) and start is None:
+            # 窗口不够长（end 太靠前）：直接走后端
+            return self.backend.get(instId, bar, start=start, end=end, limit=limit)
+        return KlineArrays(*(c[lo:hi] for c in w.arr))
+
+    def latest(self, instId, bar, n):
+        return self.get(instId, bar, limit=n)
+
+    def inst_ids(self, bar):
+        return self.backend.inst_ids(bar)
+
+    def get_all(self, bar, start, insts=None):
+        """全部 instId（或 insts 指定的一部分）自 start 起的 K 线（批量扫描用，不经过窗口缓存）"""
+        return self.backend.get_all(bar, start, insts)
+
+    def _window(self, instId, bar, start, limit):
+        """返回可服务本次查询的窗口（必要时加载 / 增量刷新），服务不了返回 None"""
+        key = (instId, bar)
+        seq = self._seq(bar)
+        with self.lock:
+            w = self._cache.get(key)
+            if w is not None and time.time() - w.loaded_at > self.ttl:
+                self._drop(key)
+                w = None
+            if w is not None:
+                self._cache.move_to_end(key)
+        if w is not None:
+            first = int(w.arr.ts[0]) if len(w.arr.ts) else None
+            covers = w.full or (start is not None and first is not None and int(start) >= first) or \
+                (start is None and limit is not None and len(w.arr.ts) >= int(limit))
+            if not covers:
+                w = None
+            elif w.stale or seq is None or seq != w.seq:
+                self._refresh(key, w, seq)
+                self.stats["refresh"] += 1
+                return w
+            else:
+                self.stats["hit"] += 1
+                return w
+        # 只缓存"最近一段"：按 start 或 limit 加载，缺省取全部历史
+        self.stats["miss"] += 1
+        if start is None and limit is None:
+            arr, full = self.backend.get(instId, bar), True
+        elif start is not None:
+            arr = self.backend.get(instId, bar, start=start)
+            full = False
+        else:
+            arr = self.backend.get(instId, bar, limit=limit)
+            full = len(arr.ts) < int(limit)
+        w = _Window(_readonly(arr), full, seq)
+        with self.lock:
+            self._drop(key)
+            self._cache[key] = w
+            self._rows += len(arr.ts)
+            while self._rows > self.cache_rows and len(self._cache) > 1:
+                old = next(iter(self._cache))
+                self._drop(old)
+                self.stats["evict"] += 1
+        return w
+
+    def _refresh(self, key, w, seq):
+        """补查窗口最后一根（可能未收盘）及之后的 K 线并拼接"""
+        instId, bar = key
+        arr = w.arr
+        last = int(arr.ts[-1]) if len(arr.ts) else None
+        tail = self.backend.get(instId, bar, start=last) if last is not None else self.backend.get(instId, bar)
+        if len(tail.ts):
+            keep = int(np.searchsorted(arr.ts, int(tail.ts[0]), side="left"))
+            merged = KlineArrays(*(np.concatenate([a[:keep], t]) for a, t in zip(arr, tail)))
+            with self.lock:
+                self._rows += len(merged.ts) - len(arr.ts)
+            w.arr = _readonly(merged)
+        w.stale = False
+        w.seq = seq
+
+    def _drop(self, key):
+        w = self._cache.pop(key, None)
+        if w is not None:
+            self._rows -= len(w.arr.ts)
+
+    # ---------- 写入通知 ----------
+    def invalidate(self, instId, bar, since_ts=None):
+        """本进程写入后调用：写入早于窗口最后一根（缺口补采）则丢弃窗口，否则标脏等下次增量刷新"""
+        with self.lock:
+            w = self._cache.get((instId, bar))
+            if w is None:
+                return
+            if since_ts is None or (len(w.arr.ts) and int(since_ts) < int(w.arr.ts[-1])):
+                self._drop((instId, bar))
+            else:
+                w.stale = True
+
+    def cache_info(self):
+        with self.lock:
+            return {"windows": len(self._cache), "rows": self._rows, **self.stats}
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_kline_store(db_dir=None):
+    """进程内共享；db_dir 只在 sqlite 后端下区分（测试 / 离线库）"""
+    key = os.path.abspath(str(db_dir or DB_DIR))
+    with _STORES_LOCK:
+        st = _STORES.get(key)
+        if st is None:
+            backend = None
+            if db_dir is not None and STORE_BACKEND != "columnar":
+                backend = SqliteKlineBackend(db_dir)
+            st = _STORES[key] = KlineStore(backend)
+        return st
+
+
+_COLUMNAR = None
+_COLUMNAR_LOCK = threading.Lock()
+
+
+def get_columnar_store():
+    global _COLUMNAR
+    with _COLUMNAR_LOCK:
+        if _COLUMNAR is None:
+            _COLUMNAR = ColumnarKlineStore()
+        return _COLUMNAR
+
+
+def mirror_klines(instId, bar, rows, replace=False):
+    """采集器写 K 线后调用：通知本进程的 KlineStore 缓存，开启列存时顺带追加；失败不影响主链路"""
+    if not rows:
+        return
+    since = min(int(r[0]) for r in rows)
+    for st in list(_STORES.values()):
+        st.invalidate(instId, bar, since_ts=since)
+    if not COLUMNAR_ENABLED:
+        return
+    try:
+        get_columnar_store().append(instId, bar, rows, replace=replace)
+    except Exception as e:
+        print(f"{FAILED_COLOR}[列存] {instId} {bar} 追加失败: {e}{RESET_COLOR}")
+
+
+def sync_from_sqlite(bar, inst_ids=None):
+    """把 kline_<bar>.db 整表导入列存（按 instId 整段覆盖），返回导入根数"""
+    path = os.path.join(str(DB_DIR), f"kline_{bar}.db")
+    if not os.path.exists(path):
+        return 0
+    store = get_columnar_store()
+    conn = sqlite3.connect(path)
+    total = 0
+    try:
+        if inst_ids is None:
+            inst_ids = [r[0] for r in conn.execute(f"SELECT DISTINCT instId FROM kline_{bar}")]
+        for inst in inst_ids:
+            rows = conn.execute(f"SELECT ts, open, high, low, close, vol FROM kline_{bar} "
+                                f"WHERE instId=? ORDER BY ts", (inst,)).fetchall()
+            total += store.rewrite(inst, bar, rows)
+    finally:
+        conn.close()
+    return total
+
+
+def main():
+    ap = argparse.ArgumentParser(description="K 线列存工具")
+    ap.add_argument("cmd", choices=["sync"])
+    ap.add_argument("--bars", default="1m,3m,5m,15m,1H,4H,1D")
+    args = ap.parse_args()
+    for bar in filter(None, args.bars.split(",")):
+        print(f"[列存] {bar} 导入 {sync_from_sqlite(bar)} 根")
+
+
+if __name__ == "__main__":
+    main()
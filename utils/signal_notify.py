@@ -0,0 +1,144 @@
+# utils/signal_notify.py
+"""
+信号库变更通知：消费者不再固定 sleep 轮询，写入一发生就被唤醒
+
+- 每个进程每个库一个监视线程，长连接上循环 PRAGMA data_version（只读 WAL 共享内存里的计数，
+  不碰数据页，20ms 一次几乎零开销）；其它连接（含其它进程）提交后计数变化即广播
+- 消费者 sub = subscribe(db)；sub.wait(timeout) 有新写入立即返回 True，超时返回 False，
+  调用方照旧去查库 —— 原来的轮询周期变成兜底超时
+- SIGNAL_NOTIFY=0 或监视线程起不来时 wait() 退化为 time.sleep(timeout)，行为与原轮询一致
+- LagStats：按阶段统计延迟 p50 / p99（K线收盘→下单、入库→下单 等）
+
+可调环境变量：SIGNAL_NOTIFY（默认 1）、SIGNAL_NOTIFY_POLL_MS（默认 20）
+"""
+import os
+import time
+import sqlite3
+import threading
+from collections import deque
+
+NOTIFY_ENABLED = os.environ.get("SIGNAL_NOTIFY", "1") != "0"
+NOTIFY_POLL_MS = float(os.environ.get("SIGNAL_NOTIFY_POLL_MS", "20"))
+LAG_WINDOW = 1000
+
+FAILED_COLOR = '\033[91m'
+RESET_COLOR = '\033[0m'
+
+
+class DbWatcher:
+    def __init__(self, db_path, poll_ms=NOTIFY_POLL_MS):
+        self.db_path = str(db_path)
+        self.poll = max(1.0, float(poll_ms)) / 1000.0
+        self.seq = 0                     # 观察到的变更次数
+        self.cond = threading.Condition()
+        self.alive = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="db-watch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            last = conn.execute("PRAGMA data_version").fetchone()[0]
+            self.alive = True
+            while not self._stop.wait(self.poll):
+                v = conn.execute("PRAGMA data_version").fetchone()[0]
+                if v != last:
+                    last = v
+                    with self.cond:
+                        self.seq += 1
+                        self.cond.notify_all()
+        except Exception as e:
+            print(f"{FAILED_COLOR}[变更通知] {self.db_path} 监视失败，退化为轮询: {e}{RESET_COLOR}")
+        finally:
+            self.alive = False
+            with self.cond:
+                self.cond.notify_all()
+            if conn is not None:
+                conn.close()
+
+
+class Subscription:
+    """每个消费者一份：记住自己看到的 seq，两次 wait 之间的变更不会漏"""
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+        self.seen = watcher.seq if watcher else 0
+
+    def wait(self, timeout):
+        w = self.watcher
+        if w is None or not w.alive:
+            time.sleep(timeout)
+            return False
+        deadline = time.time() + timeout
+        with w.cond:
+            while w.seq == self.seen and w.alive:
+                left = deadline - time.time()
+                if left <= 0:
+                    return False
+                w.cond.wait(left)
+            changed = w.seq != self.seen
+            self.seen = w.seq
+        return changed
+
+
+_WATCHERS = {}
+_WATCHERS_LOCK = threading.Lock()
+
+
+def get_watcher(db_path):
+    key = os.path.abspath(str(db_path))
+    with _WATCHERS_LOCK:
+        w = _WATCHERS.get(key)
+        if w is None:
+            w = _WATCHERS[key] = DbWatcher(db_path).start()
+        return w
+
+
+def subscribe(db_path):
+    """返回 Subscription；未启用通知时 wait() 就是 sleep"""
+    if not NOTIFY_ENABLED:
+        return Subscription(None)
+    w = get_watcher(db_path)
+    # 给监视线程一点时间读到初始 data_version，避免第一次 wait 直接退化成 sleep
+    for _ in range(50):
+        if w.alive or not w._thread.is_alive():
+            break
+        time.sleep(0.002)
+    return Subscription(w)
+
+
+def _pct(vals, q):
+    if not vals:
+        return None
+    vals = sorted(vals)
+    return round(vals[min(len(vals) - 1, int(len(vals) * q))], 1)
+
+
+class LagStats:
+    """stage -> 最近 LAG_WINDOW 个样本（毫秒）"""
+
+    def __init__(self, window=LAG_WINDOW):
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage, ms):
+        if ms is None or ms < 0:
+            return
+        with self.lock:
+            self.samples.setdefault(stage, deque(maxlen=self.window)).append(float(ms))
+
+    def stats(self):
+        with self.lock:
+            snap = {k: list(v) for k, v in self.samples.items()}
+        return {k: {"n": len(v), "p50": _pct(v, 0.5), "p99": _pct(v, 0.99)} for k, v in snap.items()}
@@ -0,0 +1,205 @@
+# utils/signal_queue.py
+"""
+signals.db 上的工作队列层
+
+- 复合索引 (status, priority, promotion_level DESC, ts) / (status, ts)：
+  按状态取待处理信号只走索引前缀，表涨到百万行轮询成本也不变
+- claim(status, n)：一条 UPDATE ... RETURNING 原子认领 N 条，状态改成 <status>_LEASED 并写租约，
+  消费者崩溃后租约到期的信号由 reclaim_expired() 放回原状态，不会丢；
+  还在处理 / 排队的信号由持有者 extend_lease() 续租，不会被放回后重复认领
+- peek(status, n)：只读取（多个消费者共享同一状态时用，比如 WAIT_SIMU）
+- ack / ack_many：走 BatchWriter 批量落库，替代每条一次 connect + commit
+
+priority / promotion_level 为 NULL 的老数据在 ensure_queue_schema 里一次性补默认值，
+排序直接用列本身才能命中索引。
+"""
+import os
+import json
+import time
+import sqlite3
+import datetime
+
+from utils.config import SIGNAL_POOL_DB
+from utils.db_upgrade import ensure_table_fields
+from utils.db_writer import get_writer, connect_tuned
+
+LEASE_SEC = int(os.environ.get("SIGNAL_LEASE_SEC", "60"))
+LEASED_SUFFIX = "_LEASED"
+
+QUEUE_FIELDS = {
+    "interval": "TEXT",
+    "period": "TEXT",
+    "priority": "INTEGER DEFAULT 3",
+    "promotion_level": "INTEGER DEFAULT 0",
+    "expire_ts": "INTEGER DEFAULT 0",
+    "meta": "TEXT",
+    "lease_owner": "TEXT",
+    "lease_until": "INTEGER DEFAULT 0",
+    "created_ms": "INTEGER",
+}
+
+QUEUE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_signals_claim ON signals(status, priority, promotion_level DESC, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_signals_status_ts ON signals(status, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_signals_dedupe ON signals(instId, period, signal_type, ts)",
+)
+
+SIGNAL_COLS = ("id, instId, COALESCE(period, interval), ts, close, vol, signal_type, meta, "
+               "priority, promotion_level, expire_ts, created_ms")
+
+PERIOD_SECONDS = {"1m": 60, "3m": 180, "5m": 300, "15m": 900, "1H": 3600, "4H": 14400, "1D": 86400}
+
+_READY = set()
+
+
+def ensure_queue_schema(db_path=SIGNAL_POOL_DB):
+    """补字段 + 建索引 + 回填 NULL 排序列；每个进程每个库只做一次"""
+    key = os.path.abspath(str(db_path))
+    if key in _READY:
+        return
+    conn = sqlite3.connect(str(db_path))
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='signals'").fetchone()
+    conn.close()
+    if not exists:
+        return
+    ensure_table_fields(str(db_path), "signals", QUEUE_FIELDS)
+    conn = connect_tuned(db_path)
+    try:
+        for sql in QUEUE_INDEXES:
+            conn.execute(sql)
+        conn.execute("UPDATE signals SET priority=3 WHERE priority IS NULL")
+        conn.execute("UPDATE signals SET promotion_level=0 WHERE promotion_level IS NULL")
+        conn.commit()
+    finally:
+        conn.close()
+    _READY.add(key)
+
+
+def _row_to_signal(r):
+    sid, inst, period, ts, close, vol, sigtype, meta, pri, promo, exp, created_ms = r
+    try:
+        m = json.loads(meta) if meta else {}
+    except Exception:
+        m = {}
+    return {
+        "id": sid, "instId": inst, "period": period or "", "interval": period or "",
+        "ts": int(ts or 0), "price": float(close or 0), "close": close, "vol": float(vol or 0),
+        "signal_type": sigtype or "", "meta": m,
+        "priority": 3 if pri is None else pri, "promotion_level": promo or 0, "expire_ts": exp or 0,
+        "created_ms": created_ms,
+    }
+
+
+def signal_lag_ms(sig, now=None):
+    """返回 {"close": K线收盘→now, "insert": 入库→now}（毫秒）；算不出来的阶段不返回"""
+    now = time.time() if now is None else now
+    lag = {}
+    ts, bar = int(sig.get("ts") or 0), PERIOD_SECONDS.get(sig.get("period") or "")
+    if ts > 10 ** 12:
+        ts //= 1000
+    if ts and bar:
+        close_ms = (now - ts - bar) * 1000
+        if close_ms >= 0:   # 手工/测试信号的 ts 是当前时间，没有收盘时刻
+            lag["close"] = close_ms
+    if sig.get("created_ms"):
+        lag["insert"] = now * 1000 - sig["created_ms"]
+    return lag
+
+
+def _sort_key(s):
+    return (s["priority"], -s["promotion_level"], s["ts"])
+
+
+def peek(status, limit=200, db_path=SIGNAL_POOL_DB, order="priority", skip_expired=True):
+    """只读取待处理信号；order="ts" 时按时间先后（走 (status, ts) 索引），
+    skip_expired=False 时连 expire_ts 已过的一起返回（交给调用方标记 EXPIRED）"""
+    ensure_queue_schema(db_path)
+    order_sql = "ts ASC" if order == "ts" else "priority ASC, promotion_level DESC, ts ASC"
+    now = int(time.time()) if skip_expired else 0
+    conn = connect_tuned(db_path, readonly=True)
+    try:
+        rows = conn.execute(f"""
+            SELECT {SIGNAL_COLS} FROM signals
+            WHERE status=? AND (expire_ts IS NULL OR expire_ts=0 OR expire_ts > ?)
+            ORDER BY {order_sql} LIMIT ?
+        """, (status, now, int(limit))).fetchall()
+    finally:
+        conn.close()
+    return [_row_to_signal(r) for r in rows]
+
+
+def claim(status, n=50, owner=None, lease_sec=LEASE_SEC, db_path=SIGNAL_POOL_DB):
+    """原子认领最多 n 条信号（按 priority / promotion_level / ts 排序返回），每条带 lease_until"""
+    ensure_queue_schema(db_path)
+    now = int(time.time())
+    owner = owner or f"{os.getpid()}"
+    conn = connect_tuned(db_path)
+    try:
+        rows = conn.execute(f"""
+            UPDATE signals SET status=?, lease_owner=?, lease_until=?
+            WHERE id IN (
+                SELECT id FROM signals
+                WHERE status=? AND (expire_ts IS NULL OR expire_ts=0 OR expire_ts > ?)
+                ORDER BY priority ASC, promotion_level DESC, ts ASC
+                LIMIT ?
+            )
+            RETURNING {SIGNAL_COLS}
+        """, (status + LEASED_SUFFIX, owner, now + int(lease_sec), status, now, int(n))).fetchall()
+        conn.commit()
+    finally:
+        conn.close()
+    sigs = sorted((_row_to_signal(r) for r in rows), key=_sort_key)
+    for s in sigs:
+        s["lease_until"] = now + int(lease_sec)
+    return sigs
+
+
+def extend_lease(ids, owner=None, lease_sec=LEASE_SEC, db_path=SIGNAL_POOL_DB, wait=False):
+    """续租；给 owner 时只续自己持有的租约（已被别人重新认领的不动）"""
+    until = int(time.time()) + int(lease_sec)
+    w = get_writer(db_path)
+    if owner is None:
+        w.submit("UPDATE signals SET lease_until=? WHERE id=? AND lease_until>0", [(until, i) for i in ids])
+    else:
+        w.submit("UPDATE signals SET lease_until=? WHERE id=? AND lease_owner=? AND lease_until>0",
+                 [(until, i, owner) for i in ids])
+    if wait:
+        w.flush()
+
+
+def reclaim_expired(status, db_path=SIGNAL_POOL_DB):
+    """把租约到期（消费者崩溃/卡死）的信号放回 status，返回条数"""
+    ensure_queue_schema(db_path)
+    conn = connect_tuned(db_path)
+    try:
+        cur = conn.execute("""
+            UPDATE signals SET status=?, lease_owner=NULL, lease_until=0
+            WHERE status=? AND lease_until < ?
+        """, (status, status + LEASED_SUFFIX, int(time.time())))
+        conn.commit()
+        return cur.rowcount
+    finally:
+        conn.close()
+
+
+def ack(sid, status="DONE", db_path=SIGNAL_POOL_DB):
+    ack_many([(sid, status)], db_path=db_path)
+
+
+def ack_many(items, db_path=SIGNAL_POOL_DB, wait=False, owner=None):
+    """items: [(id, status)]；批量写线程合并提交，wait=True 时阻塞到落盘；
+    给 owner 时只改仍由自己持有租约的行（租约已失效、可能被别人重新认领的不动）"""
+    now = datetime.datetime.utcnow().isoformat()
+    w = get_writer(db_path)
+    sql = "UPDATE signals SET status=?, detected_at=?, lease_owner=NULL, lease_until=0 WHERE id=?"
+    if owner is None:
+        w.submit(sql, [(st, now, sid) for sid, st in items])
+    else:
+        w.submit(sql + " AND lease_owner=?", [(st, now, sid, owner) for sid, st in items])
+    if wait:
+        w.flush()
+
+
+def flush_acks(db_path=SIGNAL_POOL_DB):
+    """阻塞到此前的 ack 全部落盘"""
+    get_writer(db_path).flush()